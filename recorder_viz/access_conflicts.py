@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+# encoding: utf-8
+import numpy as np
+
+"""
+Overlapping and conflicting accesses of one file.
+
+    Two intervals overlap if their byte ranges [offset, offset+count)
+    intersect. An overlapping pair is a conflict if the intervals share
+    a segment, i.e., the local segment of one of them is among the
+    segments seen by the other. The pair is ordered by tstart and
+    classified by the access types (RAR, RAW, WAW, WAR) and by whether
+    both accesses come from the same rank.
+
+    Pairs are found with a sweep over the intervals sorted by offset:
+    interval a overlaps every later interval b whose offset is below
+    the end of a, so a binary search gives the overlapping range of
+    each interval. The pairs are then enumerated in fixed-size chunks,
+    the cost is O(n log n + number of overlapping pairs) and the memory
+    is bounded by the chunk size, not by the number of pairs.
+"""
+
+KINDS = ("RAR", "RAW", "WAW", "WAR")
+
+# first access is a read/write (row), second is a read/write (column)
+_KIND_OF = np.array([[KINDS.index("RAR"), KINDS.index("WAR")],
+                     [KINDS.index("RAW"), KINDS.index("WAW")]], dtype=np.int8)
+
+conflict_dtype = np.dtype([
+    ("first",       np.int64),      # index of the earlier access in the FileIntervals
+    ("second",      np.int64),      # index of the later access
+    ("kind",        np.int8),       # index into KINDS
+    ("same_rank",   np.bool_),
+    ("start",       np.int64),      # overlapping byte range [start, end)
+    ("end",         np.int64),
+])
+
+
+# All pairs (a, b), a < b, of offset-sorted intervals that overlap,
+# yielded as index arrays of at most chunk_size pairs
+def overlapping_pairs(offset, end, chunk_size=1<<22):
+    n = len(offset)
+    if n < 2:
+        return
+    a_index = np.arange(n)
+    # later intervals starting before the end of a overlap with a
+    num_after = np.searchsorted(offset, end, side='left') - a_index - 1
+    np.maximum(num_after, 0, out=num_after)
+    last = np.cumsum(num_after)             # pairs of a are numbered [last[a]-num_after[a], last[a])
+    total = int(last[-1])
+
+    for lo in range(0, total, chunk_size):
+        k = np.arange(lo, min(lo+chunk_size, total))
+        a = np.searchsorted(last, k, side='right')
+        b = a + 1 + (k - (last[a] - num_after[a]))
+        yield a, b
+
+
+# Conflicting pairs of one FileIntervals, yielded in chunks of conflict_dtype arrays
+def iter_conflicts(intervals, chunk_size=1<<22):
+    data = intervals.data
+    # Zero-byte accesses and accesses outside any segment can not conflict
+    candidates = np.flatnonzero((data["count"] > 0) & (intervals.segment_count > 0))
+    candidates = candidates[np.argsort(data["offset"][candidates], kind='stable')]
+    offset = data["offset"][candidates]
+    end = offset + data["count"][candidates]
+    slices = intervals.segment_start[candidates]
+
+    # Whether two segment lists share a segment only depends on the lists,
+    # which are shared between intervals, so check each pair of lists once
+    unique_slices, first_use = np.unique(slices, return_index=True)
+    slice_count = dict(zip(unique_slices.tolist(), intervals.segment_count[candidates[first_use]].tolist()))
+    def segments_at(start):
+        return intervals.segment_ids[start:start+slice_count[start]].tolist()
+
+    shared = {}
+    def share_segment(slice1, slice2):
+        key = (slice1, slice2) if slice1 <= slice2 else (slice2, slice1)
+        if key not in shared:
+            segments1, segments2 = segments_at(key[0]), segments_at(key[1])
+            shared[key] = segments1[0] in segments2 or segments2[0] in segments1
+        return shared[key]
+
+    for a, b in overlapping_pairs(offset, end, chunk_size):
+        pair_slices = np.stack([slices[a], slices[b]], axis=1)
+        slice_pairs, inverse = np.unique(pair_slices, axis=0, return_inverse=True)
+        conflicting = np.array([share_segment(s1, s2) for s1, s2 in slice_pairs.tolist()], dtype=bool)
+        keep = conflicting[inverse.ravel()]
+        a, b = a[keep], b[keep]
+        if len(a) == 0:
+            continue
+
+        # order the pair by tstart
+        first, second = candidates[a], candidates[b]
+        swap = ~(data["tstart"][first] < data["tstart"][second])
+        first, second = np.where(swap, second, first), np.where(swap, first, second)
+
+        conflicts = np.empty(len(a), dtype=conflict_dtype)
+        conflicts["first"], conflicts["second"] = first, second
+        conflicts["kind"] = _KIND_OF[(~data["is_read"][first]).astype(np.int8), (~data["is_read"][second]).astype(np.int8)]
+        conflicts["same_rank"] = data["rank"][first] == data["rank"][second]
+        conflicts["start"] = np.maximum(offset[a], offset[b])
+        conflicts["end"] = np.minimum(end[a], end[b])
+        yield conflicts
+
+
+# Union of byte ranges, returned as sorted, disjoint (starts, ends)
+def merge_ranges(starts, ends):
+    if len(starts) == 0:
+        return starts, ends
+    order = np.lexsort((ends, starts))
+    starts, ends = starts[order], ends[order]
+    reach = np.maximum.accumulate(ends)
+    # a new range begins where the start is past everything before it
+    begin = np.ones(len(starts), dtype=bool)
+    begin[1:] = starts[1:] > reach[:-1]
+    first = np.flatnonzero(begin)
+    last = np.append(first[1:], len(starts)) - 1
+    return starts[first], reach[last]
+
+
+'''
+Counts and byte ranges of the conflicts of one file.
+    counts[kind]['S'|'D']:  number of pairs, same rank or different ranks
+    ranges[kind]:           (starts, ends) union of the overlapping byte ranges
+'''
+class ConflictSummary():
+    def __init__(self):
+        self.counts = dict((kind, {'S':0, 'D':0}) for kind in KINDS)
+        empty = np.zeros(0, dtype=np.int64)
+        self.ranges = dict((kind, (empty, empty)) for kind in KINDS)
+
+    def add(self, conflicts):
+        for k, kind in enumerate(KINDS):
+            selected = conflicts[conflicts["kind"] == k]
+            same = int(selected["same_rank"].sum())
+            self.counts[kind]['S'] += same
+            self.counts[kind]['D'] += len(selected) - same
+            starts, ends = self.ranges[kind]
+            self.ranges[kind] = merge_ranges(np.concatenate([starts, selected["start"]]),
+                                             np.concatenate([ends, selected["end"]]))
+
+    # Bytes covered by the given kinds, each byte counted once
+    def bytes(self, kinds=("RAW", "WAW", "WAR")):
+        starts, ends = merge_ranges(np.concatenate([self.ranges[kind][0] for kind in kinds]),
+                                    np.concatenate([self.ranges[kind][1] for kind in kinds]))
+        return int((ends - starts).sum())
+
+
+def summarize_conflicts(intervals, chunk_size=1<<22):
+    summary = ConflictSummary()
+    for conflicts in iter_conflicts(intervals, chunk_size):
+        summary.add(conflicts)
+    return summary
@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+# encoding: utf-8
+from collections import OrderedDict
+import numpy as np
+from .func_stats import group_by_function
+
+"""
+Single-pass accumulators over the trace records.
+
+    accumulate() visits the columns of each rank once and hands the same
+    RankBatch to every accumulator, so the category lookups and masks
+    shared by several analyses are computed once per rank. LocalMetadata
+    and the offset interval replay are not part of this pass: they keep
+    their own loops, the replay needs the record arguments in global
+    time order.
+
+    An accumulator is a class with a unique name, built with the reader,
+    that gets add(batch) for each rank and returns its result with result().
+    Other packages can add their own with the register_accumulator decorator:
+
+        @register_accumulator
+        class LargeWrites(Accumulator):
+            name = "large_writes"
+            def __init__(self, reader):
+                self.count = 0
+            def add(self, batch):
+                self.count += int(np.sum(batch.mask("is_write") & (batch.duration() > 1)))
+            def result(self):
+                return self.count
+"""
+
+_accumulators = OrderedDict()
+
+
+def register_accumulator(cls):
+    if not cls.name:
+        raise ValueError("accumulator %s has no name" %(cls.__name__))
+    _accumulators[cls.name] = cls
+    return cls
+
+
+def registered_accumulators():
+    return list(_accumulators.keys())
+
+
+'''
+The columns of one rank, with the per-record lookups shared by the accumulators.
+    mask(name) is one of the boolean arrays of FunctionCategories (is_read, is_write,
+    is_file_meta, ...) applied to the records, computed on first use.
+'''
+class RankBatch():
+    def __init__(self, rank, columns, categories):
+        self.rank = rank
+        self.columns = columns
+        self.categories = categories
+        self.func_index = categories.index(columns.func_id)
+        self.masks = {}
+        self.durations = None
+
+    def mask(self, name):
+        if name not in self.masks:
+            self.masks[name] = getattr(self.categories, name)[self.func_index]
+        return self.masks[name]
+
+    def duration(self):
+        if self.durations is None:
+            self.durations = self.columns.tend - self.columns.tstart
+        return self.durations
+
+
+class Accumulator():
+    name = None
+
+    def __init__(self, reader):
+        self.reader = reader
+
+    def add(self, batch):
+        pass
+
+    def result(self):
+        return None
+
+
+# Number of calls of each function, entry i is for reader.funcs[i]
+@register_accumulator
+class FunctionCounts(Accumulator):
+    name = "function_counts"
+
+    def __init__(self, reader):
+        self.totals = np.zeros(len(reader.funcs), dtype=np.int64)
+
+    def add(self, batch):
+        self.totals += group_by_function(batch.columns.func_id, len(self.totals))[0].astype(np.int64)
+
+    def result(self):
+        return self.totals
+
+
+# Time spent in each function, entry i is for reader.funcs[i]
+@register_accumulator
+class FunctionTimes(Accumulator):
+    name = "function_times"
+
+    def __init__(self, reader):
+        self.totals = np.zeros(len(reader.funcs))
+
+    def add(self, batch):
+        self.totals += group_by_function(batch.columns.func_id, len(self.totals), batch.duration())[0]
+
+    def result(self):
+        return self.totals
+
+
+# Time of the POSIX open/close/sync/seek calls on each file, indexed by file ID
+@register_accumulator
+class MetadataTimes(Accumulator):
+    name = "metadata_times"
+
+    def __init__(self, reader):
+        self.reader = reader
+        self.totals = np.zeros(len(reader.files))
+
+    def add(self, batch):
+        on_file = batch.mask("is_file_meta") & (batch.columns.file_id >= 0)
+        # a lazy reader interns the files of a rank when its columns are loaded
+        times = np.bincount(batch.columns.file_id[on_file], weights=batch.duration()[on_file],
+                            minlength=len(self.reader.files))
+        times[:len(self.totals)] += self.totals
+        self.totals = times
+
+    def result(self):
+        return self.totals
+
+
+# Start and end times of the read and write calls of each rank:
+# {rank: ((read tstart, read tend), (write tstart, write tend))}
+@register_accumulator
+class ActivitySpans(Accumulator):
+    name = "activity_spans"
+
+    def __init__(self, reader):
+        self.spans = {}
+
+    def add(self, batch):
+        tstart, tend = batch.columns.tstart, batch.columns.tend
+        self.spans[batch.rank] = tuple([(tstart[mask], tend[mask])
+                                        for mask in (batch.mask("is_read"), batch.mask("is_write"))])
+
+    def result(self):
+        return self.spans
+
+
+# One pass over the loaded ranks feeding the given accumulators (default: all registered)
+# Returns {name: result}
+def accumulate(reader, names=None):
+    if names is None:
+        names = registered_accumulators()
+    for name in names:
+        if name not in _accumulators:
+            raise ValueError("unknown accumulator %s, registered: %s" %(name, ", ".join(registered_accumulators())))
+    accumulators = [_accumulators[name](reader) for name in names]
+
+    for rank in reader.ranks:
+        built = reader.columns.is_built(rank)
+        batch = RankBatch(rank, reader.columns[rank], reader.categories)
+        for accumulator in accumulators:
+            accumulator.add(batch)
+        if not built: reader.columns.release(rank)
+
+    return OrderedDict([(name, accumulator.result()) for name, accumulator in zip(names, accumulators)])
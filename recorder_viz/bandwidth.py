@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# encoding: utf-8
+import numpy as np
+from .interval_arrays import as_interval_arrays
+from .binning import spread_over_bins
+
+"""
+Windowed read/write throughput.
+
+    The bytes of every read/write interval are spread over the time
+    windows it spans, in proportion to the overlap, and divided by the
+    window length, giving bytes per second per window. Per-file and
+    per-rank timelines are one weighted bincount over all intervals.
+"""
+
+
+'''
+Read and write bandwidth (bytes/s) of each key over time windows.
+    keys:           filenames (by="file"), ranks (by="rank") or ["job"] (by=None)
+    edges:          window boundaries, len(edges) = number of windows + 1
+    read, write:    (len(keys), number of windows) arrays in bytes/s
+'''
+class BandwidthTimeline():
+    def __init__(self, keys, edges, read, write):
+        self.keys = keys
+        self.edges = edges
+        self.read = read
+        self.write = write
+
+    # Window centers, for plotting
+    def times(self):
+        return (self.edges[:-1] + self.edges[1:]) / 2
+
+    def total(self):
+        return self.read + self.write
+
+
+# intervals: {filename: FileIntervals or interval list}, as from build_offset_intervals()
+# window: window length in seconds, or num_windows windows over [t0, t1]
+# t0, t1: time range, default from the first start to the last end of the intervals
+# by: "file", "rank" or None for the whole job
+def bandwidth_timeline(intervals, window=None, num_windows=200, by=None, t0=None, t1=None):
+    if by not in (None, "file", "rank"):
+        raise ValueError("by must be None, 'file' or 'rank', not %s" %(by))
+    intervals = as_interval_arrays(intervals)
+    filenames = [filename for filename in intervals if len(intervals[filename]) > 0]
+    data = np.concatenate([intervals[filename].data for filename in filenames]) if filenames else None
+
+    if data is None or len(data) == 0:
+        keys = ["job"] if by is None else []
+        edges = np.zeros(1) if t0 is None else np.array([t0])
+        return BandwidthTimeline(keys, edges, np.zeros((len(keys), 0)), np.zeros((len(keys), 0)))
+
+    if t0 is None: t0 = float(data["tstart"].min())
+    if t1 is None: t1 = float(data["tend"].max())
+    if window is not None:
+        num_windows = max(1, int(np.ceil((t1 - t0) / window)))
+        t1 = t0 + num_windows * window
+    edges = np.linspace(t0, t1, num_windows + 1)
+    width = (t1 - t0) / num_windows if t1 > t0 else 1.0
+
+    if by == "file":
+        keys = filenames
+        rows = np.repeat(np.arange(len(filenames)), [len(intervals[filename]) for filename in filenames])
+    elif by == "rank":
+        keys, rows = np.unique(data["rank"], return_inverse=True)
+        keys = keys.tolist()
+    else:
+        keys, rows = ["job"], np.zeros(len(data), dtype=np.int64)
+    rows = rows.ravel()
+
+    timelines = []
+    for mask in (data["is_read"], ~data["is_read"]):
+        timelines.append(spread_over_bins(data["tstart"][mask], data["tend"][mask], rows[mask], len(keys),
+                                          t0, t1, num_windows, data["count"][mask].astype(np.float64)) / width)
+    return BandwidthTimeline(keys, edges, timelines[0], timelines[1])
+
+
+# Peaks of a bandwidth curve: windows that are higher than their neighbours
+# (the first window of a plateau) and at least min_height,
+# default the mean plus two standard deviations of the curve.
+# Returns the indexes of the peak windows, highest first
+def find_peaks(curve, min_height=None):
+    curve = np.asarray(curve, dtype=np.float64)
+    if len(curve) == 0:
+        return np.zeros(0, dtype=np.int64)
+    if min_height is None:
+        min_height = curve.mean() + 2 * curve.std()
+    # compare runs of equal values, so a plateau counts as one peak
+    starts = np.concatenate([[0], np.flatnonzero(np.diff(curve) != 0) + 1])
+    values = np.concatenate([[-np.inf], curve[starts], [-np.inf]])
+    higher = (values[1:-1] > values[:-2]) & (values[1:-1] > values[2:])
+    peaks = starts[higher & (values[1:-1] >= min_height) & (values[1:-1] > 0)]
+    return peaks[np.argsort(-curve[peaks], kind='stable')]
@@ -0,0 +1,273 @@
+#!/usr/bin/env python
+# encoding: utf-8
+import os, sys, glob, time, traceback
+import multiprocessing
+from multiprocessing.connection import wait
+from html import escape
+import numpy as np
+from .creader_wrapper import RecorderReader
+from .reporter import generate_report, BINNED_RESOLUTION
+from .html_writer import css_style
+from .parallel_loader import can_fork
+from .profiling import resource_usage
+from .interval_arrays import as_interval_arrays
+from .build_offset_intervals import ignore_files
+
+"""
+Reports for many trace directories.
+
+    Each trace is reported by its own forked process, so the memory of a
+    trace is returned to the system when its report is written. At most
+    `workers` traces are processed at once, and a trace is only started if
+    the estimated memory of the running ones plus its own fits in the
+    budget (one trace always runs, however large). The estimate is the size
+    of the trace directory times the largest memory per trace byte seen so
+    far, starting from MEMORY_PER_TRACE_BYTE.
+
+    Besides one report and one log (its output and, if it failed, the
+    traceback) per trace, index.html compares the runs: records, bytes,
+    bandwidth, metadata time and the time and memory of each report. The
+    metrics only come from what the report computed, so the bytes and
+    bandwidth need the offset intervals and the metadata time needs the
+    accumulators; they show as "-" when the sections left those out.
+"""
+
+MEMORY_BASE = 200 * 1024 * 1024          # bytes of a worker before it loads a trace (python, numpy, bokeh)
+MEMORY_PER_TRACE_BYTE = 20              # initial estimate of the memory per byte of trace files
+
+
+# Trace directories (containing recorder.mt) given as directories, glob
+# patterns or text files listing one of those per line. Sorted, without duplicates.
+def expand_traces(inputs):
+    traces = []
+    for pattern in inputs:
+        if os.path.isfile(pattern) and not pattern.endswith("recorder.mt"):
+            with open(pattern) as f:
+                traces += expand_traces([line.strip() for line in f if line.strip()])
+            continue
+        for path in sorted(glob.glob(pattern)) or [pattern]:
+            if os.path.isfile(os.path.join(path, "recorder.mt")):
+                traces.append(os.path.abspath(path))
+            else:
+                print("Skipping %s, not a Recorder trace directory" %(path))
+    return sorted(set(traces))
+
+
+def trace_size(trace_dir):
+    return sum([os.path.getsize(path) for path in glob.glob(os.path.join(trace_dir, "*")) if os.path.isfile(path)])
+
+
+# One report name per trace: the directory name, numbered if several traces share it
+def report_names(traces):
+    names, used = [], {}
+    for trace_dir in traces:
+        name = os.path.basename(os.path.normpath(trace_dir)) or "trace"
+        used[name] = used.get(name, 0) + 1
+        names.append(name if used[name] == 1 else "%s-%d" %(name, used[name]))
+    return names
+
+
+# Metrics compared on the index page, from the data the report was built on.
+# intervals or stats None (not built by the report) leaves their metrics out
+def trace_metrics(reader, intervals=None, stats=None):
+    metrics = {"ranks": reader.GM.total_ranks, "records": int(sum([reader.counts[rank] for rank in reader.ranks]))}
+    if stats is not None and "metadata_times" in stats:
+        metrics["metadata_time"] = float(np.sum(stats["metadata_times"]))
+    if intervals is None:
+        return metrics
+
+    metrics.update({"files": 0, "bytes_written": 0, "bytes_read": 0, "write_bandwidth": 0.0, "read_bandwidth": 0.0})
+    intervals = as_interval_arrays(intervals)
+    data = [intervals[filename].data for filename in intervals if not ignore_files(filename)]
+    metrics["files"] = len(data)
+    if data:
+        data = np.concatenate(data)
+        for key, mask in (("written", ~data["is_read"]), ("read", data["is_read"])):
+            if not np.any(mask): continue
+            total = int(data["count"][mask].sum())
+            elapsed = float(data["tend"][mask].max() - data["tstart"][mask].min())
+            metrics["bytes_" + key] = total
+            # over the phase from the first to the last call
+            if elapsed > 0:
+                metrics[("write" if key == "written" else "read") + "_bandwidth"] = total / elapsed / (1024*1024)
+    return metrics
+
+
+# Runs in the worker process: writes the report of one trace and returns its metrics
+def report_trace(trace_dir, output_path, options):
+    start = time.time()
+    reader = RecorderReader(trace_dir, workers=options.get("jobs", 1), cache=options.get("cache", False))
+    data = {}
+    generate_report(reader, output_path, workers=options.get("jobs", 1), binned=options.get("binned"),
+                    resolution=options.get("resolution", BINNED_RESOLUTION), sections=options.get("sections"),
+                    skip=options.get("skip"), resources=options.get("resources", "cdn"),
+                    single_precision=options.get("single_precision", False), profile_json=options.get("profile_json"), data=data)
+    metrics = trace_metrics(reader, data.get("intervals"), data.get("stats"))
+    metrics["report_time"] = time.time() - start
+    metrics["peak_rss"] = resource_usage()[1]
+    return metrics
+
+
+# Reports one trace with its output and, on failure, the traceback written to log_path.
+# Returns ("ok", metrics) or ("error", last line of the error)
+def logged_report(trace_dir, output_path, log_path, options):
+    stdout = sys.stdout
+    log = open(log_path, "w")
+    sys.stdout = log
+    try:
+        result = ("ok", report_trace(trace_dir, output_path, options))
+    except SystemExit as e:
+        result = ("error", "exited with %s" %(e.code))
+    except Exception:
+        log.write(traceback.format_exc())
+        result = ("error", traceback.format_exc().strip().splitlines()[-1])
+    finally:
+        sys.stdout = stdout
+        log.close()
+    return result
+
+
+def _run_trace(connection, trace_dir, output_path, log_path, options):
+    connection.send(logged_report(trace_dir, output_path, log_path, options))
+    connection.close()
+
+
+'''
+Result of one trace.
+    status:     "ok" or "error"
+    metrics:    dict of trace_metrics() plus report_time (s) and peak_rss (MiB), None on error
+    error:      last line of the error message, None if ok
+    log:        path of the output of the report, with the full traceback on error
+'''
+class TraceResult():
+    def __init__(self, trace_dir, name, status, metrics=None, error=None, log=None):
+        self.trace_dir = trace_dir
+        self.name = name
+        self.status = status
+        self.metrics = metrics
+        self.error = error
+        self.log = log
+
+
+# traces: trace directories, see expand_traces()
+# output_dir: gets <name>.html and <name>.log for each trace and index.html
+# workers: traces reported at once, memory_budget: bytes for all of them (None for no limit)
+# options: keyword arguments of the reports: jobs (processes within a report), cache, binned,
+#          resolution, sections, skip, resources, single_precision, profile_json.
+#          A cache directory (cache="path") gets one subdirectory per trace, named as its report
+# Returns the TraceResults in the order of traces
+def batch_report(traces, output_dir, workers=1, memory_budget=None, options=None):
+    options = options or {}
+    if not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+
+    names = report_names(traces)
+    paths = [os.path.join(os.path.abspath(output_dir), name + ".html") for name in names]
+    logs = [os.path.join(os.path.abspath(output_dir), name + ".log") for name in names]
+    sizes = [trace_size(trace_dir) for trace_dir in traces]
+    results = [None] * len(traces)
+    per_byte = [MEMORY_PER_TRACE_BYTE]
+
+    # every trace has its own signature, so sharing one cache directory would
+    # overwrite it at each trace (and break concurrent writes of its .tmp directory)
+    def trace_options(i):
+        if isinstance(options.get("cache"), str):
+            return dict(options, cache=os.path.join(options["cache"], names[i]))
+        return options
+
+    def estimate(i):
+        return MEMORY_BASE + sizes[i] * per_byte[0]
+
+    def finished(i, status, value):
+        if status == "ok":
+            results[i] = TraceResult(traces[i], names[i], status, metrics=value, log=logs[i])
+            if value["peak_rss"] and sizes[i] > 0:
+                per_byte[0] = max(per_byte[0], (value["peak_rss"] * 1024 * 1024 - MEMORY_BASE) / sizes[i])
+            print("[%d/%d] %s: %s (%.1f s)" %(sum([r is not None for r in results]), len(traces), traces[i],
+                                              paths[i], value["report_time"]))
+        else:
+            results[i] = TraceResult(traces[i], names[i], status, error=value, log=logs[i])
+            print("[%d/%d] %s: failed, %s (see %s)" %(sum([r is not None for r in results]), len(traces), traces[i],
+                                                     value, logs[i]))
+        sys.stdout.flush()
+
+    if not can_fork():
+        for i in range(len(traces)):
+            finished(i, *logged_report(traces[i], paths[i], logs[i], trace_options(i)))
+        write_index(results, paths, os.path.join(output_dir, "index.html"))
+        return results
+
+    context = multiprocessing.get_context("fork")
+    pending = list(range(len(traces)))
+    running = {}        # connection -> (trace index, process, estimated bytes)
+    while pending or running:
+        used = sum([entry[2] for entry in running.values()])
+        while pending and len(running) < workers and \
+              (not running or memory_budget is None or used + estimate(pending[0]) <= memory_budget):
+            i = pending.pop(0)
+            receiver, sender = context.Pipe(duplex=False)
+            process = context.Process(target=_run_trace, args=(sender, traces[i], paths[i], logs[i], trace_options(i)))
+            process.start()
+            sender.close()
+            running[receiver] = (i, process, estimate(i))
+            used += estimate(i)
+
+        for receiver in wait(list(running.keys())):
+            i, process, _ = running.pop(receiver)
+            try:
+                status, value = receiver.recv()
+            except EOFError:    # killed, e.g., by the OOM killer
+                status, value = "error", "worker died"
+            receiver.close()
+            process.join()
+            if status == "error" and process.exitcode:
+                value = "%s (exit code %d)" %(value, process.exitcode)
+            finished(i, status, value)
+
+    write_index(results, paths, os.path.join(output_dir, "index.html"))
+    return results
+
+
+def write_index(results, paths, index_path):
+    columns = [("ranks", "Ranks", "%d"), ("records", "Records", "%d"), ("files", "Files", "%d"),
+               ("bytes_written", "Bytes written", "%d"), ("bytes_read", "Bytes read", "%d"),
+               ("write_bandwidth", "Write bandwidth (MB/s)", "%.2f"), ("read_bandwidth", "Read bandwidth (MB/s)", "%.2f"),
+               ("metadata_time", "Metadata time (s)", "%.3f"), ("report_time", "Report time (s)", "%.1f"),
+               ("peak_rss", "Report memory (MiB)", "%.0f")]
+
+    def link(path):
+        return os.path.relpath(path, os.path.dirname(index_path))
+
+    rows = []
+    for result, path in zip(results, paths):
+        log = ' (<a href="%s">log</a>)' %(link(result.log)) if result.log and os.path.isfile(result.log) else ""
+        cells = ['<td><a href="%s">%s</a>%s<br><small>%s</small></td>' %(link(path), escape(result.name), log,
+                                                                       escape(result.trace_dir))]
+        if result.status == "ok":
+            for key, heading, form in columns:
+                value = result.metrics.get(key)
+                cells.append("<td>%s</td>" %("-" if value is None else form %(value)))
+        else:
+            cells.append('<td colspan="%d">failed: %s</td>' %(len(columns), escape(result.error)))
+        rows.append("<tr>%s</tr>" %("".join(cells)))
+
+    html_content = """
+        <html>
+            <head>
+                %s
+                <meta charset="UTF-8">
+            </head>
+            <body><div class="content">
+                <h2> Recorder reports: %d traces, %d failed </h2>
+                <table>
+                    <tr><th>Trace</th>%s</tr>
+                    %s
+                </table>
+            </div></body>
+        </html>
+        """ %(css_style, len(results), sum([result.status != "ok" for result in results]),
+              "".join(["<th>%s</th>" %(heading) for key, heading, form in columns]), "\n".join(rows))
+
+    f = open(index_path, "w")
+    f.write(html_content)
+    f.close()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# encoding: utf-8
+import numpy as np
+
+"""
+Fixed-size binned images of the trace, for traces too large to draw call by call.
+
+    The matrices are computed with bincount over flat (row, bin) indexes,
+    so the cost is linear in the number of calls and the size of the
+    result only depends on the resolution.
+"""
+
+
+# Map values in [lo, hi] to bins 0..num_bins-1, as floats in bin units
+def to_bin_units(values, lo, hi, num_bins):
+    width = (hi - lo) / float(num_bins) if hi > lo else 1.0
+    return np.clip((values - lo) / width, 0, num_bins), width
+
+
+# Spread the calls [start, end) over the bins of each row: every call adds its
+# weight to the bins it spans, in proportion to the overlap (a zero-length call
+# adds all of it to its bin). Without weights, a call adds its length in bin units.
+# Returns a (num_rows, num_bins) matrix
+def spread_over_bins(starts, ends, rows, num_rows, lo, hi, num_bins, weights=None):
+    s, width = to_bin_units(starts, lo, hi, num_bins)
+    e, width = to_bin_units(ends, lo, hi, num_bins)
+    rows = rows.astype(np.int64)
+    first = np.minimum(s.astype(np.int64), num_bins-1)
+    last = np.minimum(e.astype(np.int64), num_bins-1)
+    size = num_rows * num_bins
+
+    # amount per bin unit of each call, the part outside [lo, hi] is dropped
+    if weights is None:
+        rate = np.ones(len(s))
+    else:
+        length = (ends - starts) / width
+        rate = np.divide(weights, length, out=np.zeros(len(s)), where=length > 0)
+
+    # calls within one bin
+    same = first == last
+    amount = (e[same]-s[same]) * rate[same]
+    if weights is not None:
+        point = same & (ends <= starts)
+        amount = np.where(point[same], weights[same], amount)
+    # (bincount of an empty array is an integer array even with weights)
+    spread = np.zeros(size)
+    spread += np.bincount(rows[same]*num_bins + first[same], weights=amount, minlength=size)
+
+    # calls spanning several bins: partial first and last bins ...
+    rows, first, last, s, e, rate = rows[~same], first[~same], last[~same], s[~same], e[~same], rate[~same]
+    spread += np.bincount(rows*num_bins + first, weights=(first+1-s)*rate, minlength=size)
+    spread += np.bincount(rows*num_bins + last, weights=(e-last)*rate, minlength=size)
+
+    # ... and full bins in between, as +rate/-rate steps summed along each row
+    steps = np.bincount(rows*(num_bins+1) + first+1, weights=rate, minlength=num_rows*(num_bins+1)) \
+          - np.bincount(rows*(num_bins+1) + last, weights=rate, minlength=num_rows*(num_bins+1))
+    full = np.cumsum(steps.reshape(num_rows, num_bins+1), axis=1)[:, :num_bins]
+
+    return spread.reshape(num_rows, num_bins) + full
+
+
+# Busy time of each (row, time bin): every call [start, end) adds the part
+# of its duration that falls into each bin it spans.
+# Returns a (num_rows, num_bins) matrix in seconds
+def busy_time(starts, ends, rows, num_rows, t0, t1, num_bins):
+    width = to_bin_units(starts[:0], t0, t1, num_bins)[1]
+    return spread_over_bins(starts, ends, rows, num_rows, t0, t1, num_bins) * width
+
+
+# Rows of num_rows buckets covering the ranks [rank_min, rank_max]
+def rank_buckets(ranks, rank_min, rank_max, num_rows):
+    return (np.asarray(ranks, dtype=np.int64) - rank_min) * num_rows // (rank_max - rank_min + 1)
+
+
+# One RGBA image of two [0, 1] intensity matrices: red for writes,
+# blue for reads, transparent where both are zero. The opacity follows
+# the larger of the two, any non-zero bin
+# gets at least min_alpha, so sparse activity stays visible.
+# Returns a uint32 array as expected by bokeh's image_rgba
+def rgba_image(write, read, min_alpha=0.25):
+    write, read = np.clip(write, 0, 1), np.clip(read, 0, 1)
+    both = np.maximum(write, read)
+    image = np.zeros(write.shape + (4,), dtype=np.uint8)
+    share = np.divide(write, write + read, out=np.zeros_like(write), where=both > 0)
+    image[..., 0] = np.round(255 * share)           # purple where both happen
+    image[..., 2] = np.round(255 * (1 - share) * (both > 0))
+    image[..., 3] = np.round(255 * np.where(both > 0, min_alpha + (1-min_alpha)*both, 0))
+    return image.view(np.uint32).reshape(write.shape)
+
+
+# Bytes of each (row, offset bin) covered by the ranges [offsets, offsets+counts),
+# the same sweep as busy_time, along the offset axis
+def byte_density(offsets, counts, rows, num_rows, lo, hi, num_bins):
+    starts = offsets.astype(np.float64)
+    return busy_time(starts, starts + counts, rows, num_rows, lo, hi, num_bins)
+
+
+# Log-scaled intensity in [0, 1], so a few hot bins do not hide the rest
+def log_scale(matrix):
+    top = matrix.max() if matrix.size else 0
+    return np.log1p(matrix) / np.log1p(top) if top > 0 else np.zeros_like(matrix, dtype=np.float64)
@@ -1,125 +1,165 @@
 #!/usr/bin/env python
 # encoding: utf-8
-def handle_data_operations(record, offsetBook, func_list, endOfFile):
-
-    def update_end_of_file(rank, filename, endOfFile, offsetBook):
-        if filename in endOfFile and filename in offsetBook:
-            endOfFile[filename][rank] = max(endOfFile[filename][rank], offsetBook[filename][rank])
-        elif filename not in endOfFile:
-            endOfFile[filename] = [0] * len(offsetBook[0])
-            endOfFile[filename][rank] = offsetBook[filename][rank]
+import heapq, multiprocessing
+from collections import OrderedDict
+import numpy as np
+from .parallel_loader import can_fork
+from .interval_arrays import IntervalBuilder
+from .func_categories import FunctionCategories, func_category
+from .func_categories import READ, WRITE, FPRINTF, OPEN, FOPEN, SEEK, CLOSE, SYNC, DIR, READLINK, \
+                             VECTOR, STREAM, POSITIONED, MPI, HDF5
+
+"""
+Segments of one file.
+
+    A segment is created when a rank opens the file, and closed when that
+    rank closes or syncs it. Closing also starts a new segment, with the
+    next ID, for every other rank that still has the file open.
+    Only open segments are kept, in creation order, indexed by rank,
+    so closing costs time proportional to the open segments and a data
+    operation between two changes is a dictionary lookup.
+"""
+class SegmentIndex():
+    def __init__(self):
+        self.lastID = -1                    # ID of the most recently created segment
+        self.numCreated = 0
+        self.openSegments = OrderedDict()   # creation number -> (rank, segment-id), open segments only
+        self.openByRank = {}                # rank -> creation numbers of its open segments, increasing
+        self.segmentsCache = {}             # rank -> segments(rank), valid until the next change
+
+    def create(self, rank, segmentID):
+        self.openSegments[self.numCreated] = (rank, segmentID)
+        self.openByRank.setdefault(rank, []).append(self.numCreated)
+        self.numCreated += 1
+        self.lastID = segmentID
+        self.segmentsCache = {}
+
+    def close(self, rank):
+        # 1. Close all segments on the local process for this file
+        for n in self.openByRank.pop(rank, []):
+            del self.openSegments[n]
+        self.segmentsCache = {}
+        # 2. And starts a new segment for all other processes have the same file opened,
+        # following the most recent open segment of each of them, most recent first
+        # Skip this step for session semantics
+        latest = sorted([numbers[-1] for numbers in self.openByRank.values() if numbers], reverse=True)
+        for n in latest:
+            otherRank, segmentID = self.openSegments[n]
+            self.create(otherRank, segmentID+1)
+
+    # Open segments seen by a data operation of rank:
+    # its own ones first (most recent first), then the ones of the other ranks in creation order
+    def segments(self, rank):
+        if rank not in self.segmentsCache:
+            local = [self.openSegments[n][1] for n in reversed(self.openByRank.get(rank, []))]
+            remote = [segmentID for (r, segmentID) in self.openSegments.values() if r != rank]
+            self.segmentsCache[rank] = local + remote
+        return self.segmentsCache[rank]
+
+
+# All books are keyed by the file ID (index into reader.files) of the record,
+# args are the record's arguments already decoded by args_to_strs()
+def handle_data_operations(record, args, offsetBook, categories, endOfFile):
+
+    def update_end_of_file(rank, fileID, endOfFile, offsetBook):
+        if fileID in endOfFile and fileID in offsetBook:
+            endOfFile[fileID][rank] = max(endOfFile[fileID][rank], offsetBook[fileID][rank])
+        elif fileID not in endOfFile:
+            endOfFile[fileID] = [0] * len(offsetBook[fileID])
+            endOfFile[fileID][rank] = offsetBook[fileID][rank]
         else:
-            print("Not possible: ", rank, filename)
-            endOfFile[filename][rank] = 0
+            print("Not possible: ", rank, fileID)
+            endOfFile[fileID][rank] = 0
 
-    func = func_list[record.func_id]
-    rank, args = record.rank, record.args_to_strs()
+    category = categories.of(record.func_id)
+    rank = record.rank
 
-    filename, offset, count = "", -1, -1
+    fileID, offset, count = -1, -1, -1
 
     # Ignore the functions that may confuse later conditions test
-    if "readlink" in func or "dir" in func:
-        return filename, offset, count
-
-    if "writev" in func or "readv" in func:
-        filename, count = args[0], int(args[1])
-        offset = offsetBook[filename][rank]
-        offsetBook[filename][rank] += count
-        update_end_of_file(rank, filename, endOfFile, offsetBook)
-    elif "fwrite" in func or "fread" in func:
-        filename, size, count = args[3], int(args[1]), int(args[2])
-        offset, count = offsetBook[filename][rank], size*count
-        offsetBook[filename][rank] += count
-        update_end_of_file(rank, filename, endOfFile, offsetBook)
-    elif "pwrite" in func or "pread" in func:
-        filename, count, offset = args[0], int(args[2]), int(args[3])
-        update_end_of_file(rank, filename, endOfFile, offsetBook)
-    elif "write" in func or "read" in func:
-        filename, count = args[0], int(args[2])
-        offset = offsetBook[filename][rank]
-        offsetBook[filename][rank] += count
-        update_end_of_file(rank, filename, endOfFile, offsetBook)
-    elif "fprintf" in func:
-        filename, count = args[0], int(args[1])
-        offset = offsetBook[filename][rank]
-        offsetBook[filename][rank] += count
-        update_end_of_file(rank, filename, endOfFile, offsetBook)
-
-    return filename, offset, count
-
-
-def handle_metadata_operations(record, offsetBook, func_list, closeBook, segmentBook, endOfFile):
-
-    def get_latest_offset(filename, rank, closeBook, endOfFile):
-        # Every filename should be in endOfFile becuase we initialized it at the begining
-        if filename not in closeBook and filename not in endOfFile:
-            print("Encounter an unknown filename "+filename+". Should abort!")
+    if category & (READLINK | DIR) or record.file_id < 0:
+        return fileID, offset, count
+
+    if category & VECTOR:
+        fileID, count = record.file_id, int(args[1])
+        offset = offsetBook[fileID][rank]
+        offsetBook[fileID][rank] += count
+        update_end_of_file(rank, fileID, endOfFile, offsetBook)
+    elif category & STREAM:
+        fileID, size, count = record.file_id, int(args[1]), int(args[2])
+        offset, count = offsetBook[fileID][rank], size*count
+        offsetBook[fileID][rank] += count
+        update_end_of_file(rank, fileID, endOfFile, offsetBook)
+    elif category & POSITIONED:
+        fileID, count, offset = record.file_id, int(args[2]), int(args[3])
+        update_end_of_file(rank, fileID, endOfFile, offsetBook)
+    elif category & (WRITE | READ):
+        fileID, count = record.file_id, int(args[2])
+        offset = offsetBook[fileID][rank]
+        offsetBook[fileID][rank] += count
+        update_end_of_file(rank, fileID, endOfFile, offsetBook)
+    elif category & FPRINTF:
+        fileID, count = record.file_id, int(args[1])
+        offset = offsetBook[fileID][rank]
+        offsetBook[fileID][rank] += count
+        update_end_of_file(rank, fileID, endOfFile, offsetBook)
+
+    return fileID, offset, count
+
+
+def handle_metadata_operations(record, args, offsetBook, categories, closeBook, segmentBook, endOfFile):
+
+    def get_latest_offset(fileID, rank, closeBook, endOfFile):
+        # Every file should be in endOfFile becuase we initialized it at the begining
+        if fileID not in closeBook and fileID not in endOfFile:
+            print("Encounter an unknown file ID %d. Should abort!" %(fileID))
             return 0
-        if filename in closeBook:
-            return max(endOfFile[filename][rank], closeBook[filename])
+        if fileID in closeBook:
+            return max(endOfFile[fileID][rank], closeBook[fileID])
         else:
-            return endOfFile[filename][rank]
+            return endOfFile[fileID][rank]
 
-    def create_new_segment(filename, rank, segmentBook):
-        newSegmentID = 0
-        if filename in segmentBook and len(segmentBook[filename]) > 0:
-            newSegmentID = 1+segmentBook[filename][-1][1]
-        if filename not in segmentBook:
-            segmentBook[filename] = []
-        segmentBook[filename].append([rank, newSegmentID, False])
+    def create_new_segment(fileID, rank, segmentBook):
+        if fileID not in segmentBook:
+            segmentBook[fileID] = SegmentIndex()
+        segmentBook[fileID].create(rank, segmentBook[fileID].lastID + 1)
 
-    rank, func = record.rank, func_list[record.func_id]
-    args = record.args_to_strs()
+    rank, category = record.rank, categories.of(record.func_id)
+    fileID = record.file_id
 
     # Ignore directory related operations
-    if "dir" in func:
+    if category & DIR or fileID < 0:
         return
 
-    if "fopen" in func or "fdopen" in func:
+    if category & FOPEN:
         # TODO check fdopen
-        filename = args[0]
-        offsetBook[filename][rank] = 0
+        offsetBook[fileID][rank] = 0
         openMode = args[1]
         if 'a' in openMode:
-            offsetBook[filename][rank] = get_latest_offset(filename, rank, closeBook, endOfFile)
-        create_new_segment(filename, rank, segmentBook)
-    elif "open" in func:
-        filename = args[0]
-        offsetBook[filename][rank] = 0
+            offsetBook[fileID][rank] = get_latest_offset(fileID, rank, closeBook, endOfFile)
+        create_new_segment(fileID, rank, segmentBook)
+    elif category & OPEN:
+        offsetBook[fileID][rank] = 0
         openMode = int( args[1] )
         if openMode == 2:  # TODO need  a better way to test for O_APPEND
-            offsetBook[filename][rank] = get_latest_offset(filename, rank, closeBook, endOfFile)
-        create_new_segment(filename, rank, segmentBook)
-    elif "seek" in func:
-        filename, offset, whence = args[0], int(args[1]), int(args[2])
+            offsetBook[fileID][rank] = get_latest_offset(fileID, rank, closeBook, endOfFile)
+        create_new_segment(fileID, rank, segmentBook)
+    elif category & SEEK:
+        offset, whence = int(args[1]), int(args[2])
 
         if whence == 0:     # SEEK_SET
-            offsetBook[filename][rank] = offset
+            offsetBook[fileID][rank] = offset
         elif whence == 1:   # SEEK_CUR
-            offsetBook[filename][rank] += offset
+            offsetBook[fileID][rank] += offset
         elif whence == 2:   # SEEK_END
-            offsetBook[filename][rank] = get_latest_offset(filename, rank, closeBook, endOfFile)
+            offsetBook[fileID][rank] = get_latest_offset(fileID, rank, closeBook, endOfFile)
 
-    elif "close" in func or "sync" in func:
-        filename = args[0]
-        closeBook[filename] = endOfFile[filename][rank]
+    elif category & (CLOSE | SYNC):
+        closeBook[fileID] = endOfFile[fileID][rank]
 
-        # 1. Close all segments on the local process for this file
-        for i in range(len(segmentBook[filename])):
-            if segmentBook[filename][i][0] == rank:
-                segmentBook[filename][i][2] = True
-        # 2. And starts a new segment for all other processes have the same file opened
-        # Skip this step for session semantics
-        visitedRanks = set()
-        tmpSegments = []
-        # [::-1] check the most recent unclosed segment to get the largest segmentId
-        for segment in segmentBook[filename][::-1]:
-            if segment[0] in visitedRanks:
-                continue
-            if segment[0] != rank and not segment[2]:
-                tmpSegments.append([segment[0], 1+segment[1], False])
-                visitedRanks.add(segment[0])
-        segmentBook[filename] = segmentBook[filename] + tmpSegments
+        if fileID not in segmentBook:
+            segmentBook[fileID] = SegmentIndex()
+        segmentBook[fileID].close(rank)
 
 
 def ignore_files(filename):
@@ -135,79 +175,188 @@ def ignore_files(filename):
     return False
 
 def ignore_funcs(func):
-    ignore = ["MPI", "H5", "writev"]
-    for f in ignore:
-        if f in func:
-            return True
-    return False
-
-
-def build_offset_intervals(reader):
-    func_list = reader.funcs
+    return ignore_category(func_category(func))
+
+def ignore_category(category):
+    return (category & (MPI | HDF5)) != 0 or \
+           (category & (VECTOR | WRITE) == (VECTOR | WRITE))     # writev
+
+
+# Records of a rank turned into Python objects at a time by iter_rank_records:
+# a pending rank stream keeps its selected indexes and tstarts as NumPy arrays
+# (16 bytes per record) and at most MERGE_CHUNK_SIZE records as Python objects
+MERGE_CHUNK_SIZE = 4096
+
+# Records of one rank that are not ignored, in tstart order.
+# A rank's records are normally already sorted, if not they are sorted here (stable).
+# keepFiles (indexed by file ID) optionally restricts the stream to some files.
+def iter_rank_records(reader, rank, ignoredFuncs, keepFiles=None):
+    columns, records = reader.columns[rank], reader.records[rank]
+    keep = ~ignoredFuncs[np.minimum(columns.func_id, len(ignoredFuncs)-1)]
+    if keepFiles is not None:
+        keep &= np.append(keepFiles, False)[columns.file_id]     # file ID -1 picks the last entry
+    indices = np.flatnonzero(keep)
+    tstarts = columns.tstart[indices]
+    if np.any(tstarts[1:] < tstarts[:-1]):
+        order = np.argsort(tstarts, kind='stable')
+        indices, tstarts = indices[order], tstarts[order]
+
+    for start in range(0, len(indices), MERGE_CHUNK_SIZE):
+        chunk = indices[start:start+MERGE_CHUNK_SIZE]
+        for i, tstart, fileID in zip(chunk.tolist(), tstarts[start:start+MERGE_CHUNK_SIZE].tolist(),
+                                     columns.file_id[chunk].tolist()):
+            record = records[i]
+            record.rank = rank
+            record.index = i
+            record.file_id = fileID
+            yield tstart, rank, record
+
+# k-way merge of the per-rank streams by tstart, only one pending record per rank is kept.
+# Ties are broken by rank, the same order a stable sort of all records would give.
+def merge_records_by_time(reader, ignoredFuncs, keepFiles=None):
+    streams = [iter_rank_records(reader, rank, ignoredFuncs, keepFiles) for rank in reader.ranks]
+    for tstart, rank, record in heapq.merge(*streams):
+        yield record
+
+
+# Run the offset/segment bookkeeping over the time-ordered records.
+# Returns the intervals keyed by file ID, and for each file the
+# (tstart, rank, index) of the record that produced its first interval.
+# asArrays=True collects each file's intervals into a FileIntervals instead of a list.
+def replay_records(reader, categories, records, ignoredFiles, asArrays=False):
     ranks = reader.GM.total_ranks
 
     closeBook = {}  # Keep track the most recent close function and its file size so a later append operation knows the most recent file size
-    segmentBook = {}    # segmentBook[filename] maintains all segments for filename, it is a list of list (rank, segment-id, closed)
+    segmentBook = {}    # segmentBook[fileID] is the SegmentIndex of the file, it keeps the open segments (rank, segment-id)
     offsetBook = {}
-    endOfFile = {}  # endOfFile[filename][rank] keep tracks the end of file, only the local rank can see it. When close/fsync, the value is stored in closeBook so other rank can see it.
+    endOfFile = {}  # endOfFile[fileID][rank] keep tracks the end of file, only the local rank can see it. When close/fsync, the value is stored in closeBook so other rank can see it.
     intervals = {}
+    firstSeen = {}
 
-    # merge the list(reader.records) of list(each rank's records) into one flat list
-    # then sort the whole list by tstart
-    records = []
-    for rank in range(ranks):
-        for i in range(reader.LMs[rank].total_records):
-            record = reader.records[rank][i]
-            record.rank = rank
-
-            # ignore user functions
-            if record.func_id >= len(func_list): continue
-
-            if not ignore_funcs(func_list[record.func_id]):
-                records.append( record )
+    for filename in ["stdin", "stderr", "stdout"]:
+        fileID = reader.files.get(filename)
+        if fileID >= 0:
+            segmentBook[fileID] = SegmentIndex()
+            endOfFile[fileID] = [0] * ranks
 
-    records = sorted(records, key=lambda x: x.tstart)
-
-    segmentBook["stdin"] = []
-    segmentBook["stderr"] = []
-    segmentBook["stdout"] = []
-    endOfFile["stdin"] = [0] * ranks
-    endOfFile["stderr"] = [0] * ranks
-    endOfFile["stdout"] = [0] * ranks
-
-    for rank in range(ranks):
+    for rank in reader.ranks:
         LM = reader.LMs[rank]
         for filename in LM.filemap:
-            segmentBook[filename] = []
-            endOfFile[filename] = [0] * ranks
-            offsetBook[filename] = [0] * ranks
-
+            fileID = reader.files.get(filename)
+            segmentBook[fileID] = SegmentIndex()
+            endOfFile[fileID] = [0] * ranks
+            offsetBook[fileID] = [0] * ranks
 
     for record in records:
 
         rank = record.rank
-        func = func_list[record.func_id]
+        category = categories.of(record.func_id)
+        args = record.args_to_strs()
 
-        handle_metadata_operations(record, offsetBook, func_list, closeBook, segmentBook, endOfFile)
-        filename, offset, count = handle_data_operations(record, offsetBook, func_list, endOfFile)
+        handle_metadata_operations(record, args, offsetBook, categories, closeBook, segmentBook, endOfFile)
+        fileID, offset, count = handle_data_operations(record, args, offsetBook, categories, endOfFile)
 
-        if not ignore_files(filename):
-            isRead = "read" in func
-            if filename not in intervals:
-                intervals[filename] = []
+        if fileID >= 0 and not ignoredFiles[fileID]:
+            isRead = (category & READ) != 0
+            if fileID not in intervals:
+                intervals[fileID] = IntervalBuilder() if asArrays else []
+                firstSeen[fileID] = (record.tstart, rank, record.index)
 
             # segments[0] is the local segment, the others are remote segments
-            segments = []
-            # 1. Add local segment
-            # Find the most recent unclosed local segment
-            for segment in segmentBook[filename][::-1]:
-                if segment[0] == rank and not segment[2]:
-                    segments.append(segment[1])
-
-            # 2. Add all remote segments
-            for segment in segmentBook[filename]:
-                if segment[0] != rank and not segment[2]:
-                    segments.append(segment[1])
-            intervals[filename].append( [rank, record.tstart, record.tend, offset, count, isRead, segments] )
-
-    return intervals
+            if fileID not in segmentBook:
+                segmentBook[fileID] = SegmentIndex()
+            segments = segmentBook[fileID].segments(rank)
+            if asArrays:
+                intervals[fileID].append(rank, record.tstart, record.tend, offset, count, isRead, segments)
+            else:
+                intervals[fileID].append( [rank, record.tstart, record.tend, offset, count, isRead, segments] )
+
+    if asArrays:
+        for fileID in intervals:
+            intervals[fileID] = intervals[fileID].build()
+    return intervals, firstSeen
+
+
+"""
+File-sharded reconstruction.
+
+    Records of different files never touch the same books, so the files
+    are split into shards balanced by record count, and each forked worker
+    replays the time-ordered stream of its own files only.
+    The per-file interval lists are then put back in the order the
+    serial replay would have created them.
+"""
+# Set by the parent right before forking the workers
+_shard_args = None
+
+def _replay_shard(shard):
+    reader, categories, ignoredFuncs, ignoredFiles, shardOfFile, asArrays = _shard_args
+    records = merge_records_by_time(reader, ignoredFuncs, shardOfFile == shard)
+    return replay_records(reader, categories, records, ignoredFiles, asArrays)
+
+def replay_sharded(reader, categories, ignoredFuncs, ignoredFiles, workers, asArrays=False):
+    global _shard_args
+
+    # Number of records of each file, ignored files are left out of all shards
+    numFiles = len(reader.files)
+    recordsPerFile = np.zeros(numFiles, dtype=np.int64)
+    for rank in reader.ranks:
+        columns = reader.columns[rank]
+        keep = ~ignoredFuncs[np.minimum(columns.func_id, len(ignoredFuncs)-1)] & (columns.file_id >= 0)
+        recordsPerFile += np.bincount(columns.file_id[keep], minlength=numFiles)
+
+    # Largest files first, each to the currently lightest shard
+    numShards = min(numFiles, workers * 4)
+    shardOfFile = np.full(numFiles, -1, dtype=np.int64)
+    shardLoad = [0] * numShards
+    for fileID in np.argsort(-recordsPerFile, kind='stable'):
+        if ignoredFiles[fileID] or recordsPerFile[fileID] == 0: continue
+        shard = shardLoad.index(min(shardLoad))
+        shardOfFile[fileID] = shard
+        shardLoad[shard] += recordsPerFile[fileID]
+
+    _shard_args = reader, categories, ignoredFuncs, ignoredFiles, shardOfFile, asArrays
+    try:
+        pool = multiprocessing.get_context("fork").Pool(workers)
+        try:
+            results = pool.map(_replay_shard, range(numShards), chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+    finally:
+        _shard_args = None
+
+    intervals, firstSeen = {}, {}
+    for shardIntervals, shardFirstSeen in results:
+        intervals.update(shardIntervals)
+        firstSeen.update(shardFirstSeen)
+    return dict([(fileID, intervals[fileID]) for fileID in sorted(intervals, key=lambda f: firstSeen[f])])
+
+
+# by_file_id=True returns the intervals keyed by file ID (index into reader.files)
+# instead of by filename.
+# workers=N replays the files in N processes, see replay_sharded().
+# as_arrays=True returns a FileIntervals per file instead of a list of
+# [rank, tstart, tend, offset, count, isRead, segments].
+def build_offset_intervals(reader, by_file_id=False, workers=1, as_arrays=False):
+    func_list = reader.funcs
+    categories = getattr(reader, "categories", None) or FunctionCategories(func_list)
+
+    ignoredFuncs = np.array([ignore_category(c) for c in categories.flags_list])
+    ignoredFuncs[-1] = True     # ignore user functions
+    # A lazy reader interns the filenames of a rank when its columns are built,
+    # build them all so reader.files is complete before it is indexed by file ID
+    for rank in reader.ranks:
+        reader.columns[rank]
+    ignoredFiles = np.array([ignore_files(filename) for filename in reader.files], dtype=bool)
+
+    if workers > 1 and can_fork() and len(reader.files) > 1:
+        intervals = replay_sharded(reader, categories, ignoredFuncs, ignoredFiles, workers, as_arrays)
+    else:
+        # Stream the records of all ranks in tstart order
+        records = merge_records_by_time(reader, ignoredFuncs)
+        intervals, _ = replay_records(reader, categories, records, ignoredFiles, as_arrays)
+
+    if by_file_id:
+        return intervals
+    return dict([(reader.files[fileID], intervals[fileID]) for fileID in intervals])
@@ -2,6 +2,15 @@
 # encoding: utf-8
 from ctypes import *
 import os, glob, struct
+from collections import OrderedDict
+import numpy as np
+from .record_columns import records_to_columns, concat_columns
+from .parallel_loader import load_ranks_parallel, can_fork
+from .trace_cache import TraceCache
+from .func_categories import FunctionCategories
+from .file_table import FileTable, intern_rank_files
+from .profiling import Profile
+from .query import RecordIndex
 
 """
 Global metadata information:
@@ -39,29 +48,40 @@ Per-rank metadata:
     not used in C reader code.
 """
 class LocalMetadata():
-    def __init__(self, func_list, records, total_records):
+    def __init__(self, func_list, records, total_records, columns=None, filemap=None, categories=None, files=None):
         self.total_records = total_records
         self.num_files =0
         self.filemap = set()
-        self.function_count = [0] * len(func_list)
 
-        for idx in range(total_records):
-            r = records[idx]
+        if columns is None:
+            columns = records_to_columns(records, total_records)
 
-            # Ignore user functions for now
-            if r.func_id < len(func_list):
-                func = func_list[r.func_id]
-                self.function_count[r.func_id] += 1
+        # Ignore user functions for now
+        func_ids = columns.func_id[columns.func_id < len(func_list)]
+        self.function_count = np.bincount(func_ids, minlength=len(func_list)).tolist()
 
-            if func.startswith("MPI") or func.startswith("H5") or \
-               func.startswith("ncmpi") or func.startswith("nc_"):
-                continue
-            if "dir" in func: continue
+        # The file set is already known (e.g., read from the trace cache)
+        if filemap is not None:
+            self.filemap = filemap
+            self.num_files = len(self.filemap)
+            return
 
-            if "open" in func or "close" in func or "creat" in func \
-                or "seek" in func or "sync" in func:
-                fstr = r.args[0]
-                self.filemap.add(fstr if type(fstr)==str else fstr.decode('utf-8'))
+        if categories is None:
+            categories = FunctionCategories(func_list)
+
+        # Only visit the records of functions that carry a filename
+        is_file_meta = categories.is_file_meta[categories.index(columns.func_id)]
+
+        # Filenames are already interned, files[file_id] gives the name
+        if columns.file_id is not None and files is not None:
+            file_ids = np.unique(columns.file_id[is_file_meta])
+            self.filemap = set([files[file_id] for file_id in file_ids if file_id >= 0])
+            self.num_files = len(self.filemap)
+            return
+
+        for idx in np.flatnonzero(is_file_meta):
+            fstr = records[idx].args[0]
+            self.filemap.add(fstr if type(fstr)==str else fstr.decode('utf-8'))
 
         self.num_files = len(self.filemap)
 
@@ -90,16 +110,122 @@ class PyRecord(Structure):
                 arg_strs[i] = self.args[i].decode('utf-8')
         return arg_strs
 
+'''
+Per-rank objects (LocalMetadata, RecordColumns) of the loaded ranks.
+    Indexed by the rank id like a list, but an entry is only
+    built by the loader the first time it is accessed.
+    Iterating visits the loaded ranks in order.
+'''
+class RankSequence():
+    def __init__(self, ranks, loader):
+        self.ranks = ranks
+        self.loader = loader
+        self.rank_set = set(ranks)
+        self.items = {}
+
+    def __getitem__(self, rank):
+        if rank not in self.items:
+            if rank not in self.rank_set:
+                raise IndexError("rank %d is not loaded" %(rank))
+            self.items[rank] = self.loader(rank)
+        return self.items[rank]
+
+    def __len__(self):
+        return len(self.ranks)
+
+    def __iter__(self):
+        for rank in self.ranks:
+            yield self[rank]
+
+    def is_built(self, rank):
+        return rank in self.items
+
+    def release(self, rank):
+        self.items.pop(rank, None)
+
+
 '''
 GM: Global Metadata
 LMs: List of Local Metadata
 records: List (# ranks) of Record*, each entry (Record*) is a list of records for that rank
+columns: List (# ranks) of RecordColumns, the same records stored as NumPy arrays
+categories: FunctionCategories, the category of each function in funcs
+files: FileTable, files[file_id] is the filename of the file_id column
+ranks: List of the loaded ranks, LMs and columns are only available for these ranks
+
+ranks=None loads all ranks, otherwise only the given ranks.
+lazy=True builds a rank's columns and LocalMetadata the first time it is accessed.
+workers=N builds the columns and LocalMetadata of all loaded ranks with N processes.
+cache=True stores the decoded traces in <logs_dir>/.recorder-viz-cache and reuses them
+    on later runs as long as the trace files do not change. cache="path" uses another directory.
+    Writing the cache (first run, or after the traces changed) builds the columns and LocalMetadata
+    of all ranks, whatever ranks= and lazy= say; workers=N builds them with N processes.
+    If the cache can not be written, a warning is printed and the decoded traces are used.
+profile: Profile with the time and memory spent decoding and building the columns and LocalMetadata
+indexes: List (# ranks) of RecordIndex (time order, function and file indexes), built by the first query of a rank
 '''
 class RecorderReader:
     def str2char_p(self, s):
         return c_char_p( s.encode('utf-8') )
 
-    def __init__(self, logs_dir):
+    def __init__(self, logs_dir, ranks=None, lazy=False, workers=1, cache=False):
+        self.cache = None
+        self.profile = Profile()
+        trace_cache, built = None, {}
+        if cache:
+            trace_cache = TraceCache(logs_dir, None if cache is True else cache)
+            with self.profile.stage("cache_load"):
+                loaded = trace_cache.load()
+            if not loaded:
+                self.decode(logs_dir)
+                built = self.save_cache(trace_cache, workers)
+                trace_cache = None
+        else:
+            self.decode(logs_dir)
+
+        self.cache = trace_cache
+        if self.cache:
+            self.funcs = self.cache.funcs()
+            self.categories = FunctionCategories(self.funcs)
+            self.files = self.cache.files()
+            self.GM = RecorderMetadata()
+            self.cache.restore_metadata(self.GM)
+            self.counts = self.cache.counts()
+            self.records = [self.cache.records(rank) for rank in range(self.GM.total_ranks)]
+
+        if ranks is None:
+            ranks = range(self.GM.total_ranks)
+        self.ranks = sorted(set(ranks))
+        for rank in self.ranks:
+            if rank < 0 or rank >= self.GM.total_ranks:
+                msg="Error:\n"\
+                    "    Invalid rank %d, the traces have %d ranks" %(rank, self.GM.total_ranks)
+                print(msg)
+                exit(1)
+
+        self.columns = RankSequence(self.ranks, self.load_columns)
+        self.LMs = RankSequence(self.ranks, self.load_local_metadata)
+        self.indexes = RankSequence(self.ranks, lambda rank: RecordIndex(self.columns[rank]))
+        for rank in self.ranks:
+            if rank in built:
+                self.columns.items[rank], self.LMs.items[rank] = built[rank]
+        if not lazy and workers > 1 and can_fork() and not self.cache and not built:
+            with self.profile.stage("columns+local_metadata", sum([self.counts[rank] for rank in self.ranks]), "records"):
+                columns, LMs = load_ranks_parallel(self, self.ranks, workers)
+            self.columns.items.update(columns)
+            self.LMs.items.update(LMs)
+            for rank in self.ranks:
+                print("Rank: %d, intercepted calls: %d, accessed files: %d" %(rank, self.counts[rank], LMs[rank].num_files))
+        elif not lazy:
+            for rank in self.ranks:
+                self.LMs[rank]
+
+    def decode(self, logs_dir):
+        with self.profile.stage("decode", unit="records") as stage:
+            self.decode_records(logs_dir)
+            stage.items = sum(self.counts)
+
+    def decode_records(self, logs_dir):
         if "RECORDER_INSTALL_PATH" not in os.environ:
             msg="Error:\n"\
                 "    RECORDER_INSTALL_PATH environment variable is not set.\n" \
@@ -130,11 +256,98 @@ class RecorderReader:
         # This function also fills in self.GM
         self.records = libreader.read_all_records(self.str2char_p(logs_dir), counts, pointer(self.GM))
 
-        self.LMs = []
-        for rank in range(self.GM.total_ranks):
-            LM = LocalMetadata(self.funcs, self.records[rank], counts[rank])
-            self.LMs.append(LM)
-            print("Rank: %d, intercepted calls: %d, accessed files: %d" %(rank, counts[rank], LM.num_files))
+        self.counts = list(counts)
+        self.files = FileTable()
+
+    # Cache all ranks, including the ones not selected by ranks=, with workers processes
+    # Returns the columns and LocalMetadata built on the way
+    def save_cache(self, trace_cache, workers=1):
+        built = {}
+        all_ranks = list(range(self.GM.total_ranks))
+        if workers > 1 and can_fork():
+            with self.profile.stage("columns+local_metadata", sum(self.counts), "records"):
+                columns, LMs = load_ranks_parallel(self, all_ranks, workers)
+            for rank in all_ranks:
+                built[rank] = columns[rank], LMs[rank]
+        for rank in all_ranks:
+            if rank in built: continue
+            columns = self.load_columns(rank)
+            with self.profile.stage("local_metadata", self.counts[rank], "records"):
+                LM = LocalMetadata(self.funcs, self.records[rank], self.counts[rank], columns,
+                                   categories=self.categories, files=self.files)
+            built[rank] = columns, LM
+        with self.profile.stage("cache_write", sum(self.counts), "records"):
+            try:
+                trace_cache.save(self, built)
+            except OSError as e:
+                msg="Warning:\n"\
+                    "    Could not write the trace cache to %s (%s)\n"\
+                    "    Continuing without it" %(trace_cache.cache_dir, e)
+                print(msg)
+        return built
+
+    def load_columns(self, rank):
+        with self.profile.stage("columns", self.counts[rank], "records"):
+            if self.cache:
+                return self.cache.columns(rank)
+            columns = records_to_columns(self.records[rank], self.counts[rank])
+            names, local_ids = intern_rank_files(self.records[rank], columns, self.categories)
+            columns.file_id = self.files.merge(names, local_ids)
+            return columns
+
+    def load_local_metadata(self, rank):
+        filemap = self.cache.filemap(rank) if self.cache else None
+        columns = self.columns[rank]
+        with self.profile.stage("local_metadata", self.counts[rank], "records"):
+            LM = LocalMetadata(self.funcs, self.records[rank], self.counts[rank], columns, filemap,
+                               self.categories, self.files)
+        print("Rank: %d, intercepted calls: %d, accessed files: %d" %(rank, self.counts[rank], LM.num_files))
+        return LM
+
+    # Stream through the loaded ranks one at a time.
+    # Ranks that were not built before are released after use,
+    # so a lazy reader only keeps one rank in memory.
+    def iter_ranks(self):
+        for rank in self.ranks:
+            built = self.LMs.is_built(rank), self.columns.is_built(rank)
+            yield rank, self.LMs[rank], self.columns[rank]
+            if not built[0]: self.LMs.release(rank)
+            if not built[1]: self.columns.release(rank)
+
+    # All ranks' columns in one RecordColumns, with an extra rank column
+    def all_columns(self):
+        return concat_columns(list(self.columns), self.ranks)
+
+    # Records matching all the given criteria, without scanning whole ranks:
+    # t0, t1: records overlapping [t0, t1) seconds, either can be None
+    # ranks: ranks to look at (default: the loaded ranks)
+    # funcs: function names or IDs, files: filenames or file IDs
+    # Returns {rank: indexes into records[rank] and columns[rank], ascending}
+    def query_indices(self, t0=None, t1=None, ranks=None, funcs=None, files=None):
+        func_ids = None
+        if funcs is not None:
+            func_ids = []
+            for func in funcs:
+                if isinstance(func, str) and func not in self.funcs:
+                    raise ValueError("unknown function %s" %(func))
+                func_ids.append(self.funcs.index(func) if isinstance(func, str) else func)
+            func_ids = np.array(func_ids, dtype=np.int64)
+
+        result = OrderedDict()
+        for rank in (self.ranks if ranks is None else ranks):
+            index = self.indexes[rank]
+            file_ids = None
+            if files is not None:
+                # resolved after the rank's columns, a lazy reader interns its filenames then
+                file_ids = np.array([self.files.get(f) if isinstance(f, str) else f for f in files], dtype=np.int64)
+                file_ids = file_ids[file_ids >= 0]
+            result[rank] = index.select(t0, t1, func_ids, file_ids)
+        return result
+
+    # The same query, as one RecordColumns of the matching records with a rank column
+    def query(self, t0=None, t1=None, ranks=None, funcs=None, files=None):
+        selected = self.query_indices(t0, t1, ranks, funcs, files)
+        return concat_columns([self.columns[rank][selected[rank]] for rank in selected], list(selected.keys()))
 
     def load_func_list(self, global_metadata_path):
         nprocs = 0
@@ -144,6 +357,7 @@ class RecorderReader:
             self.funcs = f.read().splitlines()
             self.funcs = [func.decode('utf-8') for func in self.funcs]
             #print(self.funcs)
+        self.categories = FunctionCategories(self.funcs)
         return nprocs
 
 
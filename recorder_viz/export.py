@@ -0,0 +1,232 @@
+#!/usr/bin/env python
+# encoding: utf-8
+import os
+from ctypes import POINTER, cast, c_void_p, sizeof, addressof, _Pointer
+import numpy as np
+from .record_columns import records_to_columns
+from .file_table import intern_rank_files, decode_arg
+from .build_offset_intervals import build_offset_intervals
+
+"""
+Export the records and the offset intervals as Parquet or Arrow IPC files.
+
+    output_dir/
+        functions.<ext>                     func_id, name (the last ID stands for all user functions)
+        files.<ext>                         file_id, filename
+        records/rank=<rank>/part-0.<ext>    one file per rank (hive partitioning)
+        intervals/part-0.<ext>              file_id, rank, tstart, tend, offset, count, is_read, segments
+
+    Every file is written chunk by chunk (a Parquet row group or an Arrow record
+    batch of at most chunk_size rows). The columns of a rank decoded by libreader
+    are built one chunk at a time straight from the C records, so the memory used
+    by the records on top of the decoded trace stays at about one chunk. The
+    intervals are built for the whole trace first, see export_intervals().
+    Offsets and IDs are 64-bit (large_list segments, int64 file_id), so no chunk
+    or trace overflows them. pyarrow is only needed here.
+"""
+
+EXPORT_CHUNK_SIZE = 1 << 20
+FORMATS = {"parquet": "parquet", "arrow": "arrow"}     # format: file extension
+
+
+def import_pyarrow():
+    try:
+        import pyarrow
+        return pyarrow
+    except ImportError:
+        raise ImportError("exporting needs pyarrow, install it with: pip install pyarrow (or recorder-viz[export])")
+
+
+'''
+Writes record batches with one schema into one Parquet or Arrow IPC file.
+'''
+class ChunkWriter():
+    def __init__(self, path, schema, format):
+        pa = import_pyarrow()
+        self.path = path
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        if format == "parquet":
+            import pyarrow.parquet as pq
+            self.writer = pq.ParquetWriter(path, schema)
+            self.write = lambda batch: self.writer.write_table(pa.Table.from_batches([batch]))
+        else:
+            self.sink = pa.OSFile(path, "wb")
+            self.writer = pa.ipc.new_file(self.sink, schema)
+            self.write = self.writer.write_batch
+
+    def close(self):
+        self.writer.close()
+        if hasattr(self, "sink"):
+            self.sink.close()
+
+
+def record_schema(args=False):
+    pa = import_pyarrow()
+    fields = [("tstart", pa.float64()), ("tend", pa.float64()), ("func_id", pa.int32()),
+              ("func", pa.dictionary(pa.int32(), pa.string())), ("file_id", pa.int64()), ("tid", pa.int32()),
+              ("call_depth", pa.uint8()), ("arg_count", pa.uint8())]
+    if args:
+        fields.append(("args", pa.list_(pa.string())))
+    return pa.schema(fields)
+
+
+def interval_schema():
+    pa = import_pyarrow()
+    return pa.schema([("file_id", pa.int64()), ("rank", pa.int32()), ("tstart", pa.float64()), ("tend", pa.float64()),
+                      ("offset", pa.int64()), ("count", pa.int64()), ("is_read", pa.bool_()),
+                      ("segments", pa.large_list(pa.int64()))])
+
+
+# (start, columns, records) of each chunk of a rank, records[i] is record start+i.
+# Records decoded by libreader are turned into columns chunk by chunk;
+# otherwise (trace cache, already built columns) the rank's columns are sliced.
+def rank_chunks(reader, rank, chunk_size):
+    records, count = reader.records[rank], reader.counts[rank]
+    if isinstance(records, _Pointer) and not reader.columns.is_built(rank) and not reader.cache:
+        record_type = records._type_
+        for start in range(0, count, chunk_size):
+            n = min(chunk_size, count - start)
+            chunk = cast(c_void_p(addressof(records.contents) + start * sizeof(record_type)), POINTER(record_type))
+            columns = records_to_columns(chunk, n)
+            names, local_ids = intern_rank_files(chunk, columns, reader.categories)
+            columns.file_id = reader.files.merge(names, local_ids)
+            yield start, columns, chunk
+        return
+
+    built = reader.columns.is_built(rank)
+    columns = reader.columns[rank]
+    for start in range(0, count, chunk_size):
+        yield start, columns[start:start+chunk_size], RecordsFrom(records, start)
+    if not built: reader.columns.release(rank)
+
+
+class RecordsFrom():
+    def __init__(self, records, start):
+        self.records = records
+        self.start = start
+
+    def __getitem__(self, i):
+        return self.records[self.start + i]
+
+
+def records_batch(reader, columns, records, args=False):
+    pa = import_pyarrow()
+    func_names = pa.array(list(reader.funcs) + ["<user function>"], type=pa.string())
+    arrays = [pa.array(columns.tstart), pa.array(columns.tend), pa.array(columns.func_id),
+              pa.DictionaryArray.from_arrays(pa.array(reader.categories.index(columns.func_id).astype(np.int32)),
+                                             func_names),
+              pa.array(columns.file_id.astype(np.int64)), pa.array(columns.tid),
+              pa.array(columns.call_depth), pa.array(columns.arg_count)]
+    if args:
+        arrays.append(pa.array([[decode_arg(records[i].args[j]) for j in range(records[i].arg_count)]
+                                for i in range(len(columns))], type=pa.list_(pa.string())))
+    return pa.RecordBatch.from_arrays(arrays, schema=record_schema(args))
+
+
+# Segments of each interval as Arrow large list offsets and values,
+# a chunk of many intervals seeing many segments can exceed 2^31 values
+def segment_lists(intervals):
+    lengths = intervals.segment_count.astype(np.int64)
+    offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+    within = np.arange(offsets[-1]) - np.repeat(offsets[:-1], lengths)
+    values = np.asarray(intervals.segment_ids)[np.repeat(intervals.segment_start.astype(np.int64), lengths) + within]
+    return offsets, values.astype(np.int64)
+
+
+def intervals_batch(file_id, intervals):
+    pa = import_pyarrow()
+    data = intervals.data
+    offsets, values = segment_lists(intervals)
+    arrays = [pa.array(np.full(len(data), file_id, dtype=np.int64)), pa.array(data["rank"]),
+              pa.array(data["tstart"]), pa.array(data["tend"]), pa.array(data["offset"]), pa.array(data["count"]),
+              pa.array(data["is_read"]), pa.LargeListArray.from_arrays(pa.array(offsets), pa.array(values))]
+    return pa.RecordBatch.from_arrays(arrays, schema=interval_schema())
+
+
+def table_file(output_dir, name, columns, format):
+    pa = import_pyarrow()
+    path = os.path.join(output_dir, "%s.%s" %(name, FORMATS[format]))
+    batch = pa.RecordBatch.from_arrays([pa.array(values) for values in columns.values()], names=list(columns.keys()))
+    writer = ChunkWriter(path, batch.schema, format)
+    writer.write(batch)
+    writer.close()
+    return path
+
+
+# Records of the loaded ranks, one file per rank. args=True also exports the arguments as strings.
+# Returns the paths written
+def export_records(reader, output_dir, format="parquet", chunk_size=EXPORT_CHUNK_SIZE, args=False):
+    paths = []
+    for rank in reader.ranks:
+        path = os.path.join(output_dir, "records", "rank=%d" %(rank), "part-0.%s" %(FORMATS[format]))
+        writer = ChunkWriter(path, record_schema(args), format)
+        for start, columns, records in rank_chunks(reader, rank, chunk_size):
+            writer.write(records_batch(reader, columns, records, args))
+        writer.close()
+        paths.append(path)
+    return paths
+
+
+# The intervals of build_offset_intervals(reader, by_file_id=True), or the given ones, in one file
+#
+# Unlike the records, the intervals are not streamed: the replay needs the columns
+# of all ranks at once and keeps the intervals of all files until it ends, so the
+# peak memory is the columns of the trace plus all its intervals (about 50 bytes
+# per interval and 8 per stored segment ID). The columns the replay built for a lazy
+# reader are released before writing, and the intervals of each file once written.
+def export_intervals(reader, output_dir, format="parquet", chunk_size=EXPORT_CHUNK_SIZE, intervals=None, workers=1):
+    release = intervals is None
+    if intervals is None:
+        built = [rank for rank in reader.ranks if reader.columns.is_built(rank)]
+        intervals = build_offset_intervals(reader, by_file_id=True, workers=workers, as_arrays=True)
+        for rank in reader.ranks:
+            if rank not in built: reader.columns.release(rank)
+    path = os.path.join(output_dir, "intervals", "part-0.%s" %(FORMATS[format]))
+    writer = ChunkWriter(path, interval_schema(), format)
+    for file_id in sorted(intervals):
+        for start in range(0, len(intervals[file_id]), chunk_size):
+            rows = np.arange(start, min(start + chunk_size, len(intervals[file_id])))
+            writer.write(intervals_batch(file_id, intervals[file_id].take(rows)))
+        if release: del intervals[file_id]
+    writer.close()
+    return [path]
+
+
+# Everything in output_dir, see the layout above. Returns the paths written
+def export_trace(reader, output_dir, format="parquet", chunk_size=EXPORT_CHUNK_SIZE, intervals=True, args=False,
+                 workers=1):
+    if format not in FORMATS:
+        raise ValueError("format must be one of %s, not %s" %(", ".join(FORMATS), format))
+    import_pyarrow()
+
+    paths = export_records(reader, output_dir, format, chunk_size, args)
+    if intervals:
+        paths += export_intervals(reader, output_dir, format, chunk_size, workers=workers)
+
+    # after the records, a lazy reader interns the filenames while exporting them
+    paths.append(table_file(output_dir, "functions", {"func_id": np.arange(len(reader.funcs) + 1, dtype=np.int32),
+                                                      "name": list(reader.funcs) + ["<user function>"]}, format))
+    paths.append(table_file(output_dir, "files", {"file_id": np.arange(len(reader.files), dtype=np.int64),
+                                                  "filename": list(reader.files)}, format))
+    return paths
+
+
+if __name__ == "__main__":
+    import argparse
+    from .creader_wrapper import RecorderReader
+
+    parser = argparse.ArgumentParser(description="Export the trace records and offset intervals as Parquet or Arrow files.")
+    parser.add_argument("-i", "--input_path", required=True, type=str, help="Path to the trace file to be processed.")
+    parser.add_argument("-o", "--output_path", required=True, type=str, help="Directory to write the files to.")
+    parser.add_argument("--format", choices=sorted(FORMATS), default="parquet", help="Parquet or Arrow IPC (Feather v2) files.")
+    parser.add_argument("--chunk-size", default=EXPORT_CHUNK_SIZE, type=int, help="Rows per row group / record batch.")
+    parser.add_argument("--args", action="store_true", help="Also export the arguments of every record.")
+    parser.add_argument("--no-intervals", action="store_true", help="Only export the records.")
+    parser.add_argument("-j", "--jobs", default=1, type=int, help="Number of processes used to build the offset intervals.")
+    args = parser.parse_args()
+
+    reader = RecorderReader(args.input_path, lazy=True)
+    for path in export_trace(reader, args.output_path, args.format, args.chunk_size, not args.no_intervals,
+                             args.args, args.jobs):
+        print(path)
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# encoding: utf-8
+import numpy as np
+
+"""
+Interned filenames.
+
+    Every filename seen in the traces gets an integer file ID, so the
+    per-record file_id column and the books built on top of it (offsets,
+    segments, intervals, statistics) can be keyed by small integers
+    instead of full path strings.
+"""
+class FileTable():
+    def __init__(self, names=()):
+        self.names = []
+        self.ids = {}
+        for name in names:
+            self.intern(name)
+
+    def intern(self, name):
+        if name not in self.ids:
+            self.ids[name] = len(self.names)
+            self.names.append(name)
+        return self.ids[name]
+
+    def get(self, name, default=-1):
+        return self.ids.get(name, default)
+
+    def __getitem__(self, file_id):
+        return self.names[file_id]
+
+    def __len__(self):
+        return len(self.names)
+
+    def __iter__(self):
+        return iter(self.names)
+
+    # Intern a rank-local list of names and
+    # translate the rank-local IDs into IDs of this table
+    def merge(self, names, local_ids):
+        if len(names) == 0:
+            return local_ids
+        remap = np.array([self.intern(name) for name in names] + [-1], dtype=np.int32)
+        return remap[local_ids]         # -1 (no file) picks the last entry
+
+
+def decode_arg(arg):
+    if arg is None: return ""
+    return arg if type(arg) == str else arg.decode('utf-8')
+
+
+# Decode the filename argument of every file operation of one rank, once.
+# Returns the rank-local names and the rank-local file ID of each record (-1 for none)
+def intern_rank_files(records, columns, categories):
+    names, ids = [], {}
+    local_ids = np.full(len(columns), -1, dtype=np.int32)
+
+    filename_arg = categories.filename_arg[categories.index(columns.func_id)]
+    for i in np.flatnonzero((filename_arg >= 0) & (filename_arg < columns.arg_count)):
+        name = decode_arg(records[i].args[filename_arg[i]])
+        if name not in ids:
+            ids[name] = len(names)
+            names.append(name)
+        local_ids[i] = ids[name]
+    return names, local_ids
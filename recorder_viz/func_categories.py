@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# encoding: utf-8
+import numpy as np
+
+"""
+Per-function category table.
+
+    Whether a function is a read, a write, an open, an MPI call, etc.
+    only depends on its name, so the name tests are done once for each
+    entry of reader.funcs and kept as a bitmask per func_id.
+    All analyses use this table instead of testing the name of every record.
+"""
+
+# Name tests, one bit each
+READ        = 1 << 0     # "read"
+WRITE       = 1 << 1     # "write"
+FPRINTF     = 1 << 2     # "fprintf"
+OPEN        = 1 << 3     # "open"
+FOPEN       = 1 << 4     # "fopen", "fdopen"
+CREAT       = 1 << 5     # "creat"
+SEEK        = 1 << 6     # "seek"
+CLOSE       = 1 << 7     # "close"
+SYNC        = 1 << 8     # "sync"
+DIR         = 1 << 9     # "dir", e.g., mkdir, opendir, readdir
+READLINK    = 1 << 10    # "readlink"
+VECTOR      = 1 << 11    # "readv", "writev"
+STREAM      = 1 << 12    # "fread", "fwrite"
+POSITIONED  = 1 << 13    # "pread", "pwrite"
+MPI         = 1 << 14    # "MPI", also matches PMPI
+HDF5        = 1 << 15    # "H5"
+NETCDF      = 1 << 16    # "ncmpi*", "nc_*"
+USER        = 1 << 17    # user functions, func_id beyond reader.funcs
+
+LIBRARY     = MPI | HDF5 | NETCDF
+FILE_META   = OPEN | CREAT | SEEK | CLOSE | SYNC
+
+
+def func_category(func):
+    tests = [
+        (READ,       "read" in func),
+        (WRITE,      "write" in func),
+        (FPRINTF,    "fprintf" in func),
+        (OPEN,       "open" in func),
+        (FOPEN,      "fopen" in func or "fdopen" in func),
+        (CREAT,      "creat" in func),
+        (SEEK,       "seek" in func),
+        (CLOSE,      "close" in func),
+        (SYNC,       "sync" in func),
+        (DIR,        "dir" in func),
+        (READLINK,   "readlink" in func),
+        (VECTOR,     "readv" in func or "writev" in func),
+        (STREAM,     "fread" in func or "fwrite" in func),
+        (POSITIONED, "pread" in func or "pwrite" in func),
+        (MPI,        "MPI" in func),
+        (HDF5,       "H5" in func),
+        (NETCDF,     func.startswith("ncmpi") or func.startswith("nc_")),
+    ]
+    category = 0
+    for bit, match in tests:
+        if match: category |= bit
+    return category
+
+
+'''
+flags[func_id] is the category bitmask of reader.funcs[func_id],
+    the extra last entry (index len(func_list)) stands for all user functions.
+
+The boolean arrays are the shared definitions used by the analyses:
+    is_read/is_write:   POSIX data operations, fprintf counts as a write
+    is_file_meta:       POSIX open/creat/seek/close/sync on a file
+    is_posix:           neither MPI, HDF5, NetCDF nor a user function
+
+filename_arg[func_id] is the position of the filename in the arguments,
+    or -1 if the function does not operate on a file.
+'''
+class FunctionCategories():
+    def __init__(self, func_list):
+        self.num_funcs = len(func_list)
+        self.flags = np.array([func_category(func) for func in func_list] + [USER], dtype=np.uint32)
+        self.flags_list = self.flags.tolist()     # faster for scalar lookups in Python loops
+
+        plain = (self.flags & (LIBRARY | USER | DIR)) == 0
+        self.is_posix     = (self.flags & (LIBRARY | USER)) == 0
+        self.is_read      = plain & ((self.flags & READ) != 0) & ((self.flags & READLINK) == 0)
+        self.is_write     = plain & ((self.flags & (WRITE | FPRINTF)) != 0)
+        self.is_file_meta = plain & ((self.flags & FILE_META) != 0)
+        self.is_mpi       = (self.flags & MPI) != 0
+        self.is_hdf5      = (self.flags & HDF5) != 0
+
+        # fread/fwrite(ptr, size, count, stream), other file operations take the file first
+        on_file = plain & ((self.flags & (FILE_META | READ | WRITE | FPRINTF)) != 0) & ((self.flags & READLINK) == 0)
+        self.filename_arg = np.where(on_file, np.where(self.flags & STREAM, 3, 0), -1).astype(np.int8)
+
+    # Index into flags or one of the boolean arrays,
+    # user functions (func_id >= number of functions) map to the last entry
+    def index(self, func_ids):
+        return np.minimum(func_ids, self.num_funcs)
+
+    def of(self, func_id):
+        return self.flags_list[min(func_id, self.num_funcs)]
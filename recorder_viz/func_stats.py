@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# encoding: utf-8
+import numpy as np
+
+"""
+Per-function aggregations: number of calls and time spent.
+
+    Each aggregation is one weighted bincount over the func_id column
+    of a rank, sized from reader.funcs. User functions (func_id beyond
+    reader.funcs) are ignored.
+
+    by=None:        one array, entry i is for reader.funcs[i]
+    by="rank":      2D array, row j is for rank reader.ranks[j]
+    by="thread":    dict {(rank, tid): array}
+"""
+
+
+# Group one rank's records by (key, func_id) and sum the weights (or count).
+# Returns a (num_keys, num_funcs) array
+def group_by_function(func_ids, num_funcs, weights=None, keys=None, num_keys=1):
+    valid = func_ids < num_funcs
+    index = func_ids[valid].astype(np.int64)
+    if keys is not None:
+        index += keys[valid].astype(np.int64) * num_funcs
+    if weights is not None:
+        weights = weights[valid]
+    table = np.bincount(index, weights=weights, minlength=num_keys*num_funcs)
+    return table.reshape(num_keys, num_funcs)
+
+
+def aggregate_functions(reader, value="count", by=None):
+    if value not in ("count", "time"):
+        raise ValueError("value must be 'count' or 'time', not %s" %(value))
+    if by not in (None, "rank", "thread"):
+        raise ValueError("by must be None, 'rank' or 'thread', not %s" %(by))
+
+    num_funcs = len(reader.funcs)
+    dtype = np.int64 if value == "count" else np.float64
+    per_rank = np.zeros((len(reader.ranks), num_funcs), dtype=dtype)
+    per_thread = {}
+
+    for row, rank in enumerate(reader.ranks):
+        columns = reader.columns[rank]
+        weights = (columns.tend - columns.tstart) if value == "time" else None
+
+        if by == "thread":
+            tids, inverse = np.unique(columns.tid, return_inverse=True)
+            table = group_by_function(columns.func_id, num_funcs, weights, inverse, len(tids))
+            for tid, totals in zip(tids.tolist(), table):
+                per_thread[(rank, tid)] = totals.astype(dtype)
+        else:
+            per_rank[row] = group_by_function(columns.func_id, num_funcs, weights)[0]
+
+    if by == "thread":
+        return per_thread
+    if by == "rank":
+        return per_rank
+    return per_rank.sum(axis=0)
+
+
+def function_call_counts(reader, by=None):
+    return aggregate_functions(reader, "count", by)
+
+def function_call_times(reader, by=None):
+    return aggregate_functions(reader, "time", by)
@@ -32,9 +32,13 @@ css_style = """
 
 class HTMLWriter:
 
-    def __init__(self, filename):
+    # resources: "cdn" loads BokehJS from cdn.bokeh.org, "inline" bundles it into the page
+    # single_precision: plots store their float data as float32 (lossy)
+    def __init__(self, filename, resources="cdn", single_precision=False):
         self.filename = filename
         self.bokeh_version = bokeh.__version__  # python bokeh version must match the JS version
+        self.resources = resources
+        self.single_precision = single_precision
         # 0
         self.performanceTable = ""
         self.recordCount = ""               # 0.1
@@ -55,10 +59,22 @@ class HTMLWriter:
         self.fileAccessPatterns = ""
 
         # 4.
+        self.bandwidthTimeline = ""         # 4.2
         self.readIOSizes = ""
         self.writeIOSizes = ""
 
     def get_html_head(self):
+        if self.resources == "inline":
+            from bokeh.resources import Resources
+            scripts = Resources(mode="inline", components=["bokeh", "bokeh-widgets", "bokeh-tables"]).render_js()
+            return """
+            <head>
+                %s
+                <meta charset="UTF-8">
+                %s
+            </head>
+        """ %(css_style, scripts)
+
         html_head = """
             <head>
                 %s
@@ -70,16 +86,42 @@ class HTMLWriter:
         """ %(css_style, self.bokeh_version, self.bokeh_version, self.bokeh_version)
         return html_head
 
+    # Leave the given attributes (sections) out of the page
+    def skip(self, names):
+        for name in names:
+            setattr(self, name, None)
+
+    # Whether any of the given attributes is shown (was not skipped)
+    def shown(self, *names):
+        return any([getattr(self, name, "") is not None for name in names])
+
+    # Fragment of the page for the given attributes, empty if all of them
+    # were skipped. An empty template only adds the heading (or a tag).
+    def section_html(self, heading, template, *names):
+        if not self.shown(*names):
+            return ""
+        if not template:
+            return heading
+        values = [getattr(self, name, "") for name in names]
+        return heading + template %tuple(["" if value is None else value for value in values])
+
     def write_html(self):
         html_content  = """
         <html>
             %s
-            <body><div class="content">
-                <h2> 0. Performance </h2>
-                %s
-                <h4> 0.1 Record Count </h4>
-                %s
-                <h2> 1. File Statistics </h2>
+            <body><div class="content">%s
+            </div></body>
+        </html>
+        """ %(self.get_html_head(), "".join([
+                self.section_html("""
+                <h2> 0. Performance </h2>""", """
+                %s""", "performanceTable"),
+                self.section_html("""
+                <h4> 0.1 Record Count </h4>""", """
+                %s""", "recordCount"),
+
+                self.section_html("""
+                <h2> 1. File Statistics </h2>""", """
                 <h4> 1.1 Number of file accessed by each rank</h4>
                 %s
                 <!--
@@ -88,61 +130,85 @@ class HTMLWriter:
                 %s
                 </div>
                 -->
-                <hr>
+                <hr>""", "fileCount", "fileAccessModeTable"),
+
+                self.section_html("""
 
-                <h2> 2. Function Statistics </h3>
-                <div>
+                <h2> 2. Function Statistics </h3>""", "",
+                    "functionLayers", "functionPatterns", "functionCount", "functionTimes"),
+                self.section_html("""
+                <div>""", "", "functionLayers", "functionPatterns"),
+                self.section_html("""
                     <div style="display:inline-block">
-                        <h4> 2.1 I/O Layers</h4>
+                        <h4> 2.1 I/O Layers</h4>""", """
                         %s
-                    </div>
+                    </div>""", "functionLayers"),
+                self.section_html("""
                     <div style="display:inline-block">
-                        <h4> 2.2 POSIX I/O Patterns </h4>
+                        <h4> 2.2 POSIX I/O Patterns </h4>""", """
                         %s
-                    </div>
-                </div>
-                <h4> 2.3 Function count </h4>
-                %s
-                <hr>
-                <h4> 2.4 Seconds spent on each function </h4>
-                %s
-                <hr>
-
-
-                <h2> 3. Access Patterns </h2>
-                <h4> 3.1 Overall I/O activities </h4>
-                %s
-                <h4> 3.2 Accessed offsets VS ranks </h4>
+                    </div>""", "functionPatterns"),
+                self.section_html("""
+                </div>""", "", "functionLayers", "functionPatterns"),
+                self.section_html("""
+                <h4> 2.3 Function count </h4>""", """
                 %s
-                <h4> 3.3 Accessed offsets VS time </h4>
+                <hr>""", "functionCount"),
+                self.section_html("""
+                <h4> 2.4 Seconds spent on each function </h4>""", """
                 %s
-                <h4> 3.4 File access patterns </h4>
+                <hr>""", "functionTimes"),
+
+                self.section_html("""
+
+
+                <h2> 3. Access Patterns </h2>""", "",
+                    "overallIOActivities", "offsetVsRank", "offsetVsTime", "fileAccessPatterns"),
+                self.section_html("""
+                <h4> 3.1 Overall I/O activities </h4>""", """
+                %s""", "overallIOActivities"),
+                self.section_html("""
+                <h4> 3.2 Accessed offsets VS ranks </h4>""", """
+                %s""", "offsetVsRank"),
+                self.section_html("""
+                <h4> 3.3 Accessed offsets VS time </h4>""", """
+                %s""", "offsetVsTime"),
+                self.section_html("""
+                <h4> 3.4 File access patterns </h4>""", """
                 <div style="height:400px; overflow:auto;">
                 %s
                 </div>
-                <hr>
+                <hr>""", "fileAccessPatterns"),
 
-                <h2> 4. I/O Statistics </h2>
-                <div>
-                    <h4> 4.1 Per-file I/O statistics</h4>
-                    %s
+                self.section_html("""
 
-                    <h4> 4.2 Count of unique I/O sizes</h4>
+                <h2> 4. I/O Statistics </h2>""", "",
+                    "perFileIOStatistics", "bandwidthTimeline", "readIOSizes", "writeIOSizes"),
+                self.section_html("""
+                <div>""", "", "perFileIOStatistics", "bandwidthTimeline", "readIOSizes", "writeIOSizes"),
+                self.section_html("""
+                    <h4> 4.1 Per-file I/O statistics</h4>""", """
+                    %s
+""", "perFileIOStatistics"),
+                self.section_html("""
+                    <h4> 4.2 Bandwidth over time</h4>""", """
+                    %s
+""", "bandwidthTimeline"),
+                self.section_html("""
+                    <h4> 4.3 I/O sizes (power-of-two buckets)</h4>""", "", "readIOSizes", "writeIOSizes"),
+                self.section_html("""
                     <div style="display:inline-block">
-                        <h4> Read </h4>
+                        <h4> Read </h4>""", """
                         %s
-                    </div>
+                    </div>""", "readIOSizes"),
+                self.section_html("""
                     <div style="display:inline-block">
-                        <h4> Write </h4>
+                        <h4> Write </h4>""", """
                         %s
-                    </div>
-                </div>
-            </div></body>
-        </html>
-        """ %(self.get_html_head(), self.performanceTable, self.recordCount, self.fileCount, self.fileAccessModeTable, \
-                self.functionLayers, self.functionPatterns, self.functionCount, self.functionTimes, \
-                self.overallIOActivities, self.offsetVsRank, self.offsetVsTime, self.fileAccessPatterns, \
-                self.perFileIOStatistics, self.readIOSizes, self.writeIOSizes)
+                    </div>""", "writeIOSizes"),
+                self.section_html("""
+                </div>""", "", "perFileIOStatistics", "bandwidthTimeline", "readIOSizes", "writeIOSizes"),
+            ]))
 
         f = open(self.filename, "w")
         f.write(html_content)
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# encoding: utf-8
+from array import array
+import numpy as np
+
+"""
+Array-backed offset intervals.
+
+    The intervals of one file are kept in a structured NumPy array,
+    one row per I/O call, instead of one Python list per call.
+    The segment IDs of each interval live in a shared side array:
+    segment_ids[segment_start[i]:segment_start[i]+segment_count[i]]
+    are the segments of interval i (local segment first). Consecutive
+    intervals that see the same segments point at the same slice.
+
+    Indexing or iterating a FileIntervals still gives the list form
+    [rank, tstart, tend, offset, count, isRead, segments].
+"""
+
+interval_dtype = np.dtype([
+    ("rank",    np.int32),
+    ("tstart",  np.float64),
+    ("tend",    np.float64),
+    ("offset",  np.int64),
+    ("count",   np.int64),
+    ("is_read", np.bool_),
+])
+
+
+class FileIntervals():
+    def __init__(self, data, segment_start, segment_count, segment_ids):
+        self.data = data
+        self.segment_start = segment_start
+        self.segment_count = segment_count
+        self.segment_ids = segment_ids
+
+    def __len__(self):
+        return len(self.data)
+
+    def segments(self, i):
+        start = self.segment_start[i]
+        return self.segment_ids[start:start+self.segment_count[i]].tolist()
+
+    def __getitem__(self, i):
+        row = self.data[i]
+        return [int(row["rank"]), float(row["tstart"]), float(row["tend"]),
+                int(row["offset"]), int(row["count"]), bool(row["is_read"]), self.segments(i)]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    # A new FileIntervals with the rows in the given order (or selection),
+    # the segment side array is shared
+    def take(self, order):
+        return FileIntervals(self.data[order], self.segment_start[order],
+                             self.segment_count[order], self.segment_ids)
+
+    def to_lists(self):
+        return list(self)
+
+    @staticmethod
+    def from_lists(intervals):
+        builder = IntervalBuilder()
+        for interval in intervals:
+            builder.append(*interval)
+        return builder.build()
+
+
+'''
+Collects the intervals of one file during the offset/segment replay.
+    Uses growable typed buffers, so no Python object is kept per interval.
+'''
+class IntervalBuilder():
+    def __init__(self):
+        self.columns = [array('i'), array('d'), array('d'), array('q'), array('q'), array('b')]
+        self.segment_start = array('q')
+        self.segment_count = array('i')
+        self.segment_ids = array('q')
+        self.last_segments = None
+
+    def append(self, rank, tstart, tend, offset, count, isRead, segments):
+        for column, value in zip(self.columns, (rank, tstart, tend, offset, count, isRead)):
+            column.append(value)
+        # The replay hands out the same list object until the file's segments change
+        if segments is not self.last_segments:
+            self.last_start = len(self.segment_ids)
+            self.segment_ids.extend(segments)
+            self.last_segments = segments
+        self.segment_start.append(self.last_start)
+        self.segment_count.append(len(segments))
+
+    def build(self):
+        data = np.empty(len(self.segment_start), dtype=interval_dtype)
+        for name, column in zip(interval_dtype.names, self.columns):
+            data[name] = np.frombuffer(column, dtype=data.dtype[name] if name != "is_read" else np.int8) \
+                         if len(column) else []
+        return FileIntervals(data, np.frombuffer(self.segment_start, dtype=np.int64).copy(),
+                             np.frombuffer(self.segment_count, dtype=np.int32).copy(),
+                             np.frombuffer(self.segment_ids, dtype=np.int64).copy())
+
+
+# Convert a dict of interval lists (as returned by build_offset_intervals)
+# into FileIntervals, entries that already are FileIntervals are kept as is
+def as_interval_arrays(intervals):
+    arrays = {}
+    for key in intervals:
+        value = intervals[key]
+        arrays[key] = value if isinstance(value, FileIntervals) else FileIntervals.from_lists(value)
+    return arrays
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# encoding: utf-8
+import mmap
+import multiprocessing
+import numpy as np
+from .record_columns import RecordColumns, records_to_columns
+from .file_table import intern_rank_files
+
+"""
+Build the per-rank RecordColumns and LocalMetadata with a pool of worker processes.
+
+    The workers are forked after libreader decoded the traces, so they can
+    read the C records directly. Columns are written into anonymous shared
+    memory allocated by the parent; only the small LocalMetadata objects
+    and the filenames of each rank travel back through pickling.
+    The file_id column is written with rank-local IDs, which the parent
+    then translates into IDs of reader.files, rank by rank.
+"""
+
+# Set by the parent right before forking the workers
+_reader = None
+_shared_columns = None
+_rank_offsets = None
+
+
+def _build_rank(rank):
+    from .creader_wrapper import LocalMetadata
+    count = _reader.counts[rank]
+    columns = records_to_columns(_reader.records[rank], count)
+    names, columns.file_id = intern_rank_files(_reader.records[rank], columns, _reader.categories)
+    start = _rank_offsets[rank]
+    for name in RecordColumns.fields + ("file_id",):
+        _shared_columns[name][start:start+count] = getattr(columns, name)
+    LM = LocalMetadata(_reader.funcs, _reader.records[rank], count, columns,
+                       categories=_reader.categories, files=names)
+    return rank, (names, LM)
+
+
+def can_fork():
+    return "fork" in multiprocessing.get_all_start_methods()
+
+
+def load_ranks_parallel(reader, ranks, workers):
+    global _reader, _shared_columns, _rank_offsets
+
+    _rank_offsets, total = {}, 0
+    for rank in ranks:
+        _rank_offsets[rank] = total
+        total += reader.counts[rank]
+
+    _shared_columns = {}
+    for name, dtype in zip(RecordColumns.fields + ("file_id",), RecordColumns.dtypes + (np.int32,)):
+        nbytes = max(1, total * np.dtype(dtype).itemsize)
+        _shared_columns[name] = np.frombuffer(mmap.mmap(-1, nbytes), dtype=dtype, count=total)
+
+    _reader = reader
+    try:
+        pool = multiprocessing.get_context("fork").Pool(workers)
+        try:
+            results = dict(pool.imap_unordered(_build_rank, ranks, chunksize=max(1, len(ranks)//(workers*4))))
+        finally:
+            pool.close()
+            pool.join()
+
+        columns, LMs = {}, {}
+        for rank in ranks:
+            start, count = _rank_offsets[rank], reader.counts[rank]
+            columns[rank] = RecordColumns(*[_shared_columns[name][start:start+count] for name in RecordColumns.fields])
+            names, LMs[rank] = results[rank]
+            columns[rank].file_id = reader.files.merge(names, _shared_columns["file_id"][start:start+count])
+    finally:
+        _reader, _shared_columns, _rank_offsets = None, None, None
+
+    return columns, LMs
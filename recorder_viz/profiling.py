@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+# encoding: utf-8
+import json, time
+from contextlib import contextmanager
+from prettytable import PrettyTable
+try:
+    import resource
+except ImportError:     # not available on Windows
+    resource = None
+
+"""
+Stage-level profiling of the reader and the report.
+
+    Each stage (decoding, building the columns and LocalMetadata, the
+    offset intervals, every report section, ...) records its wall time,
+    CPU time (including the worker processes it waited for), the peak RSS
+    of the process at its end, and how many records or intervals it went
+    through. A stage that runs several times, e.g., the columns of each
+    rank of a lazy reader, adds up into one entry.
+
+    Hooks are notified when a stage starts and stops, so callers can attach
+    their own timers or counters:
+
+        class Timer(StageHook):
+            def start(self, name):
+                self.begin = time.perf_counter()
+            def stop(self, stage):
+                print(stage.name, time.perf_counter() - self.begin)
+        add_stage_hook(Timer())
+
+    Report sections computed by worker processes (-j) call the hooks in the worker.
+"""
+
+_hooks = []
+
+
+def add_stage_hook(hook):
+    _hooks.append(hook)
+    return hook
+
+
+def remove_stage_hook(hook):
+    _hooks.remove(hook)
+
+
+class StageHook():
+    def start(self, name):
+        pass
+
+    def stop(self, stage):
+        pass
+
+
+# CPU seconds of this process and its waited-for children, peak RSS in MiB
+def resource_usage():
+    if resource is None:
+        return time.process_time(), None
+    own, children = resource.getrusage(resource.RUSAGE_SELF), resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu = own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+    return cpu, max(own.ru_maxrss, children.ru_maxrss) / 1024.0     # ru_maxrss is in KiB on Linux
+
+
+'''
+One profiled stage.
+    wall, cpu:  seconds
+    peak_rss:   MiB, the peak of the process (and its children) when the stage ended
+    items:      number of records or intervals processed, unit says which (None if not counted)
+'''
+class Stage():
+    def __init__(self, name, unit=None):
+        self.name = name
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.peak_rss = None
+        self.items = None
+        self.unit = unit
+        self.calls = 0
+
+    def throughput(self):
+        if self.items is None or self.wall <= 0:
+            return None
+        return self.items / self.wall
+
+    def add(self, other):
+        self.wall += other.wall
+        self.cpu += other.cpu
+        self.peak_rss = other.peak_rss if self.peak_rss is None else max(self.peak_rss, other.peak_rss or 0)
+        if other.items is not None:
+            self.items = (self.items or 0) + other.items
+        self.unit = self.unit or other.unit
+        self.calls += other.calls
+
+    def to_dict(self):
+        return {"name": self.name, "wall": self.wall, "cpu": self.cpu, "peak_rss": self.peak_rss,
+                "items": self.items, "unit": self.unit, "throughput": self.throughput(), "calls": self.calls}
+
+
+'''
+The stages of one run, in the order they first ran.
+
+    with profile.stage("intervals", unit="intervals") as stage:
+        intervals = build_offset_intervals(reader)
+        stage.items = sum(len(intervals[f]) for f in intervals)
+'''
+class Profile():
+    def __init__(self, stages=None):
+        self.stages = []
+        self.by_name = {}
+        for stage in stages or []:
+            self.add(stage)
+
+    @contextmanager
+    def stage(self, name, items=None, unit=None):
+        for hook in _hooks:
+            hook.start(name)
+        stage = Stage(name, unit)
+        stage.items, stage.calls = items, 1
+        wall, (cpu, _) = time.time(), resource_usage()
+        try:
+            yield stage
+        finally:
+            stage.wall = time.time() - wall
+            cpu_end, stage.peak_rss = resource_usage()
+            stage.cpu = cpu_end - cpu
+            self.add(stage)
+            for hook in _hooks:
+                hook.stop(stage)
+
+    # Merge a stage measured elsewhere (e.g., in a worker process)
+    def add(self, stage):
+        if stage.name not in self.by_name:
+            self.by_name[stage.name] = Stage(stage.name, stage.unit)
+            self.stages.append(self.by_name[stage.name])
+        self.by_name[stage.name].add(stage)
+
+    def table(self):
+        table = PrettyTable()
+        table.field_names = ['Stage', 'Wall (s)', 'CPU (s)', 'Peak RSS (MiB)', 'Items', 'Throughput (items/s)']
+        for stage in self.stages:
+            throughput = stage.throughput()
+            table.add_row([stage.name, "%.3f" %(stage.wall), "%.3f" %(stage.cpu),
+                           "-" if stage.peak_rss is None else "%.1f" %(stage.peak_rss),
+                           "-" if stage.items is None else "%d %s" %(stage.items, stage.unit or ""),
+                           "-" if throughput is None else "%.0f" %(throughput)])
+        return table
+
+    def to_json(self, path):
+        with open(path, "w") as f:
+            json.dump({"stages": [stage.to_dict() for stage in self.stages]}, f, indent=2)
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# encoding: utf-8
+import numpy as np
+
+"""
+Indexed record queries.
+
+    RecordIndex keeps, for the columns of one rank:
+        - the records in tstart order and the running maximum of their tend,
+          so the records overlapping a time window are found by two binary
+          searches (tstart < t1, and the first record whose running tend
+          reaches t0) plus a check of the records in between;
+        - inverted indexes from each function and each file to its records
+          (CSR: one argsort and one bincount, built on first use).
+
+    A query starts from the smallest candidate set among the criteria given
+    and checks the other criteria on those candidates only, so it never
+    scans a whole rank. The indexes are built per rank the first time a
+    query touches it (reader.indexes, like reader.columns).
+"""
+
+
+# Records of each key (0 <= key < num_keys): records[offsets[k]:offsets[k+1]], ascending
+class InvertedIndex():
+    def __init__(self, keys, num_keys):
+        self.records = np.argsort(keys, kind='stable')
+        self.offsets = np.concatenate([[0], np.cumsum(np.bincount(keys, minlength=num_keys))])
+
+    def valid(self, keys):
+        return np.unique(keys[(keys >= 0) & (keys < len(self.offsets) - 1)])
+
+    def count(self, keys):
+        keys = self.valid(keys)
+        return int(np.sum(self.offsets[keys+1] - self.offsets[keys]))
+
+    def lookup(self, keys):
+        parts = [self.records[self.offsets[k]:self.offsets[k+1]] for k in self.valid(keys).tolist()]
+        if len(parts) == 1:
+            return parts[0].copy()
+        return np.sort(np.concatenate(parts)) if parts else np.zeros(0, dtype=np.int64)
+
+
+class RecordIndex():
+    def __init__(self, columns):
+        self.columns = columns
+        tstart, tend = columns.tstart, columns.tend
+        self.order = None           # records are usually already in tstart order
+        if np.any(tstart[1:] < tstart[:-1]):
+            self.order = np.argsort(tstart, kind='stable')
+            tstart, tend = tstart[self.order], tend[self.order]
+        self.tstart = tstart
+        self.tend = tend
+        self.max_tend = np.maximum.accumulate(tend) if len(tend) else tend
+        self.funcs = None
+        self.files = None
+
+    # Positions (in tstart order) that may overlap [t0, t1), None for an open end
+    def window_range(self, t0, t1):
+        lo = 0 if t0 is None else int(np.searchsorted(self.max_tend, t0, 'left'))
+        hi = len(self.tstart) if t1 is None else int(np.searchsorted(self.tstart, t1, 'left'))
+        return lo, max(lo, hi)
+
+    # Records that overlap [t0, t1): tstart < t1 and tend > t0,
+    # a zero-length record counts if t0 <= tstart < t1
+    def window(self, t0, t1):
+        lo, hi = self.window_range(t0, t1)
+        positions = np.arange(lo, hi)
+        if t0 is not None:
+            positions = positions[(self.tend[lo:hi] > t0) | (self.tstart[lo:hi] >= t0)]
+        if self.order is None:
+            return positions
+        return np.sort(self.order[positions])
+
+    def function_index(self):
+        if self.funcs is None:
+            func_id = self.columns.func_id
+            self.funcs = InvertedIndex(func_id, int(func_id.max()) + 1 if len(func_id) else 0)
+        return self.funcs
+
+    # file ID -1 (no file) is not indexed
+    def file_index(self):
+        if self.files is None:
+            file_id = self.columns.file_id.astype(np.int64) + 1
+            self.files = InvertedIndex(file_id, int(file_id.max()) + 1 if len(file_id) else 0)
+        return self.files
+
+    # Records of this rank matching all the given criteria, ascending
+    # t0, t1: time window, see window(); func_ids, file_ids: integer arrays or None
+    def select(self, t0=None, t1=None, func_ids=None, file_ids=None):
+        # candidates of each criterion: (size, function returning them)
+        candidates = []
+        if t0 is not None or t1 is not None:
+            lo, hi = self.window_range(t0, t1)
+            candidates.append((hi - lo, lambda: self.window(t0, t1)))
+        if func_ids is not None:
+            candidates.append((self.function_index().count(func_ids), lambda: self.funcs.lookup(func_ids)))
+        if file_ids is not None:
+            candidates.append((self.file_index().count(file_ids + 1), lambda: self.files.lookup(file_ids + 1)))
+        if not candidates:
+            return np.arange(len(self.columns))
+
+        records = min(candidates, key=lambda candidate: candidate[0])[1]()
+        columns = self.columns
+        if t1 is not None:
+            records = records[columns.tstart[records] < t1]
+        if t0 is not None:
+            records = records[(columns.tend[records] > t0) | (columns.tstart[records] >= t0)]
+        if func_ids is not None:
+            records = records[np.isin(columns.func_id[records], func_ids)]
+        if file_ids is not None:
+            records = records[np.isin(columns.file_id[records], file_ids)]
+        return records
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# encoding: utf-8
+from ctypes import c_char, sizeof, addressof, _Pointer
+import numpy as np
+
+"""
+Columnar (structure of arrays) view of the trace records.
+
+    RecordColumns keeps one NumPy array per PyRecord field,
+    so analyses can work on whole ranks at once instead of
+    touching one ctypes record at a time.
+    The arguments are not part of the columns, use
+    reader.records[rank][i].args to access them. Only the filename
+    argument is kept, as an interned ID in the file_id column
+    (-1 if the record does not operate on a file).
+"""
+class RecordColumns():
+    fields = ("tstart", "tend", "func_id", "tid", "call_depth", "arg_count")
+    dtypes = (np.float64, np.float64, np.int32, np.int32, np.uint8, np.uint8)
+
+    def __init__(self, tstart, tend, func_id, tid, call_depth, arg_count, rank=None, file_id=None):
+        self.tstart     = tstart
+        self.tend       = tend
+        self.func_id    = func_id
+        self.tid        = tid
+        self.call_depth = call_depth
+        self.arg_count  = arg_count
+        self.rank       = rank          # only set for concatenated columns
+        self.file_id    = file_id       # index into reader.files
+
+    def __len__(self):
+        return len(self.tstart)
+
+    # Accepts anything NumPy accepts as an index (slice, mask, index array)
+    # and returns a new RecordColumns of the selected records
+    def __getitem__(self, index):
+        columns = [getattr(self, name)[index] for name in RecordColumns.fields]
+        rank = self.rank[index] if self.rank is not None else None
+        file_id = self.file_id[index] if self.file_id is not None else None
+        return RecordColumns(*columns, rank=rank, file_id=file_id)
+
+    @staticmethod
+    def empty():
+        columns = [np.zeros(0, dtype=t) for t in RecordColumns.dtypes]
+        return RecordColumns(*columns)
+
+
+# Build a NumPy structured dtype that matches the memory layout
+# of the ctypes record structure, so we can view the C array directly
+def record_dtype(record_type):
+    names, formats, offsets = [], [], []
+    for name, dtype in zip(RecordColumns.fields, RecordColumns.dtypes):
+        names.append(name)
+        formats.append(dtype)
+        offsets.append(getattr(record_type, name).offset)
+    return np.dtype({'names': names, 'formats': formats, 'offsets': offsets,
+                     'itemsize': sizeof(record_type)})
+
+
+def records_to_columns(records, count):
+    if count == 0:
+        return RecordColumns.empty()
+
+    # Records decoded by libreader: one contiguous C array per rank.
+    # View it as a structured array and copy out each field once.
+    if isinstance(records, _Pointer):
+        record_type = records._type_
+        buf = (c_char * (count * sizeof(record_type))).from_address(addressof(records.contents))
+        raw = np.frombuffer(buf, dtype=record_dtype(record_type), count=count)
+        columns = [np.ascontiguousarray(raw[name]) for name in RecordColumns.fields]
+        return RecordColumns(*columns)
+
+    # Any other sequence of record objects
+    columns = []
+    for name, dtype in zip(RecordColumns.fields, RecordColumns.dtypes):
+        columns.append(np.fromiter((getattr(records[i], name) for i in range(count)), dtype=dtype, count=count))
+    return RecordColumns(*columns)
+
+
+# Concatenate the per-rank columns into one RecordColumns with a rank column
+def concat_columns(columns_list, ranks=None):
+    if ranks is None:
+        ranks = range(len(columns_list))
+    columns = []
+    for name, dtype in zip(RecordColumns.fields, RecordColumns.dtypes):
+        parts = [getattr(c, name) for c in columns_list]
+        columns.append(np.concatenate(parts) if parts else np.zeros(0, dtype=dtype))
+    rank = [np.full(len(c), r, dtype=np.int32) for r, c in zip(ranks, columns_list)]
+    rank = np.concatenate(rank) if rank else np.zeros(0, dtype=np.int32)
+    file_id = None
+    if all(c.file_id is not None for c in columns_list):
+        file_id = np.concatenate([c.file_id for c in columns_list]) if columns_list else np.zeros(0, dtype=np.int32)
+    return RecordColumns(*columns, rank=rank, file_id=file_id)
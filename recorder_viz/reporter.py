@@ -2,6 +2,7 @@
 # encoding: utf-8
 from __future__ import absolute_import
 import math, os
+from functools import partial
 import numpy as np
 from bokeh.plotting import figure, output_file, show
 from bokeh.embed import components
@@ -13,6 +14,15 @@ from .creader_wrapper import RecorderReader
 from .html_writer import HTMLWriter
 from .build_offset_intervals import ignore_files
 from .build_offset_intervals import build_offset_intervals
+from .interval_arrays import as_interval_arrays
+from .func_stats import function_call_counts, function_call_times
+from .access_conflicts import summarize_conflicts
+from .section_scheduler import run_sections
+from .accumulators import accumulate, registered_accumulators
+from .profiling import Profile
+from .bandwidth import bandwidth_timeline, find_peaks
+from .size_histograms import size_histogram, human_size
+from .binning import busy_time, byte_density, rank_buckets, rgba_image, log_scale, to_bin_units
 
 
 
@@ -30,10 +40,10 @@ def record_counts(reader, htmlWriter):
     y = []
     for LM in reader.LMs:
         y.append(LM.total_records)
-    x = list(range(reader.GM.total_ranks))
+    x = list(reader.ranks)
     p = figure(x_axis_label="Rank", y_axis_label="Number of records", width=400, height=300)
     p.vbar(x=x, top=y, width=0.6)
-    script, div = components(p)
+    script, div = plot_components(p, htmlWriter)
     htmlWriter.recordCount = div+script
 
 # 1.1
@@ -45,12 +55,33 @@ def file_counts(reader, htmlWriter):
             if not ignore_files(filename):
                 num += 1
         y.append(num)
-    x = list(range(reader.GM.total_ranks))
+    x = list(reader.ranks)
     p = figure(x_axis_label="Rank", y_axis_label="Number of files accessed", width=400, height=300)
     p.vbar(x=x, top=y, width=0.6)
-    script, div = components(p)
+    script, div = plot_components(p, htmlWriter)
     htmlWriter.fileCount = div+script
 
+# Plot data is sent to the browser as typed binary arrays
+# (base64 NumPy buffers) instead of JSON lists
+def binary_array(values, single_precision=False):
+    array = np.asarray(values)
+    if array.dtype.kind not in "iufb":
+        return values           # e.g., factors and labels stay strings
+    if array.dtype.kind in "iu":
+        # bokeh can only send integers up to 32 bits as binary
+        fits = array.size == 0 or (array.min() >= np.iinfo(np.int32).min and array.max() <= np.iinfo(np.int32).max)
+        array = array.astype(np.int32 if fits else np.float64)
+    # lossy: float32 keeps about 7 significant digits
+    if single_precision and array.dtype == np.float64:
+        array = array.astype(np.float32)
+    return array
+
+# components() of a plot or layout, with the data of all its glyphs as binary arrays
+def plot_components(p, htmlWriter):
+    for source in p.select({"type": ColumnDataSource}):
+        source.data = dict([(name, binary_array(values, htmlWriter.single_precision)) for name, values in source.data.items()])
+    return components(p)
+
 # Helper for pie charts in 2.
 # where x is a dict with keys as categories
 def pie_chart(x):
@@ -72,19 +103,17 @@ def pie_chart(x):
 
 # 2.1
 def function_layers(reader, htmlWriter):
-    func_list = reader.funcs
-    x = {'hdf5':0, 'mpi':0, 'posix':0 }
+    categories = reader.categories
+    aggregate = np.zeros(len(reader.funcs))
     for LM in reader.LMs:
-        for func_id in range(len(func_list)):
-            count = LM.function_count[func_id]
-            if count <= 0: continue
-            if "H5" in func_list[func_id]:
-                x['hdf5'] += count
-            elif "MPI" in func_list[func_id]:
-                x['mpi'] += count
-            else:
-                x['posix'] += count
-    script, div = components(pie_chart(x))
+        aggregate += np.array(LM.function_count)
+
+    is_hdf5 = categories.is_hdf5[:-1]
+    is_mpi = categories.is_mpi[:-1] & ~is_hdf5
+    x = {'hdf5': int(aggregate[is_hdf5].sum()),
+         'mpi': int(aggregate[is_mpi].sum()),
+         'posix': int(aggregate[~is_hdf5 & ~is_mpi].sum()) }
+    script, div = plot_components(pie_chart(x), htmlWriter)
     htmlWriter.functionLayers = script+div
 
 # 2.2
@@ -92,10 +121,11 @@ def function_patterns(all_intervals, htmlWriter):
     # 1,2,3 - consecutive
     # 1,3,9 - sequential
     # 1,3,2 - random
+    all_intervals = as_interval_arrays(all_intervals)
     x = {'consecutive':0, 'sequential':0, 'random':0}
     for filename in all_intervals.keys():
         if ignore_files(filename): continue
-        intervals = sorted(all_intervals[filename], key=lambda x: x[1])   # sort by tstart
+        intervals = sort_intervals(all_intervals[filename], "tstart")
         '''
         This code consider each rank separately
         lastOffsets = [0] * reader.globalMetadata.numRanks
@@ -111,424 +141,588 @@ def function_patterns(all_intervals, htmlWriter):
                 x['random'] += 1
             lastOffsets[rank] = offset + count
         '''
-        for i in range(len(intervals)-1):
-            i1, i2 = intervals[i], intervals[i+1]
-            offset1, count1 = i1[3], i1[4]
-            offset2, count2 = i2[3], i2[4]
-
-            if (offset1 + count1) == offset2:
-                x['consecutive'] += 1
-            elif (offset1 + count1) < offset2:
-                x['sequential'] += 1
-            else:
-                x['random'] += 1
-        total = x['consecutive'] + x['sequential'] + x['random']
+        # compare each interval with the next one
+        end1 = intervals.data["offset"][:-1] + intervals.data["count"][:-1]
+        offset2 = intervals.data["offset"][1:]
+        x['consecutive'] += int(np.sum(end1 == offset2))
+        x['sequential'] += int(np.sum(end1 < offset2))
+        x['random'] += int(np.sum(end1 > offset2))
     #print("consecutive:",  x['consecutive'] )
     #print("sequential:",  x['sequential'] )
     #print("random:",  x['random'])
 
-    script, div = components(pie_chart(x))
+    script, div = plot_components(pie_chart(x), htmlWriter)
     htmlWriter.functionPatterns = script+div
 
-# 2.3
-def function_counts(reader, htmlWriter):
-    func_list = reader.funcs
-    aggregate = np.zeros(2162)
-    for LM in reader.LMs:
-        aggregate += np.array(LM.function_count)
-
-    funcnames, counts = np.array([]), np.array([])
-    for i in range(len(aggregate)):
-        if aggregate[i] > 0:
-            funcnames = np.append(funcnames, func_list[i].replace("PMPI", "MPI"))
-            counts = np.append(counts, aggregate[i])
+# Helper for 2.3
+# Functions with a non-zero total, sorted by the total in descending order
+def nonzero_functions(func_list, totals):
+    index = np.flatnonzero(totals > 0)
+    index = index[np.argsort(totals[index], kind='stable')[::-1]]
+    return [func_list[i] for i in index], totals[index]
 
-    index = np.argsort(counts)[::-1]
-    counts = counts[index]
-    # This converts float array to str array, a fix needed for python3/and latest bokeh
-    counts = [str(c) for c in counts]
-    funcnames = funcnames[index]
+# 2.3
+# stats: results of accumulate(), computed here if not given
+def function_counts(reader, htmlWriter, stats=None):
+    counts = stats["function_counts"] if stats else function_call_counts(reader)
+    funcnames, counts = nonzero_functions(reader.funcs, counts)
+    funcnames = [func.replace("PMPI", "MPI") for func in funcnames]
+    labels = [str(c) for c in counts.tolist()]
 
     p = figure(x_axis_label="Count", x_axis_type="log", y_axis_label="Function", y_range=funcnames)
     p.hbar(y=funcnames, right=counts, height=0.8, left=1)
     labels = LabelSet(x='x', y='y', text='z', x_offset=0, y_offset=-8, text_font_size="10pt",
-                source=ColumnDataSource(dict(x=counts, y=funcnames, z=counts)))
+                source=ColumnDataSource(dict(x=counts, y=funcnames, z=labels)))
     p.add_layout(labels)
 
-    script, div = components(p)
+    script, div = plot_components(p, htmlWriter)
     htmlWriter.functionCount = div + script
 
-def function_times(reader, htmlWriter):
-    func_list = reader.funcs
-
-    aggregate = np.zeros(2162)
-    for rank in range(reader.GM.total_ranks):
-        records = reader.records[rank]
-        for i in range(reader.LMs[rank].total_records):
-            record = records[i]
-
-            # ignore user functions
-            if record.func_id >= len(func_list): continue
-
-            aggregate[record.func_id] += (record.tend - record.tstart)
-
-    funcnames, times = np.array([]), np.array([])
-
-    for i in range(len(aggregate)):
-        if aggregate[i] > 0:
-            funcnames = np.append(funcnames, func_list[i])
-            times = np.append(times, aggregate[i])
-
-    index = np.argsort(times)[::-1]
-    times = times[index]
-    times = [str(t) for t in times]
-    funcnames = funcnames[index]
+def function_times(reader, htmlWriter, stats=None):
+    times = stats["function_times"] if stats else function_call_times(reader)
+    funcnames, times = nonzero_functions(reader.funcs, times)
+    labels = [str(t) for t in times.tolist()]
 
     p = figure(x_axis_label="Spent Time (Seconds)", y_axis_label="Function", y_range=funcnames)
     p.hbar(y=funcnames, right=times, height=0.8, left=0)
-    labels = LabelSet(x='x', y='y', text='x', x_offset=0, y_offset=-8, text_font_size="10pt",
-                source=ColumnDataSource(dict(x=times, y=funcnames)))
+    labels = LabelSet(x='x', y='y', text='z', x_offset=0, y_offset=-8, text_font_size="10pt",
+                source=ColumnDataSource(dict(x=times, y=funcnames, z=labels)))
     p.add_layout(labels)
 
-    script, div = components(p)
+    script, div = plot_components(p, htmlWriter)
     htmlWriter.functionTimes = div + script
 
 
-# 3.1
-def overall_io_activities(reader, htmlWriter):
-
-    func_list = reader.funcs
-    nan = float('nan')
-
-    def io_activity(rank):
-        x_read, x_write, y_read, y_write = [], [], [], []
-
-        for i in range(reader.LMs[rank].total_records):
-            record = reader.records[rank][i]
-
-            # ignore user functions
-            if record.func_id >= len(func_list): continue
-
-            funcname = func_list[record.func_id]
-            if "MPI" in funcname or "H5" in funcname: continue
-            if "dir" in funcname: continue
+# Above this many read/write calls (3.1) or intervals of a file (3.2, 3.3),
+# the plots are drawn as binned images instead of one line per call
+BINNED_THRESHOLD = 200000
+# (x bins, y bins) of the binned image of 3.1
+BINNED_RESOLUTION = (1000, 512)
+# (x bins, y bins) of the per-file binned images of 3.2 and 3.3, about one bin per pixel
+FILE_BINNED_RESOLUTION = (200, 150)
 
-            if "write" in funcname or "fprintf" in funcname:
-                x_write.append(record.tstart)
-                x_write.append(record.tend)
-                x_write.append(nan)
-            if "read" in funcname:
-                x_read.append(record.tstart)
-                x_read.append(record.tend)
-                x_read.append(nan)
-
-        if(len(x_write)>0): x_write = x_write[0: len(x_write)-1]
-        if(len(x_read)>0): x_read = x_read[0: len(x_read)-1]
+# 3.1
+def overall_io_activities(reader, htmlWriter, binned=None, resolution=BINNED_RESOLUTION, stats=None):
 
-        y_write = [rank] * len(x_write)
-        y_read = [rank] * len(x_read)
+    categories = reader.categories
 
-        return x_read, x_write, y_read, y_write
+    # (tstart, tend, nan) for each call, without the last nan
+    def segments(span):
+        x = np.empty((len(span[0]), 3))
+        x[:, 0], x[:, 1], x[:, 2] = span[0], span[1], np.nan
+        return x.ravel()[:-1]
 
+    # (tstart, tend) of the read calls and of the write calls of a rank
+    def io_activity(rank):
+        if stats:
+            return stats["activity_spans"][rank]
+        columns = reader.columns[rank]
+        func_index = categories.index(columns.func_id)
+        return tuple([(columns.tstart[mask], columns.tend[mask])
+                      for mask in (categories.is_read[func_index], categories.is_write[func_index])])
+
+    # (tstart, tend, rank) of the calls of all ranks
+    def concat_spans(spans):
+        ranks = np.repeat(reader.ranks, [len(span[0]) for span in spans])
+        return np.concatenate([span[0] for span in spans]), np.concatenate([span[1] for span in spans]), ranks
+
+    # Busy fraction of each (rank bucket, time bucket), drawn as one image
+    def io_activity_image(p, reads, writes):
+        reads, writes = concat_spans(reads), concat_spans(writes)
+        t0 = min(np.min(c[0]) for c in (reads, writes) if len(c[0]))
+        t1 = max(np.max(c[1]) for c in (reads, writes) if len(c[0]))
+        rank_min, rank_max = reader.ranks[0], reader.ranks[-1]
+        num_bins, num_rows = resolution[0], min(resolution[1], rank_max - rank_min + 1)
+
+        ranks_per_row = np.bincount(rank_buckets(reader.ranks, rank_min, rank_max, num_rows), minlength=num_rows)
+        capacity = np.maximum(ranks_per_row, 1)[:, None] * ((t1 - t0) / num_bins if t1 > t0 else 1.0)
+        fractions = []
+        for tstart, tend, ranks in (writes, reads):
+            rows = rank_buckets(ranks, rank_min, rank_max, num_rows)
+            fractions.append(busy_time(tstart, tend, rows, num_rows, t0, t1, num_bins) / capacity)
+
+        p.image_rgba(image=[rgba_image(*fractions)], x=t0, y=rank_min-0.5,
+                     dw=max(t1-t0, 1e-9), dh=rank_max-rank_min+1)
+        # legend only
+        p.line([], [], line_color='red', line_width=20, legend_label="write")
+        p.line([], [], line_color='blue', line_width=20, legend_label="read")
+
+    reads, writes = [], []
+    for rank in reader.ranks:
+        read, write = io_activity(rank)
+        reads.append(read)
+        writes.append(write)
+    num_calls = sum([len(span[0]) for span in reads + writes])
+    if binned is None:
+        binned = num_calls > BINNED_THRESHOLD
 
     p = figure(x_axis_label="Time", y_axis_label="Rank", width=600, height=400)
-    for rank in range(reader.GM.total_ranks):
-        x_read, x_write, y_read, y_write = io_activity(rank)
-        p.line(x_write, y_write, line_color='red', line_width=20, alpha=1.0, legend_label="write")
-        p.line(x_read, y_read, line_color='blue', line_width=20, alpha=1.0, legend_label="read")
+    if binned and num_calls > 0:
+        io_activity_image(p, reads, writes)
+    else:
+        for rank, read, write in zip(reader.ranks, reads, writes):
+            x_write, x_read = segments(write), segments(read)
+            p.line(x_write, np.full(len(x_write), rank), line_color='red', line_width=20, alpha=1.0, legend_label="write")
+            p.line(x_read, np.full(len(x_read), rank), line_color='blue', line_width=20, alpha=1.0, legend_label="read")
 
     p.legend.location = "top_left"
-    script, div = components(p)
+    script, div = plot_components(p, htmlWriter)
     htmlWriter.overallIOActivities = div + script
 
+# Helpers for 3.2 and 3.3
+# Stable sort of one file's intervals by one of the interval_dtype fields
+def sort_intervals(intervals, field):
+    return intervals.take(np.argsort(intervals.data[field], kind='stable'))
+
+# Line vertices of one file's read or write intervals,
+# three vertices per interval (the third one separates the lines), without the last one
+def interval_lines(xs, ys):
+    if len(xs[0]) == 0:
+        return np.zeros(0), np.zeros(0)
+    return np.column_stack(xs).ravel()[:-1], np.column_stack(ys).ravel()[:-1]
+
+# Bytes accessed per (x bin, offset bin) of one file, drawn as one image.
+# x is the x coordinate of each interval, mapped to num_x bins over [x_lo, x_hi]
+def offset_density_image(p, data, x, x_lo, x_hi, num_x):
+    lo, hi = int(data["offset"].min()), int((data["offset"] + data["count"]).max())
+    num_y = FILE_BINNED_RESOLUTION[1]
+    columns = np.minimum(to_bin_units(x, x_lo, x_hi, num_x)[0].astype(np.int64), num_x-1)
+    images = []
+    for mask in (~data["is_read"], data["is_read"]):
+        density = byte_density(data["offset"][mask], data["count"][mask], columns[mask], num_x, lo, hi, num_y)
+        images.append(log_scale(density.T))
+    p.image_rgba(image=[rgba_image(*images)], x=x_lo, y=lo, dw=max(x_hi-x_lo, 1e-9), dh=max(hi-lo, 1))
+    # legend only
+    p.line([], [], line_color='blue', line_width=5, legend_label="read")
+    p.line([], [], line_color='red', line_width=5, legend_label="write")
+
+def plotted_files(intervals):
+    files = []
+    for filename in intervals:
+        if ignore_files(filename): continue
+        if 'junk' in filename and int(filename.split('junk.')[-1]) > 0: continue    # NWChem
+        if 'pout' in filename and int(filename.split('pout.')[-1]) > 0: continue    # Chombo
+        if len(files) < 16 and (len(intervals[filename]) > 0): # only show 12 files at most
+            files.append(filename)
+    return files
+
 #3.2
-def offset_vs_rank(intervals, htmlWriter):
+def offset_vs_rank(intervals, htmlWriter, binned=None):
     # interval = [rank, tstart, tend, offset, count]
     def plot_for_one_file(filename, intervals):
-        intervals = sorted(intervals, key=lambda x: x[3])   # sort by starting offset
-        x_read, y_read, x_write, y_write, nan = [], [], [], [], float('nan')
-        for interval in intervals:
-            rank, offset, count, isRead = interval[0], interval[3], interval[4], interval[5]
-            if isRead:
-                x_read += [rank, rank, rank]
-                y_read += [offset, offset+count, nan]
-            else:
-                x_write += [rank, rank, rank]
-                y_write += [offset, offset+count, nan]
+        if binned or (binned is None and len(intervals) > BINNED_THRESHOLD):
+            p = figure(title=filename.split("/")[-1], x_axis_label="Rank", y_axis_label="Offset")
+            data = intervals.data
+            rank_min, rank_max = int(data["rank"].min()), int(data["rank"].max())
+            num_x = min(FILE_BINNED_RESOLUTION[0], rank_max - rank_min + 1)
+            offset_density_image(p, data, data["rank"], rank_min-0.5, rank_max+0.5, num_x)
+            return p
+
+        data = sort_intervals(intervals, "offset").data   # sort by starting offset
+        nan = float('nan')
+        read, write = data[data["is_read"]], data[~data["is_read"]]
+        x_read, y_read = interval_lines([read["rank"]]*3, [read["offset"], read["offset"]+read["count"], np.full(len(read), nan)])
+        x_write, y_write = interval_lines([write["rank"]]*3, [write["offset"], write["offset"]+write["count"], np.full(len(write), nan)])
 
-        if len(x_read) > 0 : x_read = x_read[0:len(x_read)-1]
-        if len(y_read) > 0 : y_read = y_read[0:len(y_read)-1]
-        if len(x_write) > 0 : x_write = x_write[0:len(x_write)-1]
-        if len(y_write) > 0 : y_write = y_write[0:len(y_write)-1]
         p = figure(title=filename.split("/")[-1], x_axis_label="Rank", y_axis_label="Offset")
         p.line(x_read, y_read, line_color='blue', line_width=5, alpha=1.0, legend_label="read")
         p.line(x_write, y_write, line_color='red', line_width=5, alpha=1.0, legend_label="write")
         return p
 
+    intervals = as_interval_arrays(intervals)
     plots = []
-    idx = 0
-    for filename in intervals:
-        if ignore_files(filename): continue
-        if 'junk' in filename and int(filename.split('junk.')[-1]) > 0: continue    # NWChem
-        if 'pout' in filename and int(filename.split('pout.')[-1]) > 0: continue    # Chombo
-        if idx < 16 and (len(intervals[filename]) > 0): # only show 12 files at most
-            p = plot_for_one_file(filename, intervals[filename])
-            plots.append(p)
-            idx += 1
+    for filename in plotted_files(intervals):
+        plots.append(plot_for_one_file(filename, intervals[filename]))
 
     from bokeh.layouts import gridplot
-    script, div = components(gridplot(plots, ncols=3, width=400, height=300))
+    script, div = plot_components(gridplot(plots, ncols=3, width=400, height=300), htmlWriter)
     htmlWriter.offsetVsRank = script+div
 
 # 3.3
-def offset_vs_time(intervals, htmlWriter):
+def offset_vs_time(intervals, htmlWriter, binned=None):
     # interval = [rank, tstart, tend, offset, count]
     def plot_for_one_file(filename, intervals):
-        intervals = sorted(intervals, key=lambda x: x[1])   # sort by tstart
-        x_read, y_read, x_write, y_write, nan = [], [], [], [], float('nan')
-        for interval in intervals:
-            tstart, tend, offset, count, isRead = interval[1], interval[2], interval[3], interval[4], interval[5]
-            if isRead:
-                x_read += [tstart, tend, nan]
-                y_read += [offset, offset+count, offset+count]
-            else:
-                x_write += [tstart, tend, nan]
-                y_write += [offset, offset+count, offset+count]
+        if binned or (binned is None and len(intervals) > BINNED_THRESHOLD):
+            p = figure(title=filename.split("/")[-1], x_axis_label="Time", y_axis_label="Offset")
+            data = intervals.data
+            middle = (data["tstart"] + data["tend"]) / 2
+            offset_density_image(p, data, middle, data["tstart"].min(), data["tend"].max(), FILE_BINNED_RESOLUTION[0])
+            return p
+
+        data = sort_intervals(intervals, "tstart").data   # sort by tstart
+        nan = float('nan')
+        read, write = data[data["is_read"]], data[~data["is_read"]]
+        x_read, y_read = interval_lines([read["tstart"], read["tend"], np.full(len(read), nan)],
+                                        [read["offset"], read["offset"]+read["count"], read["offset"]+read["count"]])
+        x_write, y_write = interval_lines([write["tstart"], write["tend"], np.full(len(write), nan)],
+                                          [write["offset"], write["offset"]+write["count"], write["offset"]+write["count"]])
 
-        if len(x_read) > 0 : x_read = x_read[0:len(x_read)-1]
-        if len(y_read) > 0 : y_read = y_read[0:len(y_read)-1]
-        if len(x_write) > 0 : x_write = x_write[0:len(x_write)-1]
-        if len(y_write) > 0 : y_write = y_write[0:len(y_write)-1]
         p = figure(title=filename.split("/")[-1], x_axis_label="Time", y_axis_label="Offset")
         p.line(x_read, y_read, line_color='blue', line_width=2, alpha=1.0, legend_label="read")
         p.line(x_write, y_write, line_color='red', line_width=2, alpha=1.0, legend_label="write")
         return p
 
-
+    intervals = as_interval_arrays(intervals)
     plots = []
-    idx = 0
-    for filename in intervals:
-        if ignore_files(filename): continue
-        if 'junk' in filename and int(filename.split('junk.')[-1]) > 0: continue    # NWChem
-        if 'pout' in filename and int(filename.split('pout.')[-1]) > 0: continue    # Chombo
-        if idx < 16 and (len(intervals[filename]) > 0): # only show 12 files at most
-            p = plot_for_one_file(filename, intervals[filename])
-            plots.append(p)
-            idx += 1
+    for filename in plotted_files(intervals):
+        plots.append(plot_for_one_file(filename, intervals[filename]))
 
     from bokeh.layouts import gridplot
-    script, div = components(gridplot(plots, ncols=3, width=400, height=300))
+    script, div = plot_components(gridplot(plots, ncols=3, width=400, height=300), htmlWriter)
     htmlWriter.offsetVsTime = script+div
 
 # 3.4
 def file_access_patterns(intervals, htmlWriter):
-
-    def pattern_for_one_file(filename, intervals):
-        pattern = {"RAR": {'S':0, 'D':0}, "RAW": {'S':0, 'D':0},
-                    "WAW": {'S':0, 'D':0}, "WAR": {'S':0, 'D':0}}
-        intervals = sorted(intervals, key=lambda x: x[3])   # sort by starting offset
-        for i in range(len(intervals)-1):
-            i1, i2 = intervals[i], intervals[i+1]
-            tstart1, offset1, count1, segments1 = i1[1], i1[3], i1[4], i1[6]
-            tstart2, offset2, count2, segments2 = i2[1], i2[3], i2[4], i2[6]
-
-            # no overlapping
-            if offset1+count1 <= offset2:
-                continue
-            if len(segments1) == 0 or len(segments2) ==0:
-                #print("Without a session? ", filename, i1, i2)
-                continue
-            # has overlapping but may not conflicting
-            # if segments1 intersets segments2, and
-            # one of the common segments is the local session
-            # then there's a conflict
-            if not (segments1[0] in segments2 or segments2[0] in segments1):
-                continue
-
-            isRead1 = i1[5] if tstart1 < tstart2 else i2[5]
-            isRead2 = i2[5] if tstart2 > tstart1 else i1[5]
-            rank1 = i1[0] if tstart1 < tstart2 else i2[0]
-            rank2 = i2[0] if tstart2 > tstart1 else i1[0]
-
-            #print(filename, i1, i2)
-            # overlap
-            if isRead1 and isRead2:             # RAR
-                if rank1 == rank2: pattern['RAR']['S'] += 1
-                else: pattern['RAR']['D'] += 1
-            if isRead1 and not isRead2:         # WAR
-                if rank1 == rank2: pattern['WAR']['S'] += 1
-                else: pattern['WAR']['D'] += 1
-            if not isRead1 and not isRead2:     # WAW
-                if rank1 == rank2: pattern['WAW']['S'] += 1
-                else: pattern['WAW']['D'] += 1
-            if not isRead1 and isRead2:         # RAW
-                if rank1 == rank2: pattern['RAW']['S'] += 1
-                else: pattern['RAW']['D'] += 1
-        # debug info
-        if pattern['RAW']['S']: print("RAW-S", pattern['RAW']['S'], filename)
-        if pattern['RAW']['D']: print("RAW-D", pattern['RAW']['D'], filename)
-        if pattern['WAW']['S']: print("WAW-S", pattern['WAW']['S'], filename)
-        if pattern['WAW']['D']: print("WAW-D", pattern['WAW']['D'], filename)
-        if pattern['WAR']['S']: print("WAR-S", pattern['WAR']['S'], filename)
-        if pattern['WAR']['D']: print("WAR-D", pattern['WAR']['D'], filename)
-        return pattern
-
     table = PrettyTable()
     table.field_names = ['Filename', 'RAR(Same Rank)', 'RAW(Same Rank)', 'WAW(Same Rank)', 'WAR(Same Rank)', \
-            'RAR(Different Rank)', 'RAW(Different Rank)', 'WAW(Different Rank)', 'WAR(Different Rank)']
+            'RAR(Different Rank)', 'RAW(Different Rank)', 'WAW(Different Rank)', 'WAR(Different Rank)', \
+            'Conflicting Bytes']
+    intervals = as_interval_arrays(intervals)
     for filename in intervals.keys():
         if not ignore_files(filename):
-            pattern = pattern_for_one_file(filename, intervals[filename])
+            summary = summarize_conflicts(intervals[filename])
+            pattern = summary.counts
             table.add_row([filename,    \
                 pattern['RAR']['S'], pattern['RAW']['S'], pattern['WAW']['S'], pattern['WAR']['S'], \
-                pattern['RAR']['D'], pattern['RAW']['D'], pattern['WAW']['D'], pattern['WAR']['D']])
+                pattern['RAR']['D'], pattern['RAW']['D'], pattern['WAW']['D'], pattern['WAR']['D'], \
+                summary.bytes()])
     htmlWriter.fileAccessPatterns = table.get_html_string()
 
 # 4
 def io_sizes(intervals, htmlWriter, read=True):
 
-    sizes = {}
-    for filename in intervals:
-        if ignore_files(filename): continue
-        for interval in intervals[filename]:
-            io_size , isRead = interval[4], interval[5]
-            if read != isRead: continue
-            if io_size not in sizes: sizes[io_size] = 0
-            sizes[io_size] += 1
-
-
-    xs = sorted(sizes.keys())
-    ys = [ str(sizes[x]) for x in xs ]
-    xs = [ str(x) for x in xs ]
-
-    p = figure(x_range=xs, x_axis_label="IO Size", y_axis_label="Count", y_axis_type='log', width=500 if not read else 400, height=350)
+    intervals = as_interval_arrays(intervals)
+    intervals = dict([(filename, intervals[filename]) for filename in intervals if not ignore_files(filename)])
+    job = size_histogram(intervals, read=read)
+    per_file = size_histogram(intervals, read=read, by="file")
+
+    # power-of-two buckets, from the smallest to the largest used one
+    used = np.flatnonzero(job.counts[0])
+    used = np.arange(used[0], used[-1]+1) if len(used) else used
+    xs = [job.labels()[bucket] for bucket in used]     # categorical axis
+    ys = job.counts[0][used]
+
+    title = "p50 %s, p90 %s, p99 %s, %.1f%% of bytes in requests < %s" %(
+            human_size(job.percentiles[50][0]), human_size(job.percentiles[90][0]), human_size(job.percentiles[99][0]),
+            100 * job.small_share[0], human_size(job.small))
+    p = figure(x_range=xs, title=title, x_axis_label="IO Size (bytes)", y_axis_label="Count", y_axis_type='log',
+               width=500 if not read else 400, height=350)
     p.vbar(x=xs, top=ys, width=0.6, bottom=1)
     p.xaxis.major_label_orientation = math.pi/2
 
-    labels = LabelSet(x='x', y='y', text='y', x_offset=-10, y_offset=0, text_font_size="10pt",
-                source=ColumnDataSource(dict(x=xs ,y=ys)))
+    labels = LabelSet(x='x', y='y', text='z', x_offset=-10, y_offset=0, text_font_size="10pt",
+                source=ColumnDataSource(dict(x=xs, y=ys, z=[str(y) for y in ys.tolist()])))
     p.add_layout(labels)
 
-    script, div = components(p)
+    table = PrettyTable()
+    table.field_names = ['Filename', 'Requests', 'p50', 'p90', 'p99', 'Small-I/O bytes (%)']
+    for i, filename in enumerate(per_file.keys):
+        if per_file.counts[i].sum() == 0: continue
+        table.add_row([filename, int(per_file.counts[i].sum()), human_size(per_file.percentiles[50][i]),
+                       human_size(per_file.percentiles[90][i]), human_size(per_file.percentiles[99][i]),
+                       "%.1f" %(100 * per_file.small_share[i])])
+
+    script, div = plot_components(p, htmlWriter)
     if read:
-        htmlWriter.readIOSizes = div + script
+        htmlWriter.readIOSizes = div + script + table.get_html_string()
     else:
-        htmlWriter.writeIOSizes = div + script
+        htmlWriter.writeIOSizes = div + script + table.get_html_string()
 
 # 4.1
-def io_statistics(reader, intervals, htmlWriter):
+def io_statistics(reader, intervals, htmlWriter, stats=None):
+    # All sums are keyed by file ID, reader.files[fileID] is the filename
     sum_write_size = {}
     sum_write_time = {}
     sum_read_size = {}
     sum_read_time = {}
-    sum_meta_time = {}
 
+    intervals = as_interval_arrays(intervals)
     for filename in intervals:
         if ignore_files(filename): continue
+        fileID = reader.files.get(filename)
 
-        sum_write_size[filename] = 0
-        sum_write_time[filename] = 0
-        sum_read_size[filename]  = 0
-        sum_read_time[filename]  = 0
-        sum_meta_time[filename]  = 0
-
-        for interval in intervals[filename]:
-            io_size , is_read = interval[4], interval[5]
-            duration = float(interval[2]) - float(interval[1])
-
-            if is_read:
-                sum_read_size[filename]  += io_size
-                sum_read_time[filename]  += duration
-            else:
-                sum_write_size[filename] += io_size
-                sum_write_time[filename] += duration
-
-    for rank in range(reader.GM.total_ranks):
-        records = reader.records[rank]
-
-        # ignore user functions
-
-        for i in range(reader.LMs[rank].total_records):
-            record = records[i]
-
-            if record.func_id >= len(reader.funcs): continue
-            func = reader.funcs[record.func_id]
+        data = intervals[filename].data
+        duration = data["tend"] - data["tstart"]
+        is_read = data["is_read"]
 
-            if "dir" in func or "MPI" in func or "H5" in func: continue
-            if "open" in func or "close" in func or "sync" in func or "seek" in func:
-                filename = record.args[0]
-                if filename in sum_write_size.keys():
-                    sum_meta_time[filename] += record.tend - record.tstart
+        sum_read_size[fileID]  = int(data["count"][is_read].sum())
+        sum_read_time[fileID]  = float(duration[is_read].sum())
+        sum_write_size[fileID] = int(data["count"][~is_read].sum())
+        sum_write_time[fileID] = float(duration[~is_read].sum())
 
+    # Time of the POSIX open/close/sync/seek calls on each file
+    if not stats:
+        stats = accumulate(reader, ["metadata_times"])
+    sum_meta_time = stats["metadata_times"]
 
     table = PrettyTable()
     table.field_names = ['Filename', 'Bytes written', 'Write time (s)', 'Write Bandwidth (MB/s)', \
                          'Bytes read', 'Read time (s)', 'Read Bandwidth (MB/s)', 'Metadata time (s)']
-    for filename in sum_write_size:
+    for fileID in sum_write_size:
         write_bw = 0
-        if sum_write_size[filename] != 0 and sum_write_time[filename] != 0:
-            write_bw = sum_write_size[filename]/sum_write_time[filename]/(1024*1024)
+        if sum_write_size[fileID] != 0 and sum_write_time[fileID] != 0:
+            write_bw = sum_write_size[fileID]/sum_write_time[fileID]/(1024*1024)
         read_bw  = 0
-        if sum_read_size[filename] != 0 and sum_read_time[filename] != 0:
-            read_bw = sum_read_size[filename]/sum_read_time[filename]/(1024*1024)
+        if sum_read_size[fileID] != 0 and sum_read_time[fileID] != 0:
+            read_bw = sum_read_size[fileID]/sum_read_time[fileID]/(1024*1024)
 
-        table.add_row([filename, sum_write_size[filename], sum_write_time[filename], write_bw,
-                                sum_read_size[filename], sum_read_time[filename], read_bw, sum_meta_time[filename]])
+        table.add_row([reader.files[fileID], sum_write_size[fileID], sum_write_time[fileID], write_bw,
+                                sum_read_size[fileID], sum_read_time[fileID], read_bw, sum_meta_time[fileID]])
 
     print(table)
     htmlWriter.perFileIOStatistics = table.get_html_string()
 
 
-def generate_report(reader, output_path):
+# 4.2
+def bandwidth_over_time(intervals, htmlWriter, num_windows=200):
+    intervals = as_interval_arrays(intervals)
+    intervals = dict([(filename, intervals[filename]) for filename in intervals if not ignore_files(filename)])
+    timeline = bandwidth_timeline(intervals, num_windows=num_windows)
+
+    MB = 1024.0 * 1024.0
+    x = timeline.times()
+    p = figure(x_axis_label="Time", y_axis_label="Bandwidth (MB/s)", width=600, height=300)
+    if len(x) > 0:
+        total = timeline.total()[0]
+        p.line(x, timeline.write[0]/MB, line_color='red', line_width=2, legend_label="write")
+        p.line(x, timeline.read[0]/MB, line_color='blue', line_width=2, legend_label="read")
+        peaks = find_peaks(total)
+        p.scatter(x[peaks], total[peaks]/MB, size=8, color='black', marker='triangle', legend_label="peak (read+write)")
+        p.legend.location = "top_left"
+
+    script, div = plot_components(p, htmlWriter)
+    htmlWriter.bandwidthTimeline = div + script
+
+
+# Report sections, in report order:
+# (name, HTMLWriter attributes it sets, data it needs, accumulators it needs, function(data, htmlWriter))
+# data holds the reader, the report options and the entries of REPORT_DATA; "stats" only
+# runs the accumulators of the selected sections (data["accumulators"])
+REPORT_SECTIONS = [
+    ("record_counts",         ("recordCount",),                     (),                     (),                    lambda d, w: record_counts(d["reader"], w)),
+    ("file_counts",           ("fileCount", "fileAccessModeTable"), (),                     (),                    lambda d, w: file_counts(d["reader"], w)),
+    ("function_layers",       ("functionLayers",),                  (),                     (),                    lambda d, w: function_layers(d["reader"], w)),
+    ("function_patterns",     ("functionPatterns",),                ("intervals",),         (),                    lambda d, w: function_patterns(d["intervals"], w)),
+    ("function_counts",       ("functionCount",),                   ("stats",),             ("function_counts",),  lambda d, w: function_counts(d["reader"], w, d["stats"])),
+    ("function_times",        ("functionTimes",),                   ("stats",),             ("function_times",),   lambda d, w: function_times(d["reader"], w, d["stats"])),
+    ("overall_io_activities", ("overallIOActivities",),             ("stats",),             ("activity_spans",),   lambda d, w: overall_io_activities(d["reader"], w, d["binned"], d["resolution"], d["stats"])),
+    ("offset_vs_time",        ("offsetVsTime",),                    ("intervals",),         (),                    lambda d, w: offset_vs_time(d["intervals"], w, d["binned"])),
+    ("offset_vs_rank",        ("offsetVsRank",),                    ("intervals",),         (),                    lambda d, w: offset_vs_rank(d["intervals"], w, d["binned"])),
+    ("file_access_patterns",  ("fileAccessPatterns",),              ("intervals",),         (),                    lambda d, w: file_access_patterns(d["intervals"], w)),
+    ("io_statistics",         ("perFileIOStatistics",),             ("intervals", "stats"), ("metadata_times",),   lambda d, w: io_statistics(d["reader"], d["intervals"], w, d["stats"])),
+    ("bandwidth_over_time",   ("bandwidthTimeline",),               ("intervals",),         (),                    lambda d, w: bandwidth_over_time(d["intervals"], w)),
+    ("read_io_sizes",         ("readIOSizes",),                     ("intervals",),         (),                    lambda d, w: io_sizes(d["intervals"], w, read=True)),
+    ("write_io_sizes",        ("writeIOSizes",),                    ("intervals",),         (),                    lambda d, w: io_sizes(d["intervals"], w, read=False)),
+]
+
+# Data shared by several sections, only built if a selected section needs it:
+# name: (data it needs, function(data))
+REPORT_DATA = {
+    "intervals":    ((), lambda d: build_offset_intervals(d["reader"], workers=d["workers"], as_arrays=True)),
+    "stats":        ((), lambda d: accumulate(d["reader"], d["accumulators"])),     # one pass over the records
+}
+
+
+# Names of the sections to run, in report order.
+# sections: names to run (None for all), skip: names to leave out
+def select_sections(sections=None, skip=None):
+    names = [section[0] for section in REPORT_SECTIONS]
+    for name in list(sections or []) + list(skip or []):
+        if name not in names:
+            msg="Error:\n"\
+                "    Unknown report section %s\n"\
+                "    Valid sections are: %s" %(name, ", ".join(names))
+            print(msg)
+            exit(1)
+    if sections is not None:
+        names = [name for name in names if name in sections]
+    return [name for name in names if name not in (skip or [])]
+
+
+# Accumulators needed by the given sections, in registration order
+def required_accumulators(names):
+    needed = set([accumulator for section in REPORT_SECTIONS if section[0] in names for accumulator in section[3]])
+    return [name for name in registered_accumulators() if name in needed]
+
+
+# Data needed by the given sections, each after the data it depends on
+def required_data(names):
+    required = []
+    def visit(name):
+        if name in required: return
+        for dependency in REPORT_DATA[name][0]:
+            visit(dependency)
+        required.append(name)
+    for section in REPORT_SECTIONS:
+        if section[0] in names:
+            for name in section[2]:
+                visit(name)
+    return required
+
+
+# workers=N rebuilds the offset intervals with N processes
+# binned: None to draw large traces as binned images, True/False to always/never do so
+# resolution: (x bins, y bins) of the binned I/O activity image
+# sections/skip: names of the sections to run/leave out, see REPORT_SECTIONS
+# resources: "cdn" to load BokehJS from the CDN, "inline" to bundle it (works offline)
+# single_precision: send the float plot data as float32 instead of float64 (lossy, about 7 significant digits)
+# profile_json: also write the stage profile (section 0) as JSON, True for <report>.profile.json or a path
+# data: dict that keeps the data shared by the sections (see REPORT_DATA), e.g., to reuse the intervals
+# Returns the Profile of the reader and report stages
+def generate_report(reader, output_path, workers=1, binned=None, resolution=BINNED_RESOLUTION,
+                    sections=None, skip=None, resources="cdn", single_precision=False, profile_json=None, data=None):
 
     output_path = os.path.abspath(output_path)
     if output_path[-5:] != ".html":
         output_path += ".html"
 
-    htmlWriter = HTMLWriter(output_path)
-
-    intervals = build_offset_intervals(reader)
-
-    record_counts(reader, htmlWriter)
-
-    file_counts(reader, htmlWriter)
-
-    function_layers(reader, htmlWriter)
-    function_patterns(intervals, htmlWriter)
-    function_counts(reader, htmlWriter)
-    function_times(reader, htmlWriter)
-
-    overall_io_activities(reader, htmlWriter)
-    offset_vs_time(intervals, htmlWriter)
-    offset_vs_rank(intervals, htmlWriter)
-
-    file_access_patterns(intervals, htmlWriter)
-
-    io_statistics(reader, intervals, htmlWriter)
-    io_sizes(intervals, htmlWriter, read=True)
-    io_sizes(intervals, htmlWriter, read=False)
-
-    htmlWriter.write_html()
-
-
-if __name__ == "__main__":
+    htmlWriter = HTMLWriter(output_path, resources, single_precision)
+
+    # Continues the profile of the reader (decoding, columns, LocalMetadata)
+    profile = Profile(reader.profile.stages if hasattr(reader, "profile") else None)
+    num_records = sum([reader.counts[rank] for rank in reader.ranks])
+
+    selected = select_sections(sections, skip)
+    data = data if data is not None else {}
+    data.update({"reader": reader, "workers": workers, "binned": binned, "resolution": resolution,
+                 "accumulators": required_accumulators(selected)})
+    for name in required_data(selected):
+        with profile.stage(name, num_records, "records"):
+            data[name] = REPORT_DATA[name][1](data)
+    num_intervals = sum([len(data["intervals"][f]) for f in data["intervals"]]) if "intervals" in data else 0
+
+    # Independent of each other, run by run_sections() in this order (or concurrently),
+    # the sections that need the intervals are profiled by interval, the others by record
+    run_sections([(name, partial(function, data))
+                  for name, attributes, needs, accumulators, function in REPORT_SECTIONS if name in selected],
+                 htmlWriter, workers, profile,
+                 dict([(name, (num_intervals, "intervals") if "intervals" in needs else (num_records, "records"))
+                       for name, attributes, needs, accumulators, function in REPORT_SECTIONS]))
+    htmlWriter.skip([attribute for name, attributes, needs, accumulators, function in REPORT_SECTIONS
+                     if name not in selected for attribute in attributes])
+
+    htmlWriter.performanceTable = profile.table().get_html_string()
+    with profile.stage("write_html"):
+        htmlWriter.write_html()
+
+    if profile_json:
+        profile.to_json(output_path[:-5] + ".profile.json" if profile_json is True else profile_json)
+    return profile
+
+
+# Command line of recorder-report and python -m recorder_viz.reporter
+# argv: arguments without the program name, default sys.argv[1:]
+def main(argv=None):
     import argparse
+    from .batch import expand_traces, batch_report
 
     parser = argparse.ArgumentParser(description="Process trace data and generate a report.")
     parser.add_argument(
         "-i", "--input_path",
         required=True,
+        nargs="+",
         type=str,
-        help="Path to the trace file to be processed."
+        help="Path to the trace file to be processed. With --batch, any number of trace directories, glob patterns or files listing them."
     )
     parser.add_argument(
         "-o", "--output_path",
         required=True,
         type=str,
-        help="Path to save the generated report."
+        help="Path to save the generated report. With --batch, the directory of the reports and their index.html."
+    )
+    parser.add_argument(
+        "-j", "--jobs",
+        default=1,
+        type=int,
+        help="Number of processes used to load the traces, build the offset intervals and compute the report sections. With --batch, the number of traces reported at once."
+    )
+    parser.add_argument(
+        "--cache",
+        nargs="?",
+        const=True,
+        default=False,
+        help="Cache the decoded traces (in the trace directory, or the given directory) and reuse them on later runs."
+    )
+    parser.add_argument(
+        "--binned",
+        choices=["auto", "always", "never"],
+        default="auto",
+        help="Draw the I/O activity and offset plots as binned images instead of one line per call (auto: only for large traces or files)."
+    )
+    parser.add_argument(
+        "--resolution",
+        default="%dx%d" %(BINNED_RESOLUTION),
+        type=str,
+        help="Resolution of the binned images, as WIDTHxHEIGHT bins."
+    )
+    parser.add_argument(
+        "--sections",
+        default=None,
+        type=str,
+        help="Comma-separated report sections to generate (default: all), e.g., function_counts,function_times."
+    )
+    parser.add_argument(
+        "--skip",
+        default=None,
+        type=str,
+        help="Comma-separated report sections to leave out, e.g., file_access_patterns."
+    )
+    parser.add_argument(
+        "--offline",
+        action="store_true",
+        help="Bundle BokehJS into the report instead of loading it from the CDN."
+    )
+    parser.add_argument(
+        "--single-precision",
+        action="store_true",
+        help="Store the plot data as float32 instead of float64 to make the report smaller. "
+             "Lossy: values keep about 7 significant digits, e.g., times around 1000 s are "
+             "rounded to about 0.1 ms, which can merge or shift very short calls in the plots."
+    )
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const=True,
+        default=None,
+        help="Also write the time and memory spent in each stage as JSON (to <report>.profile.json, or the given file)."
+    )
+    parser.add_argument(
+        "--batch",
+        action="store_true",
+        help="Write one report for each of the input traces, and an index page comparing them."
+    )
+    parser.add_argument(
+        "--memory-budget",
+        default=None,
+        type=int,
+        help="With --batch, only start another trace while the estimated memory of the running ones stays below this many MiB."
     )
 
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
+
+    binned = {"auto": None, "always": True, "never": False}[args.binned]
+    resolution = tuple([int(n) for n in args.resolution.split("x")])
+    sections = args.sections.split(",") if args.sections else None
+    skip = args.skip.split(",") if args.skip else None
+    if len(args.input_path) > 1 and not args.batch:
+        msg="Error:\n"\
+            "    %d traces given, use --batch to report on several traces" %(len(args.input_path))
+        print(msg)
+        exit(1)
+    if args.batch:
+        select_sections(sections, skip)     # exits on unknown names, before starting any trace
+        traces = expand_traces(args.input_path)
+        options = {"cache": args.cache, "binned": binned, "resolution": resolution, "sections": sections, "skip": skip,
+                   "resources": "inline" if args.offline else "cdn", "single_precision": args.single_precision,
+                   "profile_json": True if args.profile else None}
+        budget = args.memory_budget * 1024 * 1024 if args.memory_budget else None
+        batch_report(traces, args.output_path, workers=args.jobs, memory_budget=budget, options=options)
+    else:
+        reader = RecorderReader(args.input_path[0], workers=args.jobs, cache=args.cache)
+        generate_report(reader, args.output_path, workers=args.jobs, binned=binned, resolution=resolution,
+                        sections=sections, skip=skip, resources="inline" if args.offline else "cdn",
+                        single_precision=args.single_precision, profile_json=args.profile)
+
 
-    reader = RecorderReader(args.input_path)
-    generate_report(reader, args.output_path)
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# encoding: utf-8
+import os
+import multiprocessing
+from .html_writer import HTMLWriter
+from .parallel_loader import can_fork
+from .profiling import Profile
+
+"""
+Run the report sections concurrently.
+
+    A section is a (name, function) pair, the function takes an HTMLWriter
+    and sets one or more of its attributes. The sections are run by a pool
+    of forked processes, which share the reader and the offset intervals
+    of the parent copy-on-write. Each worker runs its section on a scratch
+    HTMLWriter and only sends back the attributes it set (HTML fragments);
+    the parent copies them into the real HTMLWriter in the section order.
+    Each section is profiled where it runs, the workers send their stages back.
+"""
+
+# Set by the parent right before forking the workers
+_sections = None
+_html_options = None        # (resources, single_precision) of the report's HTMLWriter
+_items = None
+
+
+def _init_worker():
+    # Each worker numbers its bokeh models from the same counter it inherited,
+    # use globally unique IDs so the fragments of different sections do not clash
+    os.environ["BOKEH_SIMPLE_IDS"] = "no"
+
+
+def _run_section(index):
+    name, section = _sections[index]
+    htmlWriter = HTMLWriter(os.devnull, _html_options[0], _html_options[1])
+    before = dict(vars(htmlWriter))
+    profile = Profile()
+    with profile.stage(name, *_items.get(name, (None, None))):
+        section(htmlWriter)
+    return index, (dict([(key, value) for key, value in vars(htmlWriter).items() if key not in before or before[key] != value]),
+                   profile.stages)
+
+
+# profile: Profile that gets one stage per section
+# items: {section name: (number of records or intervals it goes through, "records" or "intervals")}
+def run_sections(sections, htmlWriter, workers=1, profile=None, items=None):
+    global _sections, _html_options, _items
+    profile = profile if profile is not None else Profile()
+    items = items or {}
+
+    if workers <= 1 or len(sections) <= 1 or not can_fork():
+        for name, section in sections:
+            with profile.stage(name, *items.get(name, (None, None))):
+                section(htmlWriter)
+        return
+
+    _sections, _items = sections, items
+    _html_options = htmlWriter.resources, htmlWriter.single_precision
+    try:
+        pool = multiprocessing.get_context("fork").Pool(min(workers, len(sections)), initializer=_init_worker)
+        try:
+            results = dict(pool.imap_unordered(_run_section, range(len(sections)), chunksize=1))
+        finally:
+            pool.close()
+            pool.join()
+    finally:
+        _sections, _html_options, _items = None, None, None
+
+    for index in range(len(sections)):
+        attributes, stages = results[index]
+        for key, value in attributes.items():
+            setattr(htmlWriter, key, value)
+        for stage in stages:
+            profile.add(stage)
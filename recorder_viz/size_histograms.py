@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# encoding: utf-8
+import numpy as np
+from .interval_arrays import as_interval_arrays
+
+"""
+Power-of-two bucketed I/O size histograms.
+
+    Bucket 0 holds the zero-byte requests, bucket k > 0 holds the sizes
+    in [2^(k-1), 2^k). Histograms, byte sums, percentiles and the share
+    of bytes moved by small requests are computed for all keys (files
+    or ranks) at once with bincount and one sort.
+"""
+
+# Requests below this size count as small, 1 MiB is the default Lustre RPC size
+SMALL_IO_SIZE = 1024 * 1024
+
+
+def size_buckets(sizes):
+    # frexp gives size = m * 2^e with m in [0.5, 1), so e = floor(log2(size)) + 1
+    return np.frexp(np.asarray(sizes, dtype=np.float64))[1].astype(np.int64)
+
+
+def human_size(size):
+    for unit in ("", "K", "M", "G", "T"):
+        if size < 1024 or unit == "T":
+            return "%d%s" %(size, unit)
+        size //= 1024
+
+
+def bucket_label(bucket):
+    if bucket == 0: return "0"
+    if bucket == 1: return "1"
+    return "%s-%s" %(human_size(2**(bucket-1)), human_size(2**bucket))
+
+
+'''
+I/O size distribution of each key.
+    keys:           filenames (by="file"), ranks (by="rank") or ["job"] (by=None)
+    counts, bytes:  (len(keys), num_buckets) number of requests and bytes per bucket
+    percentiles:    {50: array, 90: array, 99: array} request size per key (nearest rank)
+    small_share:    fraction of the bytes of each key moved by requests below small
+'''
+class SizeHistogram():
+    def __init__(self, keys, counts, byte_sums, percentiles, small_share, small):
+        self.keys = keys
+        self.counts = counts
+        self.bytes = byte_sums
+        self.percentiles = percentiles
+        self.small_share = small_share
+        self.small = small
+
+    def labels(self):
+        return [bucket_label(bucket) for bucket in range(self.counts.shape[1])]
+
+
+# intervals: {filename: FileIntervals or interval list}, as from build_offset_intervals()
+# read: True for reads, False for writes
+# by: "file", "rank" or None for the whole job
+def size_histogram(intervals, read=True, by=None, small=SMALL_IO_SIZE, percentiles=(50, 90, 99)):
+    if by not in (None, "file", "rank"):
+        raise ValueError("by must be None, 'file' or 'rank', not %s" %(by))
+    intervals = as_interval_arrays(intervals)
+
+    sizes, rows, keys = [np.zeros(0, dtype=np.int64)], [np.zeros(0, dtype=np.int64)], []
+    for filename in intervals:
+        data = intervals[filename].data
+        selected = data[data["is_read"] == read]
+        sizes.append(selected["count"])
+        if by == "file":
+            rows.append(np.full(len(selected), len(keys), dtype=np.int64))
+            keys.append(filename)
+        elif by == "rank":
+            rows.append(selected["rank"].astype(np.int64))
+    sizes, rows = np.concatenate(sizes), np.concatenate(rows)
+    if by == "rank":
+        keys, rows = np.unique(rows, return_inverse=True)
+        keys, rows = keys.tolist(), rows.ravel()
+    elif by is None:
+        keys, rows = ["job"], np.zeros(len(sizes), dtype=np.int64)
+
+    num_keys = len(keys)
+    buckets = size_buckets(sizes)
+    num_buckets = int(buckets.max()) + 1 if len(buckets) else 1
+    flat = rows * num_buckets + buckets
+    counts = np.bincount(flat, minlength=num_keys*num_buckets).reshape(num_keys, num_buckets)
+    sums = np.bincount(flat, weights=sizes, minlength=num_keys*num_buckets).reshape(num_keys, num_buckets)
+
+    # nearest-rank percentiles: sort by (key, size), the k-th request of a key
+    # is at its start offset + k
+    order = np.lexsort((sizes, rows))
+    sorted_sizes = sizes[order]
+    per_key = counts.sum(axis=1)
+    start = np.concatenate([[0], np.cumsum(per_key)[:-1]]).astype(np.int64)
+    values = {}
+    for p in percentiles:
+        if len(sorted_sizes) == 0:
+            values[p] = np.zeros(num_keys, dtype=np.int64)
+            continue
+        k = np.maximum(np.ceil(p / 100.0 * per_key).astype(np.int64) - 1, 0)
+        index = np.minimum(start + k, len(sorted_sizes) - 1)
+        values[p] = np.where(per_key > 0, sorted_sizes[index], 0)
+
+    total = sums.sum(axis=1)
+    small_bytes = np.bincount(rows[sizes < small], weights=sizes[sizes < small], minlength=num_keys)
+    small_share = np.divide(small_bytes, total, out=np.zeros(num_keys), where=total > 0)
+
+    return SizeHistogram(keys, counts, sums, values, small_share, small)
@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+# encoding: utf-8
+import random
+from ctypes import c_char_p, cast, POINTER
+from .creader_wrapper import RecorderReader, RecorderMetadata, PyRecord
+from .func_categories import FunctionCategories
+from .file_table import FileTable
+
+"""
+Synthetic traces with the interface of RecorderReader.
+
+    SyntheticReader generates the records in memory instead of decoding
+    them with libreader, in the same form: one C array of PyRecord per
+    rank with the arguments as C strings. Everything built on top of the
+    records (columns, LMs, files, categories, offset intervals, reports)
+    works unchanged, so the analyses can be timed and tested at any scale
+    without a Recorder install or a real trace.
+
+    Access patterns:
+        n-1:     all ranks write, then read back, strided blocks of shared files
+        n-n:     each rank writes, then reads back, its own files sequentially
+        random:  small reads and writes at random offsets of shared files
+"""
+
+PATTERNS = ("n-1", "n-n", "random")
+
+FUNCS = ["MPI_Init", "MPI_Finalize", "MPI_Barrier", "open64", "close", "write", "read",
+         "pwrite", "pread", "lseek"]
+
+SYNTHETIC_DIR = "/synthetic"
+
+
+'''
+num_ranks:          number of ranks of the trace
+records_per_rank:   about the number of records of each rank (at least the opens and closes of its files)
+pattern:            one of PATTERNS
+num_files:          shared files (n-1, random) or files per rank (n-n)
+io_size:            bytes per read/write, the largest size for the random pattern
+seed:               the same seed gives the same trace
+ranks, lazy, workers: as for RecorderReader
+'''
+class SyntheticReader(RecorderReader):
+    def __init__(self, num_ranks=4, records_per_rank=1000, pattern="n-1", num_files=1, io_size=4096, seed=0,
+                 ranks=None, lazy=False, workers=1):
+        if pattern not in PATTERNS:
+            raise ValueError("pattern must be one of %s, not %s" %(", ".join(PATTERNS), pattern))
+        if num_ranks < 1 or num_files < 1 or io_size < 1:
+            raise ValueError("num_ranks, num_files and io_size must be positive")
+        self.num_ranks = num_ranks
+        self.records_per_rank = records_per_rank
+        self.pattern = pattern
+        self.num_files = num_files
+        self.io_size = io_size
+        self.seed = seed
+        RecorderReader.__init__(self, SYNTHETIC_DIR, ranks, lazy, workers, cache=False)
+
+    def decode_records(self, logs_dir):
+        self.funcs = list(FUNCS)
+        self.categories = FunctionCategories(self.funcs)
+        self.files = FileTable()
+
+        self.GM = RecorderMetadata()
+        self.GM.total_ranks = self.num_ranks
+        self.GM.posix_tracing = True
+        self.GM.mpi_tracing = True
+        self.GM.start_ts = 0.0
+        self.GM.time_resolution = 1e-6
+
+        self.records, self.counts = [], []
+        for rank in range(self.num_ranks):
+            records = to_records(self.generate_calls(rank))
+            self.records.append(records)
+            self.counts.append(len(records.array))
+
+    def filenames(self, rank):
+        if self.pattern == "n-n":
+            return ["%s/rank%d.%d.dat" %(SYNTHETIC_DIR, rank, i) for i in range(self.num_files)]
+        return ["%s/shared.%d.dat" %(SYNTHETIC_DIR, i) for i in range(self.num_files)]
+
+    # The calls of one rank: [(tstart, tend, function name, args)]
+    def generate_calls(self, rank):
+        rnd = random.Random(self.seed * 1000003 + rank)
+        calls = []
+        clock = [rank * 1e-5]
+
+        def call(func, args, size=0):
+            duration = 1e-6 + (1e-5 + size / 1e9) * rnd.uniform(0.5, 1.5)
+            calls.append((clock[0], clock[0] + duration, func, args))
+            clock[0] += duration + rnd.uniform(0, 1e-5)
+
+        files = self.filenames(rank)
+        # MPI_Init/Barrier/Finalize, one open and one close per file
+        num_ops = max(0, self.records_per_rank - 3 - 2 * len(files))
+        writes = num_ops // 2
+
+        call("MPI_Init", [])
+        for filename in files:
+            call("open64", [filename, 0, 420])
+        for i in range(num_ops):
+            if i == writes:
+                call("MPI_Barrier", ["MPI_COMM_WORLD"])
+            filename = files[i % len(files)]
+            is_write = i < writes
+            if self.pattern == "n-1":
+                block = (i if is_write else i - writes) // len(files)
+                offset = (block * self.num_ranks + rank) * self.io_size
+                call("pwrite" if is_write else "pread", [filename, "0x0", self.io_size, offset], self.io_size)
+            elif self.pattern == "n-n":
+                if i == writes:
+                    call("lseek", [filename, 0, 0])
+                    for other in files[1:]:
+                        call("lseek", [other, 0, 0])
+                call("write" if is_write else "read", [filename, "0x0", self.io_size], self.io_size)
+            else:
+                size = rnd.randint(1, self.io_size)
+                offset = rnd.randrange(0, max(1, num_ops * self.num_ranks)) * 512
+                call("pwrite" if rnd.random() < 0.5 else "pread", [filename, "0x0", size, offset], size)
+        if num_ops <= writes:
+            call("MPI_Barrier", ["MPI_COMM_WORLD"])
+        for filename in files:
+            call("close", [filename])
+        call("MPI_Finalize", [])
+        return calls
+
+
+'''
+A rank's records as returned by libreader: a POINTER(PyRecord) to a C array,
+which also keeps the array and the argument buffers alive.
+'''
+class SyntheticRecords(POINTER(PyRecord)):
+    _type_ = PyRecord
+
+
+def to_records(calls):
+    funcs = dict([(func, i) for i, func in enumerate(FUNCS)])
+    array = (PyRecord * len(calls))()
+    buffers = []
+    for record, (tstart, tend, func, args) in zip(array, calls):
+        argv = (c_char_p * len(args))(*[str(arg).encode('utf-8') for arg in args])
+        buffers.append(argv)
+        record.tstart, record.tend = tstart, tend
+        record.func_id = funcs[func]
+        record.arg_count = len(args)
+        record.args = cast(argv, POINTER(c_char_p))
+    records = cast(array, SyntheticRecords)
+    records.array, records.buffers = array, buffers
+    return records
@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+# encoding: utf-8
+import os, json, shutil
+from array import array
+from ctypes import c_char_p
+import numpy as np
+from .record_columns import RecordColumns
+from .file_table import FileTable
+
+"""
+On-disk cache of the decoded traces.
+
+    The cache directory keeps everything RecorderReader needs,
+    so later runs can skip libreader entirely:
+        meta.json           - trace signature, function list, global metadata,
+                              record counts, interned filenames and the file set of each rank
+        <field>.npy         - one column per record field plus file_id, all ranks concatenated
+        rank_offsets.npy    - first record of each rank in the columns
+        arg_offsets.npy     - first argument of each record in arg_data_offsets
+        arg_data_offsets.npy, arg_data.bin
+                            - the raw argument bytes, one after another
+
+    All arrays are memory-mapped on load. The cache is rebuilt whenever the
+    name, size or modification time of any file in the trace directory changes.
+"""
+
+CACHE_VERSION = 2
+CACHE_DIRNAME = ".recorder-viz-cache"
+
+
+def trace_signature(logs_dir):
+    signature = []
+    for name in sorted(os.listdir(logs_dir)):
+        path = os.path.join(logs_dir, name)
+        if os.path.isfile(path):
+            st = os.stat(path)
+            signature.append([name, st.st_size, st.st_mtime_ns])
+    return signature
+
+
+'''
+Records of one rank read back from the cache.
+    Each access creates a PyRecord, the same type libreader returns,
+    with args pointing at a freshly built array of C strings.
+'''
+class CachedRecords():
+    def __init__(self, cache, rank):
+        self.cache = cache
+        self.start = int(cache.rank_offsets[rank])
+        self.count = int(cache.rank_offsets[rank+1]) - self.start
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        from .creader_wrapper import PyRecord
+        cache, g = self.cache, self.start + i
+        args = [cache.arg_bytes(a) for a in range(cache.arg_offsets[g], cache.arg_offsets[g+1])]
+        return PyRecord(cache.columns_data["tstart"][g], cache.columns_data["tend"][g],
+                        cache.columns_data["call_depth"][g], cache.columns_data["func_id"][g],
+                        cache.columns_data["tid"][g], len(args), (c_char_p * max(1, len(args)))(*args))
+
+
+class TraceCache():
+    def __init__(self, logs_dir, cache_dir=None):
+        self.logs_dir = logs_dir
+        self.cache_dir = cache_dir if cache_dir else os.path.join(logs_dir, CACHE_DIRNAME)
+        self.meta = None
+
+    def path(self, name):
+        return os.path.join(self.cache_dir, name)
+
+    # Returns True if a valid cache was found and opened
+    def load(self):
+        try:
+            with open(self.path("meta.json"), "r") as f:
+                meta = json.load(f)
+        except (IOError, OSError, ValueError):
+            return False
+        if meta.get("version") != CACHE_VERSION or meta.get("signature") != trace_signature(self.logs_dir):
+            return False
+
+        self.meta = meta
+        self.columns_data = {}
+        for name in RecordColumns.fields + ("file_id",):
+            self.columns_data[name] = np.load(self.path(name + ".npy"), mmap_mode='r')
+        self.rank_offsets = np.load(self.path("rank_offsets.npy"), mmap_mode='r')
+        self.arg_offsets = np.load(self.path("arg_offsets.npy"), mmap_mode='r')
+        self.arg_data_offsets = np.load(self.path("arg_data_offsets.npy"), mmap_mode='r')
+        if os.path.getsize(self.path("arg_data.bin")) > 0:
+            self.arg_data = np.memmap(self.path("arg_data.bin"), dtype=np.uint8, mode='r')
+        else:
+            self.arg_data = np.zeros(0, dtype=np.uint8)
+        return True
+
+    def arg_bytes(self, a):
+        return self.arg_data[self.arg_data_offsets[a]:self.arg_data_offsets[a+1]].tobytes()
+
+    def funcs(self):
+        return self.meta["funcs"]
+
+    def files(self):
+        return FileTable(self.meta["files"])
+
+    def counts(self):
+        return self.meta["counts"]
+
+    def restore_metadata(self, GM):
+        for name, value in self.meta["GM"].items():
+            setattr(GM, name, value)
+
+    def columns(self, rank):
+        start, end = self.rank_offsets[rank], self.rank_offsets[rank+1]
+        return RecordColumns(*[self.columns_data[name][start:end] for name in RecordColumns.fields],
+                             file_id=self.columns_data["file_id"][start:end])
+
+    def records(self, rank):
+        return CachedRecords(self, rank)
+
+    def filemap(self, rank):
+        return set(self.meta["filemaps"][rank])
+
+    # Write the cache of all ranks of the reader,
+    # built[rank] is the (columns, LocalMetadata) of each rank.
+    # The cache is first written to a temporary directory then moved in place.
+    # Raises OSError if it can not be written (e.g., read-only trace directory),
+    # the temporary directory is removed then.
+    def save(self, reader, built):
+        tmp_dir = self.cache_dir + ".tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        try:
+            os.makedirs(tmp_dir)
+            self.write(tmp_dir, reader, built)
+        except OSError:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+        os.rename(tmp_dir, self.cache_dir)
+
+    def write(self, tmp_dir, reader, built):
+        nprocs = reader.GM.total_ranks
+        counts = [int(c) for c in reader.counts]
+        rank_offsets = np.zeros(nprocs+1, dtype=np.int64)
+        rank_offsets[1:] = np.cumsum(counts)
+        total = int(rank_offsets[-1])
+        np.save(os.path.join(tmp_dir, "rank_offsets.npy"), rank_offsets)
+
+        files = {}
+        for name, dtype in zip(RecordColumns.fields + ("file_id",), RecordColumns.dtypes + (np.int32,)):
+            files[name] = np.lib.format.open_memmap(os.path.join(tmp_dir, name + ".npy"),
+                                                   mode='w+', dtype=dtype, shape=(total,))
+        arg_offsets = np.lib.format.open_memmap(os.path.join(tmp_dir, "arg_offsets.npy"),
+                                                mode='w+', dtype=np.int64, shape=(total+1,))
+        arg_offsets[0] = 0
+        total_args = sum([int(np.sum(built[rank][0].arg_count, dtype=np.int64)) for rank in range(nprocs)])
+        arg_data_offsets = np.lib.format.open_memmap(os.path.join(tmp_dir, "arg_data_offsets.npy"),
+                                                     mode='w+', dtype=np.int64, shape=(total_args+1,))
+        arg_data_offsets[0] = 0
+
+        with open(os.path.join(tmp_dir, "arg_data.bin"), "wb") as arg_data:
+            for rank in range(nprocs):
+                start, end = rank_offsets[rank], rank_offsets[rank+1]
+                columns = built[rank][0]
+                for name in RecordColumns.fields + ("file_id",):
+                    files[name][start:end] = getattr(columns, name)
+                arg_offsets[start+1:end+1] = arg_offsets[start] + np.cumsum(columns.arg_count, dtype=np.int64)
+
+                # argument lengths of the rank, 8 bytes each, then their running sum
+                records, lengths = reader.records[rank], array('q')
+                for i in range(counts[rank]):
+                    record = records[i]
+                    for a in range(record.arg_count):
+                        arg = record.args[a] or b""
+                        if type(arg) == str: arg = arg.encode('utf-8')
+                        arg_data.write(arg)
+                        lengths.append(len(arg))
+                first, last = arg_offsets[start], arg_offsets[end]
+                if len(lengths):
+                    arg_data_offsets[first+1:last+1] = arg_data_offsets[first] + \
+                                                       np.cumsum(np.frombuffer(lengths, dtype=np.int64))
+
+        for f in list(files.values()) + [arg_offsets, arg_data_offsets]:
+            f.flush()
+        del files, arg_offsets, arg_data_offsets
+
+        GM = {}
+        for name, _ in reader.GM._fields_:
+            GM[name] = getattr(reader.GM, name)
+        meta = {
+            "version": CACHE_VERSION,
+            "signature": trace_signature(self.logs_dir),
+            "funcs": reader.funcs,
+            "GM": GM,
+            "counts": counts,
+            "files": list(reader.files),
+            "filemaps": [sorted(built[rank][1].filemap) for rank in range(nprocs)],
+        }
+        with open(os.path.join(tmp_dir, "meta.json"), "w") as f:
+            json.dump(meta, f)
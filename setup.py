@@ -15,11 +15,13 @@ setuptools.setup(
     packages=['recorder_viz'],                  # package for import: after installaion, import recorder_viz
     #package_data = {'recorder_viz': ['*.h']},   # *.h by default will not be copied, we use this to ship it.
     scripts=['bin/recorder-report'],
+    extras_require={'export': ['pyarrow']},     # recorder_viz.export, Parquet/Arrow files
     classifiers=[
-        "Programming Language :: Python :: 2.7",
+        "Programming Language :: Python :: 3",
+        "Programming Language :: Python :: 3 :: Only",
         "License :: OSI Approved :: University of Illinois/NCSA Open Source License",
         "Operating System :: OS Independent",
     ],
-    python_requires='>=2.7',
+    python_requires='>=3.6',
 )
 
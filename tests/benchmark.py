@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# Time (and with --memory, the peak Python heap of) each stage of the report
+# pipeline on synthetic traces, no Recorder install needed:
+#   python tests/benchmark.py --scales 4x1000,64x10000 --patterns n-1,random --memory
+
+import os, sys, io, time, argparse, tracemalloc, contextlib
+from prettytable import PrettyTable
+from recorder_viz.synthetic_trace import SyntheticReader, PATTERNS
+from recorder_viz.html_writer import HTMLWriter
+from recorder_viz.reporter import REPORT_SECTIONS, REPORT_DATA, required_data, required_accumulators, BINNED_RESOLUTION
+
+
+# Run function() once, returns its result, the seconds it took and the peak
+# traced memory in MiB (None without memory=True, tracing slows the run down)
+def measure(function, memory=False):
+    if memory:
+        tracemalloc.start()
+    start = time.time()
+    with contextlib.redirect_stdout(io.StringIO()):     # the readers print one line per rank
+        result = function()
+    elapsed = time.time() - start
+    peak = None
+    if memory:
+        peak = tracemalloc.get_traced_memory()[1] / 1024.0 / 1024.0
+        tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def benchmark(num_ranks, records_per_rank, pattern, num_files, workers, memory):
+    rows = []
+    def stage(name, function):
+        result, elapsed, peak = measure(function, memory)
+        rows.append([name, "%.3f" %(elapsed), "-" if peak is None else "%.1f" %(peak)])
+        return result
+
+    reader = stage("reader", lambda: SyntheticReader(num_ranks, records_per_rank, pattern, num_files, workers=workers))
+
+    names = [section[0] for section in REPORT_SECTIONS]
+    data = {"reader": reader, "workers": workers, "binned": None, "resolution": BINNED_RESOLUTION,
+            "accumulators": required_accumulators(names)}
+    for name in required_data(names):
+        data[name] = stage(name, lambda: REPORT_DATA[name][1](data))
+
+    for name, attributes, needs, accumulators, function in REPORT_SECTIONS:
+        stage(name, lambda: function(data, HTMLWriter(os.devnull)))
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the report pipeline on synthetic traces.")
+    parser.add_argument("--scales", default="4x1000,16x10000,64x10000", type=str,
+                        help="Comma-separated RANKSxRECORDS trace sizes, RECORDS per rank.")
+    parser.add_argument("--patterns", default=",".join(PATTERNS), type=str,
+                        help="Comma-separated access patterns: %s." %(", ".join(PATTERNS)))
+    parser.add_argument("--files", default=4, type=int, help="Shared files (n-1, random) or files per rank (n-n).")
+    parser.add_argument("-j", "--jobs", default=1, type=int, help="Number of processes, as for recorder-report.")
+    parser.add_argument("--memory", action="store_true", help="Also report the peak Python memory of each stage.")
+    args = parser.parse_args()
+
+    for scale in args.scales.split(","):
+        num_ranks, records_per_rank = [int(n) for n in scale.split("x")]
+        for pattern in args.patterns.split(","):
+            table = PrettyTable()
+            table.field_names = ["Stage", "Time (s)", "Peak memory (MiB)"]
+            table.align["Stage"] = "l"
+            for row in benchmark(num_ranks, records_per_rank, pattern, args.files, args.jobs, args.memory):
+                table.add_row(row)
+            print("%d ranks x %d records, %s" %(num_ranks, records_per_rank, pattern))
+            print(table)
+            sys.stdout.flush()
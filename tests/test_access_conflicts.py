@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+# encoding: utf-8
+import pytest
+from recorder_viz.synthetic_trace import SyntheticReader, PATTERNS
+from recorder_viz.build_offset_intervals import build_offset_intervals
+from recorder_viz.access_conflicts import summarize_conflicts, KINDS
+
+
+# Every pair of intervals checked against each other
+def brute_force_conflicts(intervals):
+    counts = dict((kind, {'S':0, 'D':0}) for kind in KINDS)
+    covered = dict((kind, set()) for kind in KINDS)
+    for i in range(len(intervals)):
+        for j in range(i+1, len(intervals)):
+            a, b = intervals[i], intervals[j]
+            if a[4] == 0 or b[4] == 0 or not a[6] or not b[6]:
+                continue
+            start, end = max(a[3], b[3]), min(a[3]+a[4], b[3]+b[4])
+            if start >= end or (a[6][0] not in b[6] and b[6][0] not in a[6]):
+                continue
+            first, second = (a, b) if a[1] < b[1] else (b, a)
+            kind = ("R" if second[5] else "W") + "A" + ("R" if first[5] else "W")
+            counts[kind]['S' if a[0] == b[0] else 'D'] += 1
+            covered[kind].update(range(start, end))
+    return counts, covered
+
+
+@pytest.mark.parametrize("pattern", PATTERNS)
+@pytest.mark.parametrize("chunk_size", [1<<22, 7])
+def test_summary_matches_brute_force(pattern, chunk_size):
+    reader = SyntheticReader(4, 120, pattern, 1, io_size=1000, seed=3)
+    intervals = build_offset_intervals(reader, as_arrays=True)
+    for filename in intervals:
+        counts, covered = brute_force_conflicts(intervals[filename].to_lists())
+        summary = summarize_conflicts(intervals[filename], chunk_size)
+        assert summary.counts == counts
+        for kind in KINDS:
+            starts, ends = summary.ranges[kind]
+            assert sum([end - start for start, end in zip(starts, ends)]) == len(covered[kind])
+            assert summary.bytes((kind,)) == len(covered[kind])
+        assert summary.bytes() == len(covered["RAW"] | covered["WAW"] | covered["WAR"])
+
+
+def test_random_pattern_has_conflicts():
+    reader = SyntheticReader(4, 120, "random", 1, io_size=1000, seed=3)
+    intervals = build_offset_intervals(reader, as_arrays=True)
+    summary = summarize_conflicts(intervals["/synthetic/shared.0.dat"], 5)
+    assert sum([sum(summary.counts[kind].values()) for kind in KINDS]) > 0
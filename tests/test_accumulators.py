@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# encoding: utf-8
+from collections import OrderedDict
+import numpy as np
+import pytest
+from recorder_viz import accumulators
+from recorder_viz.accumulators import accumulate, register_accumulator, registered_accumulators, Accumulator
+from recorder_viz.synthetic_trace import SyntheticReader
+
+
+# The results computed record by record from the function names
+def expected_results(reader):
+    counts, times = np.zeros(len(reader.funcs)), np.zeros(len(reader.funcs))
+    metadata, spans = np.zeros(len(reader.files)), {}
+    for rank in reader.ranks:
+        reads, writes = ([], []), ([], [])
+        for i in range(reader.counts[rank]):
+            record = reader.records[rank][i]
+            func = reader.funcs[record.func_id]
+            duration = record.tend - record.tstart
+            counts[record.func_id] += 1
+            times[record.func_id] += duration
+            if func in ("open64", "close", "lseek"):
+                metadata[reader.files.get(record.args[0].decode('utf-8'))] += duration
+            for name, span in (("read", reads), ("write", writes)):
+                if name in func and "MPI" not in func:
+                    span[0].append(record.tstart)
+                    span[1].append(record.tend)
+        spans[rank] = (reads, writes)
+    return counts, times, metadata, spans
+
+
+@pytest.mark.parametrize("pattern", ["n-1", "n-n"])
+@pytest.mark.parametrize("lazy", [False, True])
+def test_results_match_record_by_record(pattern, lazy):
+    reader = SyntheticReader(4, 150, pattern, 2, lazy=lazy)
+    stats = accumulate(reader)
+    if lazy:
+        assert not any([reader.columns.is_built(rank) for rank in reader.ranks])
+    counts, times, metadata, spans = expected_results(reader)
+    assert list(stats.keys()) == registered_accumulators()
+    assert stats["function_counts"].tolist() == counts.tolist()
+    assert np.allclose(stats["function_times"], times)
+    assert np.allclose(stats["metadata_times"], metadata)
+    assert sorted(stats["activity_spans"].keys()) == list(reader.ranks)
+    for rank in reader.ranks:
+        for got, expected in zip(stats["activity_spans"][rank], spans[rank]):
+            assert got[0].tolist() == expected[0] and got[1].tolist() == expected[1]
+
+
+def test_selected_accumulators():
+    reader = SyntheticReader(2, 100, "n-1", 1)
+    stats = accumulate(reader, ["metadata_times", "function_counts"])
+    assert list(stats.keys()) == ["metadata_times", "function_counts"]
+    assert accumulate(reader, []) == OrderedDict()
+    with pytest.raises(ValueError):
+        accumulate(reader, ["no_such_accumulator"])
+
+
+def test_register_accumulator(monkeypatch):
+    monkeypatch.setattr(accumulators, "_accumulators", OrderedDict(accumulators._accumulators))
+
+    @register_accumulator
+    class WriteCount(Accumulator):
+        name = "write_count"
+        def __init__(self, reader):
+            self.count = 0
+        def add(self, batch):
+            self.count += int(np.sum(batch.mask("is_write")))
+        def result(self):
+            return self.count
+
+    assert registered_accumulators()[-1] == "write_count"
+    reader = SyntheticReader(3, 100, "n-1", 1)
+    stats = accumulate(reader)
+    writes = sum([1 for rank in reader.ranks for i in range(reader.counts[rank])
+                  if reader.funcs[reader.records[rank][i].func_id] == "pwrite"])
+    assert stats["write_count"] == writes > 0
+    assert stats["function_counts"].sum() == sum(reader.counts)
+
+    class Nameless(Accumulator):
+        pass
+    with pytest.raises(ValueError):
+        register_accumulator(Nameless)
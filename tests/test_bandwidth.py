@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+# encoding: utf-8
+import numpy as np
+import pytest
+from recorder_viz.synthetic_trace import SyntheticReader, PATTERNS
+from recorder_viz.build_offset_intervals import build_offset_intervals
+from recorder_viz.bandwidth import bandwidth_timeline
+
+
+def intervals_of(pattern):
+    reader = SyntheticReader(4, 200, pattern, 2, io_size=70000, seed=1)
+    return build_offset_intervals(reader)
+
+
+# (key, interval) of every interval
+def keyed(intervals, by):
+    for filename in intervals:
+        for interval in intervals[filename]:
+            yield {"file": filename, "rank": interval[0], None: "job"}[by], interval
+
+
+@pytest.mark.parametrize("pattern", PATTERNS)
+@pytest.mark.parametrize("by", [None, "file", "rank"])
+def test_bandwidth_matches_brute_force(pattern, by):
+    intervals = intervals_of(pattern)
+    timeline = bandwidth_timeline(intervals, num_windows=37, by=by)
+    edges = timeline.edges
+    width = edges[1] - edges[0]
+    t0 = min([interval[1] for key, interval in keyed(intervals, by)])
+    t1 = max([interval[2] for key, interval in keyed(intervals, by)])
+    assert np.isclose(edges[0], t0) and np.isclose(edges[-1], t1)
+
+    expected = {"read": np.zeros(timeline.read.shape), "write": np.zeros(timeline.write.shape)}
+    for key, interval in keyed(intervals, by):
+        row = timeline.keys.index(key)
+        tstart, tend, count = interval[1], interval[2], interval[4]
+        for w in range(len(edges) - 1):
+            overlap = max(0.0, min(tend, edges[w+1]) - max(tstart, edges[w]))
+            expected["read" if interval[5] else "write"][row, w] += count * overlap / (tend - tstart) / width
+    assert np.allclose(timeline.read, expected["read"])
+    assert np.allclose(timeline.write, expected["write"])
+    # every byte is counted once
+    total = sum([interval[4] for key, interval in keyed(intervals, by)])
+    assert np.isclose(timeline.total().sum() * width, total)
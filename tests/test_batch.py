@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# encoding: utf-8
+import os
+import pytest
+from recorder_viz import batch
+from recorder_viz.synthetic_trace import SyntheticReader
+from recorder_viz.build_offset_intervals import build_offset_intervals
+from recorder_viz.accumulators import accumulate
+
+
+def make_traces(tmpdir, names):
+    traces = []
+    for name in names:
+        trace_dir = tmpdir.mkdir(name).mkdir("trace")
+        trace_dir.join("recorder.mt").write("trace")
+        traces.append(str(trace_dir))
+    return traces
+
+
+# Stands in for report_trace in the forked workers: records the options it got
+def fake_report(trace_dir, output_path, options):
+    with open(output_path, "w") as f:
+        f.write(repr(options.get("cache")))
+    return {"ranks": 1, "records": 1, "report_time": 0.0, "peak_rss": None}
+
+
+def test_cache_directory_per_trace(tmpdir, monkeypatch):
+    monkeypatch.setattr(batch, "report_trace", fake_report)
+    traces = make_traces(tmpdir, ["a", "b", "c"])
+    cache_dir = str(tmpdir.join("cache"))
+    for workers in (1, 3):
+        output_dir = tmpdir.join("reports%d" %(workers))
+        results = batch.batch_report(traces, str(output_dir), workers=workers, options={"cache": cache_dir})
+        assert [result.status for result in results] == ["ok"] * 3
+        # the three traces are all named "trace"
+        caches = [output_dir.join(name + ".html").read() for name in ("trace", "trace-2", "trace-3")]
+        assert caches == [repr(os.path.join(cache_dir, name)) for name in ("trace", "trace-2", "trace-3")]
+
+    results = batch.batch_report(traces, str(tmpdir.join("reports")), options={"cache": True})
+    assert tmpdir.join("reports", "trace.html").read() == "True"
+
+
+def test_several_inputs_need_batch(capsys):
+    from recorder_viz.reporter import main
+    with pytest.raises(SystemExit) as e:
+        main(["-i", "a", "b", "-o", "report"])
+    assert e.value.code == 1
+    assert "use --batch" in capsys.readouterr().out
+
+
+def test_expand_traces(tmpdir, capsys):
+    a, b, c = make_traces(tmpdir, ["a", "b", "c"])
+    tmpdir.mkdir("not_a_trace")
+    listing = tmpdir.join("traces.txt")
+    listing.write("%s\n\n%s\n" %(c, a))
+    traces = batch.expand_traces([str(tmpdir.join("[ab]", "trace")), str(listing), str(tmpdir.join("not_a_trace"))])
+    assert traces == sorted([a, b, c])
+    assert "Skipping %s" %(tmpdir.join("not_a_trace")) in capsys.readouterr().out
+
+
+def test_report_names():
+    assert batch.report_names(["/x/run", "/y/run/", "/z/other", "/w/run"]) == ["run", "run-2", "other", "run-3"]
+
+
+def test_trace_metrics():
+    reader = SyntheticReader(4, 200, "n-1", 2)
+    metrics = batch.trace_metrics(reader)
+    assert metrics == {"ranks": 4, "records": 800}
+
+    intervals = build_offset_intervals(reader)
+    metrics = batch.trace_metrics(reader, intervals, accumulate(reader, ["metadata_times"]))
+    assert metrics["files"] == 2 and metrics["metadata_time"] > 0
+    written = sum([interval[4] for f in intervals for interval in intervals[f] if not interval[5]])
+    read = sum([interval[4] for f in intervals for interval in intervals[f] if interval[5]])
+    assert (metrics["bytes_written"], metrics["bytes_read"]) == (written, read)
+    assert metrics["write_bandwidth"] > 0 and metrics["read_bandwidth"] > 0
+    # stats of the report without metadata_times
+    assert "metadata_time" not in batch.trace_metrics(reader, None, accumulate(reader, ["function_counts"]))
+
+
+# a fails with a traceback, b exits like a user error, c gets a report
+def failing_report(trace_dir, output_path, options):
+    name = os.path.basename(os.path.dirname(trace_dir))
+    print("reporting %s" %(name))
+    if name == "a":
+        raise RuntimeError("cannot decode %s" %(name))
+    if name == "b":
+        exit(1)
+    return fake_report(trace_dir, output_path, options)
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_failed_traces_are_logged(tmpdir, monkeypatch, workers):
+    monkeypatch.setattr(batch, "report_trace", failing_report)
+    traces = make_traces(tmpdir, ["a", "b", "c"])
+    output_dir = tmpdir.join("reports")
+    results = batch.batch_report(traces, str(output_dir), workers=workers)
+    # all three are named "trace"
+    assert [result.status for result in results] == ["error", "error", "ok"]
+    assert results[0].error == "RuntimeError: cannot decode a"
+    assert results[1].error.startswith("exited with 1")
+    assert results[2].metrics["records"] == 1
+
+    log = output_dir.join("trace.log").read()
+    assert "reporting a" in log and "Traceback" in log and "RuntimeError: cannot decode a" in log
+    assert "reporting c" in output_dir.join("trace-3.log").read()
+    index = output_dir.join("index.html").read()
+    assert "3 traces, 2 failed" in index
+    assert 'href="trace.log"' in index and 'href="trace-3.html"' in index
+    assert index.count("failed: ") == 2
+
+
+def synthetic_reader(trace_dir, workers=1, cache=False):
+    return SyntheticReader(2, 100, "n-n", 1, seed=len(trace_dir))
+
+
+def test_batch_of_synthetic_traces(tmpdir, monkeypatch):
+    monkeypatch.setattr(batch, "RecorderReader", synthetic_reader)
+    traces = make_traces(tmpdir, ["a", "b"])
+    output_dir = tmpdir.join("reports")
+    results = batch.batch_report(traces, str(output_dir), workers=2, options={"sections": ["record_counts", "io_statistics"]})
+    assert [result.status for result in results] == ["ok", "ok"]
+    for result in results:
+        assert result.metrics["ranks"] == 2
+        assert result.metrics["records"] == sum(synthetic_reader(result.trace_dir).counts)
+        assert result.metrics["files"] == 2 and result.metrics["bytes_written"] > 0
+        assert "metadata_time" in result.metrics
+    assert "/synthetic/rank1.0.dat" in output_dir.join("trace-2.html").read()
+    index = output_dir.join("index.html").read()
+    assert "2 traces, 0 failed" in index and "%d" %(results[1].metrics["bytes_read"]) in index
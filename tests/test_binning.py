@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# encoding: utf-8
+import numpy as np
+from recorder_viz.binning import busy_time, spread_over_bins
+
+
+# Part of each call [start, end) within each bin of [lo, hi), in seconds
+def brute_busy_time(starts, ends, rows, num_rows, lo, hi, num_bins):
+    width = (hi - lo) / float(num_bins)
+    busy = np.zeros((num_rows, num_bins))
+    for start, end, row in zip(starts, ends, rows):
+        for b in range(num_bins):
+            busy[row, b] += max(0.0, min(end, lo + (b+1)*width) - max(start, lo + b*width))
+    return busy
+
+
+def random_calls(rng, n, lo, hi, max_length):
+    starts = rng.uniform(lo, hi, n)
+    return starts, starts + rng.uniform(0, max_length, n), rng.randint(0, 3, n)
+
+
+def test_busy_time_matches_brute_force():
+    rng = np.random.RandomState(0)
+    starts, ends, rows = random_calls(rng, 500, 0.0, 10.0, 2.0)
+    busy = busy_time(starts, ends, rows, 3, 0.0, 12.0, 24)
+    assert np.allclose(busy, brute_busy_time(starts, ends, rows, 3, 0.0, 12.0, 24))
+
+
+def test_busy_time_all_calls_span_several_bins():
+    # no call falls within a single bin
+    starts = np.array([0.5, 2.5, 4.2])
+    ends = np.array([1.5, 4.0, 7.9])
+    rows = np.array([0, 1, 0])
+    busy = busy_time(starts, ends, rows, 2, 0.0, 8.0, 8)
+    assert busy.dtype == np.float64
+    assert np.allclose(busy, brute_busy_time(starts, ends, rows, 2, 0.0, 8.0, 8))
+
+
+def test_busy_time_all_calls_within_one_bin():
+    starts = np.array([0.1, 3.2])
+    ends = np.array([0.4, 3.9])
+    rows = np.array([0, 0])
+    assert np.allclose(busy_time(starts, ends, rows, 1, 0.0, 4.0, 4),
+                       brute_busy_time(starts, ends, rows, 1, 0.0, 4.0, 4))
+
+
+def test_weighted_spread_keeps_the_weight_inside_the_range():
+    rng = np.random.RandomState(1)
+    starts, ends, rows = random_calls(rng, 300, 0.0, 10.0, 3.0)
+    weights = rng.uniform(1, 100, len(starts))
+    spread = spread_over_bins(starts, ends, rows, 3, 0.0, 20.0, 40, weights)
+    # every call is inside [0, 20), so all of its weight is spread
+    assert np.allclose(spread.sum(axis=1), np.bincount(rows, weights=weights, minlength=3))
+    # and in proportion to the overlap with each bin
+    expected = np.zeros((3, 40))
+    for start, end, row, weight in zip(starts, ends, rows, weights):
+        overlap = brute_busy_time([start], [end], [0], 1, 0.0, 20.0, 40)[0]
+        expected[row] += overlap / (end - start) * weight
+    assert np.allclose(spread, expected)
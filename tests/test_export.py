@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# encoding: utf-8
+import os
+import pytest
+from recorder_viz.synthetic_trace import SyntheticReader
+from recorder_viz.build_offset_intervals import build_offset_intervals
+
+pa = pytest.importorskip("pyarrow")
+from recorder_viz.export import export_trace
+
+
+def read_table(path, format):
+    if format == "parquet":
+        import pyarrow.parquet as pq
+        return pq.read_table(path)
+    return pa.ipc.open_file(pa.memory_map(path)).read_all()
+
+
+@pytest.mark.parametrize("format", ["parquet", "arrow"])
+@pytest.mark.parametrize("lazy", [False, True])
+def test_round_trip(tmpdir, format, lazy):
+    reader = SyntheticReader(3, 120, "n-1", 2, lazy=lazy)
+    output_dir = str(tmpdir)
+    export_trace(reader, output_dir, format, chunk_size=50, args=True)
+
+    functions = read_table(os.path.join(output_dir, "functions." + format), format).to_pydict()
+    assert functions["name"] == list(reader.funcs) + ["<user function>"]
+    files = read_table(os.path.join(output_dir, "files." + format), format)
+    assert files.schema.field("file_id").type == pa.int64()
+    assert files.to_pydict() == {"file_id": list(range(len(reader.files))), "filename": list(reader.files)}
+
+    expected = SyntheticReader(3, 120, "n-1", 2)
+    for rank in reader.ranks:
+        table = read_table(os.path.join(output_dir, "records", "rank=%d" %(rank), "part-0." + format), format)
+        assert table.schema.field("file_id").type == pa.int64()
+        records = table.to_pydict()
+        columns = expected.columns[rank]
+        for name in ("tstart", "tend", "func_id", "tid", "call_depth", "arg_count"):
+            assert records[name] == getattr(columns, name).tolist()
+        assert [reader.files[i] if i >= 0 else None for i in records["file_id"]] == \
+               [expected.files[i] if i >= 0 else None for i in columns.file_id.tolist()]
+        assert records["func"] == [expected.funcs[i] for i in columns.func_id.tolist()]
+        record = expected.records[rank][5]
+        assert records["args"][5] == [record.args[j].decode('utf-8') for j in range(record.arg_count)]
+
+    table = read_table(os.path.join(output_dir, "intervals", "part-0." + format), format)
+    assert table.schema.field("segments").type == pa.large_list(pa.int64())
+    exported = {}
+    for row in table.to_pylist():
+        exported.setdefault(reader.files[row["file_id"]], []).append(
+            [row["rank"], row["tstart"], row["tend"], row["offset"], row["count"], row["is_read"], row["segments"]])
+    intervals = build_offset_intervals(expected)
+    assert exported == dict([(filename, [list(interval[:6]) + [list(interval[6])] for interval in intervals[filename]])
+                             for filename in intervals if intervals[filename]])
+
+
+def test_unknown_format(tmpdir):
+    with pytest.raises(ValueError):
+        export_trace(SyntheticReader(1, 20), str(tmpdir), "csv")
@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+# encoding: utf-8
+import numpy as np
+from recorder_viz.synthetic_trace import SyntheticReader
+from recorder_viz.file_table import FileTable
+
+
+def test_intern_and_merge():
+    files = FileTable(["/a", "/b", "/a"])
+    assert list(files) == ["/a", "/b"]
+    assert files.intern("/c") == 2 and files.intern("/b") == 1
+    assert files.get("/b") == 1 and files.get("/missing") == -1
+    assert files[2] == "/c" and len(files) == 3
+
+    # rank-local IDs 0, 1 are "/d", "/a"; -1 is a record without a file
+    file_ids = files.merge(["/d", "/a"], np.array([1, -1, 0, 0, 1], dtype=np.int32))
+    assert file_ids.tolist() == [0, -1, 3, 3, 0]
+    assert files[3] == "/d"
+    assert files.merge([], np.array([-1, -1])).tolist() == [-1, -1]
+
+
+def filenames_of_records(reader):
+    names = []
+    for rank in reader.ranks:
+        columns = reader.columns[rank]
+        names.append([reader.files[file_id] if file_id >= 0 else None for file_id in columns.file_id.tolist()])
+    return names
+
+
+def test_file_ids_name_the_filename_argument():
+    reader = SyntheticReader(3, 60, "n-n", 2)
+    for rank, names in zip(reader.ranks, filenames_of_records(reader)):
+        for record, name in zip(reader.records[rank][:reader.counts[rank]], names):
+            func = reader.funcs[record.func_id]
+            expected = record.args[0].decode('utf-8') if func not in ("MPI_Init", "MPI_Finalize", "MPI_Barrier") else None
+            assert name == expected
+    assert len(reader.files) == 3 * 2
+
+
+def test_parallel_merge_matches_serial():
+    serial = SyntheticReader(6, 100, "n-n", 2)
+    parallel = SyntheticReader(6, 100, "n-n", 2, workers=3)
+    assert list(parallel.files) == list(serial.files)
+    for rank in serial.ranks:
+        assert parallel.columns[rank].file_id.tolist() == serial.columns[rank].file_id.tolist()
+    assert filenames_of_records(parallel) == filenames_of_records(serial)
+
+
+def test_lazy_reader_names_the_same_files():
+    eager = SyntheticReader(4, 100, "random", 3)
+    lazy = SyntheticReader(4, 100, "random", 3, lazy=True)
+    assert filenames_of_records(lazy) == filenames_of_records(eager)
+    assert sorted(lazy.files) == sorted(eager.files)
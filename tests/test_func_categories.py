@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+# encoding: utf-8
+import numpy as np
+from recorder_viz.synthetic_trace import SyntheticReader
+from recorder_viz.func_categories import FunctionCategories, func_category, READ, WRITE, MPI, USER, FILE_META
+
+
+FUNCS = ["MPI_File_read_at", "H5Dwrite", "ncmpi_put_vara", "read", "fread", "pwrite64", "fprintf",
+         "readlink", "readdir", "mkdir", "open64", "fdopen", "lseek64", "fsync", "close"]
+
+
+def test_category_table():
+    categories = FunctionCategories(FUNCS)
+    assert categories.flags_list == [func_category(func) for func in FUNCS] + [USER]
+    assert categories.flags_list[0] & (READ | MPI) == READ | MPI
+
+    expected = dict(zip(FUNCS, zip(categories.is_read.tolist(), categories.is_write.tolist(),
+                                   categories.is_file_meta.tolist(), categories.filename_arg.tolist())))
+    assert expected == {
+        "MPI_File_read_at": (False, False, False, -1),
+        "H5Dwrite":         (False, False, False, -1),
+        "ncmpi_put_vara":   (False, False, False, -1),
+        "read":             (True,  False, False, 0),
+        "fread":            (True,  False, False, 3),
+        "pwrite64":         (False, True,  False, 0),
+        "fprintf":          (False, True,  False, 0),
+        "readlink":         (False, False, False, -1),
+        "readdir":          (False, False, False, -1),
+        "mkdir":            (False, False, False, -1),
+        "open64":           (False, False, True,  0),
+        "fdopen":           (False, False, True,  0),
+        "lseek64":          (False, False, True,  0),
+        "fsync":            (False, False, True,  0),
+        "close":            (False, False, True,  0),
+    }
+
+
+def test_user_functions_map_to_the_last_entry():
+    categories = FunctionCategories(FUNCS)
+    func_ids = np.array([0, len(FUNCS) - 1, len(FUNCS), len(FUNCS) + 7])
+    assert categories.index(func_ids).tolist() == [0, len(FUNCS) - 1, len(FUNCS), len(FUNCS)]
+    assert categories.of(len(FUNCS) + 7) == USER
+    assert not categories.is_posix[categories.index(len(FUNCS) + 7)]
+
+
+def test_masks_match_function_names():
+    reader = SyntheticReader(2, 100, "n-n", 2)
+    categories = reader.categories
+    for func_id, func in enumerate(reader.funcs):
+        is_data = "MPI" not in func
+        assert categories.is_read[func_id] == (is_data and "read" in func)
+        assert categories.is_write[func_id] == (is_data and "write" in func)
+        assert categories.is_file_meta[func_id] == (func in ("open64", "close", "lseek"))
+        assert bool(categories.of(func_id) & FILE_META) == categories.is_file_meta[func_id]
@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+# encoding: utf-8
+import random, tracemalloc
+import numpy as np
+import pytest
+from recorder_viz.synthetic_trace import SyntheticReader, PATTERNS
+from recorder_viz.build_offset_intervals import build_offset_intervals, ignore_files, SegmentIndex
+from recorder_viz.build_offset_intervals import merge_records_by_time, ignore_category, MERGE_CHUNK_SIZE
+from recorder_viz.interval_arrays import FileIntervals, as_interval_arrays
+
+def as_lists(intervals):
+    return dict([(filename, [list(interval) for interval in intervals[filename]]) for filename in intervals])
+
+
+# The original replay, one Python list per record and filenames as keys,
+# kept as the reference the optimized versions must match
+def baseline_intervals(reader):
+    funcs, ranks = reader.funcs, reader.GM.total_ranks
+    closeBook, segmentBook, offsetBook, endOfFile, intervals = {}, {}, {}, {}, {}
+
+    records = []
+    for rank in range(ranks):
+        for i in range(reader.LMs[rank].total_records):
+            record = reader.records[rank][i]
+            if record.func_id >= len(funcs): continue
+            if not any([f in funcs[record.func_id] for f in ("MPI", "H5", "writev")]):
+                records.append((rank, record, record.args_to_strs()))
+    records = sorted(records, key=lambda x: x[1].tstart)
+
+    for rank in range(ranks):
+        for filename in reader.LMs[rank].filemap:
+            segmentBook[filename] = []
+            endOfFile[filename] = [0] * ranks
+            offsetBook[filename] = [0] * ranks
+
+    def create_new_segment(filename, rank):
+        segmentID = 1 + segmentBook[filename][-1][1] if segmentBook[filename] else 0
+        segmentBook[filename].append([rank, segmentID, False])
+
+    def latest_offset(filename, rank):
+        if filename in closeBook:
+            return max(endOfFile[filename][rank], closeBook[filename])
+        return endOfFile[filename][rank]
+
+    for rank, record, args in records:
+        func = funcs[record.func_id]
+        if "open" in func:
+            filename = args[0]
+            offsetBook[filename][rank] = latest_offset(filename, rank) if int(args[1]) == 2 else 0
+            create_new_segment(filename, rank)
+        elif "seek" in func:
+            filename, offset, whence = args[0], int(args[1]), int(args[2])
+            if whence == 0:
+                offsetBook[filename][rank] = offset
+            elif whence == 1:
+                offsetBook[filename][rank] += offset
+            elif whence == 2:
+                offsetBook[filename][rank] = latest_offset(filename, rank)
+        elif "close" in func or "sync" in func:
+            filename = args[0]
+            closeBook[filename] = endOfFile[filename][rank]
+            for segment in segmentBook[filename]:
+                if segment[0] == rank:
+                    segment[2] = True
+            visitedRanks, newSegments = set(), []
+            for segment in segmentBook[filename][::-1]:
+                if segment[0] in visitedRanks:
+                    continue
+                if segment[0] != rank and not segment[2]:
+                    newSegments.append([segment[0], 1+segment[1], False])
+                    visitedRanks.add(segment[0])
+            segmentBook[filename] += newSegments
+
+        filename, offset, count = "", -1, -1
+        if "pwrite" in func or "pread" in func:
+            filename, count, offset = args[0], int(args[2]), int(args[3])
+        elif "write" in func or "read" in func:
+            filename, count = args[0], int(args[2])
+            offset = offsetBook[filename][rank]
+            offsetBook[filename][rank] += count
+        if filename:
+            endOfFile[filename][rank] = max(endOfFile[filename][rank], offsetBook[filename][rank])
+
+        if not ignore_files(filename):
+            segments = [s[1] for s in segmentBook[filename][::-1] if s[0] == rank and not s[2]]
+            segments += [s[1] for s in segmentBook[filename] if s[0] != rank and not s[2]]
+            intervals.setdefault(filename, []).append([rank, record.tstart, record.tend, offset, count,
+                                                       "read" in func, segments])
+    return intervals
+
+
+def sorted_lists(intervals):
+    return dict([(filename, intervals[filename]) for filename in sorted(intervals)])
+
+
+@pytest.mark.parametrize("pattern", PATTERNS)
+def test_matches_baseline(pattern):
+    reader = SyntheticReader(4, 300, pattern, 2)
+    expected = baseline_intervals(reader)
+    assert sum([len(expected[filename]) for filename in expected]) > 0
+    assert sorted_lists(as_lists(build_offset_intervals(reader))) == sorted_lists(expected)
+
+
+@pytest.mark.parametrize("pattern", PATTERNS)
+def test_parallel_matches_baseline(pattern):
+    reader = SyntheticReader(6, 300, pattern, 3)
+    expected = sorted_lists(baseline_intervals(reader))
+    assert sorted_lists(as_lists(build_offset_intervals(reader, workers=3))) == expected
+    assert sorted_lists(as_lists(build_offset_intervals(reader, workers=2))) == expected
+
+
+def test_by_file_id_matches_filenames():
+    reader = SyntheticReader(4, 200, "n-n", 2)
+    by_name = as_lists(build_offset_intervals(reader))
+    by_id = as_lists(build_offset_intervals(reader, by_file_id=True))
+    assert dict([(reader.files[file_id], by_id[file_id]) for file_id in by_id]) == by_name
+
+
+# The list-based segment book of the original replay
+class SegmentList():
+    def __init__(self):
+        self.book = []
+
+    def create(self, rank):
+        self.book.append([rank, 1 + self.book[-1][1] if self.book else 0, False])
+
+    def close(self, rank):
+        for segment in self.book:
+            if segment[0] == rank:
+                segment[2] = True
+        visitedRanks, newSegments = set(), []
+        for segment in self.book[::-1]:
+            if segment[0] not in visitedRanks and segment[0] != rank and not segment[2]:
+                newSegments.append([segment[0], 1+segment[1], False])
+                visitedRanks.add(segment[0])
+        self.book += newSegments
+
+    def segments(self, rank):
+        return [s[1] for s in self.book[::-1] if s[0] == rank and not s[2]] + \
+               [s[1] for s in self.book if s[0] != rank and not s[2]]
+
+
+def test_segment_index_matches_list_book():
+    rng = random.Random(0)
+    index, book = SegmentIndex(), SegmentList()
+    for _ in range(2000):
+        rank = rng.randrange(6)
+        operation = rng.random()
+        if operation < 0.3:
+            index.create(rank, index.lastID + 1)
+            book.create(rank)
+        elif operation < 0.5:
+            index.close(rank)
+            book.close(rank)
+        assert index.segments(rank) == book.segments(rank)
+        assert index.lastID == (book.book[-1][1] if book.book else -1)
+
+
+@pytest.mark.parametrize("pattern", PATTERNS)
+def test_arrays_match_baseline(pattern):
+    reader = SyntheticReader(6, 300, pattern, 3)
+    expected = sorted_lists(baseline_intervals(reader))
+    for workers in (1, 2):
+        arrays = build_offset_intervals(reader, workers=workers, as_arrays=True)
+        assert all([isinstance(arrays[f], FileIntervals) for f in arrays])
+        assert sorted_lists(dict([(f, arrays[f].to_lists()) for f in arrays])) == expected
+
+
+def test_from_lists_round_trip():
+    intervals = as_lists(build_offset_intervals(SyntheticReader(4, 200, "random", 2)))
+    arrays = as_interval_arrays(intervals)
+    for filename in intervals:
+        assert arrays[filename].to_lists() == intervals[filename]
+        assert arrays[filename].take([2, 0])[1] == intervals[filename][0]
+
+
+def test_merge_memory_does_not_hold_every_record():
+    reader = SyntheticReader(8, 20000, "n-1", 1)
+    num_records = sum(reader.counts)
+    ignoredFuncs = np.array([ignore_category(c) for c in reader.categories.flags_list])
+    ignoredFuncs[-1] = True
+    tracemalloc.start()
+    try:
+        records = merge_records_by_time(reader, ignoredFuncs)
+        next(records)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    # NumPy arrays of about 24 bytes per record, plus one chunk of Python objects
+    # per rank; one Python int and float per record would take about 100 bytes
+    assert peak < 24 * num_records + len(reader.ranks) * MERGE_CHUNK_SIZE * 150
+
+
+@pytest.mark.parametrize("pattern", PATTERNS)
+def test_lazy_reader_matches_eager(pattern):
+    eager = build_offset_intervals(SyntheticReader(4, 200, pattern, 2))
+    lazy = build_offset_intervals(SyntheticReader(4, 200, pattern, 2, lazy=True))
+    assert list(lazy.keys()) == list(eager.keys())
+    assert as_lists(lazy) == as_lists(eager)
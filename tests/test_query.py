@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# encoding: utf-8
+import numpy as np
+import pytest
+from recorder_viz.synthetic_trace import SyntheticReader, PATTERNS
+from recorder_viz.query import RecordIndex
+
+
+def linear_select(columns, t0=None, t1=None, func_ids=None, file_ids=None):
+    keep = np.ones(len(columns), dtype=bool)
+    if t1 is not None:
+        keep &= columns.tstart < t1
+    if t0 is not None:
+        keep &= (columns.tend > t0) | (columns.tstart >= t0)
+    if func_ids is not None:
+        keep &= np.isin(columns.func_id, func_ids)
+    if file_ids is not None:
+        keep &= np.isin(columns.file_id, file_ids)
+    return np.flatnonzero(keep)
+
+
+def queries(columns, rng):
+    lo, hi = float(columns.tstart.min()), float(columns.tend.max())
+    for _ in range(20):
+        t0, t1 = sorted(rng.uniform(lo, hi, 2))
+        yield dict(t0=t0, t1=t1)
+        yield dict(t0=t0)
+        yield dict(t1=t1)
+        yield dict(t0=t0, t1=t1, func_ids=np.array([7, 8]))
+        yield dict(t0=t0, t1=t1, file_ids=np.array([0]))
+    yield dict(t0=lo, t1=lo)
+    yield dict(t0=hi + 1.0)
+    yield dict(func_ids=np.array([3, 4, 99]))
+    yield dict(file_ids=np.array([-1]))
+    yield dict(file_ids=np.array([1, 2]), func_ids=np.array([5, 6]))
+    yield dict()
+
+
+@pytest.mark.parametrize("pattern", PATTERNS)
+def test_select_matches_linear_filter(pattern):
+    reader = SyntheticReader(3, 300, pattern, 2)
+    rng = np.random.RandomState(0)
+    for rank in reader.ranks:
+        columns = reader.columns[rank]
+        for query in queries(columns, rng):
+            assert np.array_equal(reader.indexes[rank].select(**query), linear_select(columns, **query))
+
+
+def test_select_unsorted_records():
+    reader = SyntheticReader(1, 300, "random", 1)
+    rng = np.random.RandomState(1)
+    columns = reader.columns[0][rng.permutation(reader.counts[0])]
+    index = RecordIndex(columns)
+    assert index.order is not None
+    for query in queries(columns, rng):
+        assert np.array_equal(index.select(**query), linear_select(columns, **query))
+
+
+def test_query_by_name():
+    reader = SyntheticReader(3, 200, "n-n", 2)
+    filename = reader.files[int(reader.columns[1].file_id.max())]
+    t0 = float(reader.columns[1].tstart[50])
+    selected = reader.query_indices(t0=t0, ranks=[1, 2], funcs=["write", "read"], files=[filename, "/missing"])
+    assert list(selected.keys()) == [1, 2]
+    file_id, func_ids = reader.files.get(filename), [reader.funcs.index("write"), reader.funcs.index("read")]
+    for rank in selected:
+        assert np.array_equal(selected[rank], linear_select(reader.columns[rank], t0=t0, func_ids=func_ids,
+                                                            file_ids=[file_id]))
+    assert len(selected[1]) > 0 and len(selected[2]) == 0
+    assert len(reader.query(t0=t0, ranks=[1, 2], funcs=["write", "read"], files=[filename])) == \
+        sum([len(selected[rank]) for rank in selected])
+    with pytest.raises(ValueError):
+        reader.query_indices(funcs=["no_such_function"])
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# encoding: utf-8
+import pytest
+from recorder_viz.synthetic_trace import SyntheticReader
+from recorder_viz.reporter import generate_report, required_accumulators, REPORT_SECTIONS
+from recorder_viz.reporter import select_sections, required_data
+from recorder_viz.html_writer import HTMLWriter
+from recorder_viz.accumulators import registered_accumulators
+
+
+def test_only_the_accumulators_of_the_selected_sections(tmpdir):
+    reader = SyntheticReader(4, 200, "n-1", 2)
+    data = {}
+    generate_report(reader, str(tmpdir.join("report.html")), sections=["function_counts"], data=data)
+    assert list(data["stats"].keys()) == ["function_counts"]
+    assert "intervals" not in data
+
+    data = {}
+    generate_report(reader, str(tmpdir.join("report.html")), skip=["overall_io_activities"], data=data)
+    assert "activity_spans" not in data["stats"]
+    assert set(data["stats"].keys()) == set(["function_counts", "function_times", "metadata_times"])
+
+
+def test_required_accumulators():
+    assert required_accumulators([]) == []
+    assert required_accumulators(["io_statistics", "function_times"]) == ["function_times", "metadata_times"]
+    every = set([name for section in REPORT_SECTIONS for name in section[3]])
+    assert every <= set(registered_accumulators())
+
+
+def test_select_sections():
+    names = [section[0] for section in REPORT_SECTIONS]
+    assert select_sections() == names
+    # report order, whatever the order of the arguments
+    assert select_sections(["write_io_sizes", "record_counts"]) == ["record_counts", "write_io_sizes"]
+    assert select_sections(skip=["record_counts"]) == names[1:]
+    assert select_sections(["record_counts", "file_counts"], ["file_counts"]) == ["record_counts"]
+
+
+@pytest.mark.parametrize("sections,skip", [(["no_such_section"], None), (None, ["no_such_section"])])
+def test_unknown_section_exits(sections, skip, capsys):
+    with pytest.raises(SystemExit) as e:
+        select_sections(sections, skip)
+    assert e.value.code == 1
+    assert "Unknown report section no_such_section" in capsys.readouterr().out
+
+
+def test_required_data():
+    assert required_data(["record_counts", "file_counts"]) == []
+    assert required_data(["function_counts"]) == ["stats"]
+    assert required_data(["offset_vs_time", "io_statistics"]) == ["intervals", "stats"]
+
+
+def test_skipped_sections_are_left_out_of_the_html(tmpdir):
+    htmlWriter = HTMLWriter(str(tmpdir.join("report.html")))
+    htmlWriter.recordCount = "<p>record count</p>"
+    htmlWriter.functionCount = "<p>function count</p>"
+    htmlWriter.skip(["fileCount", "fileAccessModeTable", "functionLayers", "functionPatterns", "functionTimes",
+                     "overallIOActivities", "offsetVsRank", "offsetVsTime", "fileAccessPatterns"])
+    htmlWriter.write_html()
+    html = tmpdir.join("report.html").read()
+    assert "record count" in html and "function count" in html
+    assert "2. Function Statistics" in html and "2.3 Function count" in html
+    assert "1. File Statistics" not in html
+    assert "2.1 I/O Layers" not in html and "2.4 Seconds spent" not in html
+    assert "3. Access Patterns" not in html
+
+
+def test_report_of_the_selected_sections(tmpdir):
+    reader = SyntheticReader(4, 200, "n-n", 2)
+    output_path = str(tmpdir.join("report.html"))
+    data = {}
+    profile = generate_report(reader, output_path, sections=["record_counts", "io_statistics"], data=data)
+    stages = [stage.name for stage in profile.stages]
+    for name in ("function_counts", "offset_vs_time", "write_io_sizes"):
+        assert name not in stages
+    assert [stages.index(name) for name in ("intervals", "stats", "record_counts", "io_statistics")] == \
+        sorted([stages.index(name) for name in ("intervals", "stats", "record_counts", "io_statistics")])
+    html = open(output_path).read()
+    assert "0.1 Record Count" in html and "/synthetic/rank0.0.dat" in html
+    assert "2. Function Statistics" not in html and "3.1 Overall I/O activities" not in html
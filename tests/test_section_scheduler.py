@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+# encoding: utf-8
+import os
+from functools import partial
+from recorder_viz.synthetic_trace import SyntheticReader
+from recorder_viz.section_scheduler import run_sections
+from recorder_viz.html_writer import HTMLWriter
+from recorder_viz.profiling import Profile
+from recorder_viz.reporter import REPORT_SECTIONS, REPORT_DATA, required_data, required_accumulators
+
+
+def set_attribute(name, htmlWriter):
+    setattr(htmlWriter, name, "<p>%s</p>" %(name))
+    setattr(htmlWriter, "pid_" + name, os.getpid())
+
+
+def sections_setting(names):
+    return [(name, partial(set_attribute, name)) for name in names]
+
+
+def test_workers_send_back_the_attributes_they_set():
+    names = ["recordCount", "fileCount", "functionCount", "readIOSizes"]
+    serial, parallel = HTMLWriter(os.devnull), HTMLWriter(os.devnull)
+    serial_profile, parallel_profile = Profile(), Profile()
+    items = {"fileCount": (7, "records")}
+    run_sections(sections_setting(names), serial, 1, serial_profile, items)
+    run_sections(sections_setting(names), parallel, 3, parallel_profile, items)
+
+    for name in names:
+        assert getattr(parallel, name) == getattr(serial, name) == "<p>%s</p>" %(name)
+        assert getattr(serial, "pid_" + name) == os.getpid()
+        assert getattr(parallel, "pid_" + name) != os.getpid()      # ran in a worker
+    # untouched attributes keep their value
+    assert parallel.functionTimes == serial.functionTimes == ""
+    # one stage per section, in the section order
+    for profile in (serial_profile, parallel_profile):
+        assert [stage.name for stage in profile.stages] == names
+        assert [stage.items for stage in profile.stages] == [None, 7, None, None]
+
+
+def test_report_sections_match_serial():
+    reader = SyntheticReader(4, 200, "n-1", 2)
+    names = [section[0] for section in REPORT_SECTIONS]
+    data = {"reader": reader, "workers": 1, "binned": None, "resolution": (200, 100),
+            "accumulators": required_accumulators(names)}
+    for name in required_data(names):
+        data[name] = REPORT_DATA[name][1](data)
+
+    writers = []
+    for workers in (1, 4):
+        htmlWriter = HTMLWriter(os.devnull)
+        run_sections([(name, partial(function, data)) for name, attributes, needs, accumulators, function in REPORT_SECTIONS],
+                     htmlWriter, workers)
+        writers.append(htmlWriter)
+    serial, parallel = writers
+    for name, attributes, needs, accumulators, function in REPORT_SECTIONS:
+        # the first attribute of each section is always set
+        assert getattr(parallel, attributes[0]) != ""
+        assert getattr(serial, attributes[0]) != ""
+    # the table holds no plot IDs, it is the same whoever computed it
+    assert parallel.perFileIOStatistics == serial.perFileIOStatistics
@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+# encoding: utf-8
+import math
+import numpy as np
+import pytest
+from recorder_viz.synthetic_trace import SyntheticReader, PATTERNS
+from recorder_viz.build_offset_intervals import build_offset_intervals
+from recorder_viz.size_histograms import size_histogram, size_buckets
+
+
+def intervals_of(pattern):
+    reader = SyntheticReader(4, 200, pattern, 2, io_size=70000, seed=1)
+    return build_offset_intervals(reader)
+
+
+# (key, interval) of every interval
+def keyed(intervals, by):
+    for filename in intervals:
+        for interval in intervals[filename]:
+            yield {"file": filename, "rank": interval[0], None: "job"}[by], interval
+
+
+def test_size_buckets():
+    sizes = [0, 1, 2, 3, 4, 1023, 1024, 1025, 2**40]
+    assert size_buckets(sizes).tolist() == [size.bit_length() for size in sizes]
+
+
+@pytest.mark.parametrize("pattern", PATTERNS)
+@pytest.mark.parametrize("by", [None, "file", "rank"])
+@pytest.mark.parametrize("read", [True, False])
+def test_size_histogram_matches_brute_force(pattern, by, read):
+    intervals = intervals_of(pattern)
+    histogram = size_histogram(intervals, read=read, by=by, small=4096)
+
+    sizes = {}
+    for key, interval in keyed(intervals, by):
+        if interval[5] == read:
+            sizes.setdefault(key, []).append(interval[4])
+    for row, key in enumerate(histogram.keys):
+        key_sizes = sorted(sizes.get(key, []))
+        for bucket in range(histogram.counts.shape[1]):
+            in_bucket = [size for size in key_sizes if size.bit_length() == bucket]
+            assert histogram.counts[row, bucket] == len(in_bucket)
+            assert histogram.bytes[row, bucket] == sum(in_bucket)
+        for p in (50, 90, 99):
+            expected = key_sizes[max(int(math.ceil(p / 100.0 * len(key_sizes))) - 1, 0)] if key_sizes else 0
+            assert histogram.percentiles[p][row] == expected
+        total = sum(key_sizes)
+        small = sum([size for size in key_sizes if size < 4096])
+        assert np.isclose(histogram.small_share[row], small / float(total) if total else 0.0)
+    assert set(sizes.keys()) <= set(histogram.keys)
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# encoding: utf-8
+import os
+import numpy as np
+from recorder_viz.creader_wrapper import RecorderReader
+from recorder_viz.record_columns import RecordColumns
+from recorder_viz.synthetic_trace import SyntheticReader
+from recorder_viz.build_offset_intervals import build_offset_intervals
+
+
+# A synthetic trace cached in a trace directory holding placeholder files
+class CachedSyntheticReader(SyntheticReader):
+    def __init__(self, trace_dir, workers=1, cache=True):
+        self.num_ranks, self.records_per_rank, self.pattern = 4, 150, "n-1"
+        self.num_files, self.io_size, self.seed = 2, 4096, 0
+        self.decoded = 0
+        RecorderReader.__init__(self, trace_dir, workers=workers, cache=cache)
+
+    def decode_records(self, logs_dir):
+        self.decoded += 1
+        SyntheticReader.decode_records(self, logs_dir)
+
+
+def make_trace_dir(tmpdir):
+    for name in ("recorder.mt", "0.itf", "1.itf"):
+        tmpdir.join(name).write("trace")
+    return str(tmpdir)
+
+
+def assert_same_trace(reader, expected):
+    assert reader.funcs == expected.funcs
+    assert list(reader.counts) == list(expected.counts)
+    assert list(reader.files) == list(expected.files)
+    for rank in expected.ranks:
+        for name in RecordColumns.fields + ("file_id",):
+            assert np.array_equal(getattr(reader.columns[rank], name), getattr(expected.columns[rank], name))
+        assert reader.LMs[rank].filemap == expected.LMs[rank].filemap
+        for i in range(expected.counts[rank]):
+            assert reader.records[rank][i].args_to_strs() == expected.records[rank][i].args_to_strs()
+    assert build_offset_intervals(reader) == build_offset_intervals(expected)
+
+
+def test_round_trip(tmpdir):
+    trace_dir = make_trace_dir(tmpdir)
+    first = CachedSyntheticReader(trace_dir)
+    assert first.decoded == 1 and first.cache is None
+    second = CachedSyntheticReader(trace_dir)
+    assert second.decoded == 0 and second.cache is not None
+    assert_same_trace(second, first)
+
+
+def test_changed_size_invalidates(tmpdir):
+    trace_dir = make_trace_dir(tmpdir)
+    CachedSyntheticReader(trace_dir)
+    tmpdir.join("1.itf").write("a longer trace")
+    assert CachedSyntheticReader(trace_dir).decoded == 1
+    assert CachedSyntheticReader(trace_dir).decoded == 0
+
+
+def test_changed_mtime_invalidates(tmpdir):
+    trace_dir = make_trace_dir(tmpdir)
+    CachedSyntheticReader(trace_dir)
+    path = os.path.join(trace_dir, "0.itf")
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1000000000))
+    assert CachedSyntheticReader(trace_dir).decoded == 1
+    assert CachedSyntheticReader(trace_dir).decoded == 0
+
+
+def test_new_file_invalidates(tmpdir):
+    trace_dir = make_trace_dir(tmpdir)
+    CachedSyntheticReader(trace_dir)
+    tmpdir.join("2.itf").write("trace")
+    assert CachedSyntheticReader(trace_dir).decoded == 1
+
+
+def test_parallel_cache_write(tmpdir):
+    serial = CachedSyntheticReader(make_trace_dir(tmpdir.mkdir("serial")))
+    trace_dir = make_trace_dir(tmpdir.mkdir("parallel"))
+    parallel = CachedSyntheticReader(trace_dir, workers=2)
+    # the ranks are built once, by the pool, and not again after writing the cache
+    assert parallel.profile.by_name["columns+local_metadata"].calls == 1
+    assert "columns" not in parallel.profile.by_name
+    assert_same_trace(parallel, serial)
+    assert_same_trace(CachedSyntheticReader(trace_dir), serial)
+
+
+def test_unwritable_cache_continues_uncached(tmpdir, capsys):
+    trace_dir = make_trace_dir(tmpdir.mkdir("trace"))
+    tmpdir.join("not-a-directory").write("")
+    cache_dir = str(tmpdir.join("not-a-directory", "cache"))
+    reader = CachedSyntheticReader(trace_dir, cache=cache_dir)
+    assert "Could not write the trace cache" in capsys.readouterr().out
+    assert reader.decoded == 1 and reader.cache is None
+    assert not os.path.exists(cache_dir + ".tmp")
+    assert_same_trace(reader, CachedSyntheticReader(make_trace_dir(tmpdir.mkdir("expected"))))